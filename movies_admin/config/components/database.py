@@ -1,7 +1,7 @@
 import os
 from dotenv import load_dotenv
 
-load_dotenv() 
+load_dotenv()
 
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
@@ -19,4 +19,22 @@ DATABASES = {
             'options': '-c search_path=public,content'
         }
     }
-} 
\ No newline at end of file
+}
+
+# Соединения с базой: пул psycopg (DB_POOL=True) или постоянные соединения
+# на DB_CONN_MAX_AGE секунд. По умолчанию, как и раньше, новое соединение на каждый запрос.
+# https://docs.djangoproject.com/en/5.2/ref/databases/#connection-pool
+if os.environ.get('DB_POOL', False) == 'True':
+    # Пул общий для всех потоков процесса, соединение возвращается в него в конце запроса.
+    # С пулом CONN_MAX_AGE должен оставаться 0.
+    DATABASES['default']['OPTIONS']['pool'] = {
+        'min_size': int(os.environ.get('DB_POOL_MIN_SIZE', 2)),
+        'max_size': int(os.environ.get('DB_POOL_MAX_SIZE', 10)),
+        # Сколько секунд запрос ждёт свободного соединения, если заняты все max_size
+        'timeout': float(os.environ.get('DB_POOL_TIMEOUT', 10)),
+    }
+else:
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.environ.get('DB_CONN_MAX_AGE', 0))
+    # Проверять постоянное соединение перед первым запросом к базе в каждом запросе,
+    # чтобы после перезапуска Postgres не получить ошибку на уже закрытом соединении
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = os.environ.get('DB_CONN_HEALTH_CHECKS', 'True') == 'True'
@@ -1,38 +1,170 @@
+from django import forms
 from django.contrib import admin
+from django.contrib.admin.widgets import AutocompleteSelect
+from django.core.paginator import Paginator
+from django.forms.models import BaseInlineFormSet
+
 from .models import Genre, FilmWork, GenreFilmWork, Person, PersonFilmWork
+from .pagination import EstimatedCountPaginator, KeysetChangeList
+from .queries import genre_names, role_count
+from .search import PostgresSearchMixin
 
 
 @admin.register(Genre)
-class GenreAdmin(admin.ModelAdmin):
+class GenreAdmin(PostgresSearchMixin, admin.ModelAdmin):
     list_display = ('name', 'description',)  
     search_fields = ('name', 'description') 
+    substring_search_fields = ('name', 'description')
+
+
+class LargeTableAdmin(admin.ModelAdmin):
+    # Без точного COUNT(*) и без OFFSET на следующих страницах, см. movies/pagination.py
+    paginator = EstimatedCountPaginator
+    show_full_result_count = False
+
+    def get_changelist(self, request, **kwargs):
+        return KeysetChangeList
 
 
 @admin.register(Person)
-class PersonAdmin(admin.ModelAdmin):
+class PersonAdmin(PostgresSearchMixin, LargeTableAdmin):
     search_fields = ('full_name', 'id') 
+    substring_search_fields = ('full_name',)
+
+    ordering = ['full_name', 'id']
+
+
+class PreloadedAutocompleteSelect(AutocompleteSelect):
+    # Обычный AutocompleteSelect ищет выбранный объект отдельным запросом в каждой строке инлайна.
+    # Если объект уже загружен через select_related, подпись берётся из него
+    preloaded = None
+
+    def optgroups(self, name, value, attr=None):
+        obj = self.preloaded
+        if obj is None or [str(v) for v in value if v] != [str(obj.pk)]:
+            return super().optgroups(name, value, attr)
+        options = []
+        if not self.is_required:
+            options.append(self.create_option(name, '', '', False, 0))
+        options.append(self.create_option(name, obj.pk, self.choices.field.label_from_instance(obj),
+                                          {str(obj.pk)}, len(options)))
+        return [(None, options, 0)]
+
+
+class PaginatedInlineFormSet(BaseInlineFormSet):
+    # Номер страницы проставляет PaginatedTabularInline.get_formset из параметра запроса
+    per_page = 50
+    page_number = None
+
+    @classmethod
+    def page_param(cls):
+        return f'{cls.get_default_prefix()}-page'
+
+    def get_queryset(self):
+        if not hasattr(self, '_queryset'):
+            self.page = Paginator(super().get_queryset(), self.per_page).get_page(self.page_number)
+            self.page_range = self.page.paginator.get_elided_page_range(self.page.number)
+            self._queryset = self.page.object_list
+        return self._queryset
 
 
-class GenreFilmWorkInline(admin.TabularInline):
+class PreloadedRelationsForm(forms.ModelForm):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        for name, field in self.fields.items():
+            # В админке виджет обёрнут в RelatedFieldWidgetWrapper
+            widget = getattr(field.widget, 'widget', field.widget)
+            if isinstance(widget, PreloadedAutocompleteSelect) and self.instance.pk:
+                model_field = self.instance._meta.get_field(name)
+                if model_field.is_cached(self.instance):
+                    widget.preloaded = getattr(self.instance, name)
+
+
+class PaginatedTabularInline(admin.TabularInline):
+    """Инлайн для больших списков связей: постраничный вывод и связанные объекты одним запросом
+
+    Связанные объекты выбираются через autocomplete, а не через <select> по всей таблице,
+    и подгружаются select_related из related_fields, поэтому число запросов на странице
+    не зависит от количества связей у кинопроизведения.
+    """
+    formset = PaginatedInlineFormSet
+    form = PreloadedRelationsForm
+    template = 'admin/edit_inline/paginated_tabular.html'
+    extra = 1
+    per_page = 50
+    related_fields = ()
+    ordering_fields = ()
+
+    def get_queryset(self, request):
+        queryset = super().get_queryset(request).select_related(*self.related_fields)
+        return queryset.order_by(*self.ordering_fields, 'id')
+
+    def get_formset(self, request, obj=None, **kwargs):
+        formset = super().get_formset(request, obj, **kwargs)
+        formset.per_page = self.per_page
+        formset.page_number = request.GET.get(formset.page_param())
+        return formset
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        if db_field.name in self.autocomplete_fields:
+            kwargs['widget'] = PreloadedAutocompleteSelect(db_field, self.admin_site,
+                                                           using=kwargs.get('using'))
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+
+class GenreFilmWorkInline(PaginatedTabularInline):
     model = GenreFilmWork
+    autocomplete_fields = ('genre',)
+    related_fields = ('genre',)
+    ordering_fields = ('genre__name',)
 
 
-class PersonFilmWorkInline(admin.TabularInline):
+class PersonFilmWorkInline(PaginatedTabularInline):
     model = PersonFilmWork
+    autocomplete_fields = ('person',)
+    related_fields = ('person',)
+    ordering_fields = ('role', 'person__full_name')
 
 
 @admin.register(FilmWork)
-class FilmWorkkAdmin(admin.ModelAdmin):
+class FilmWorkkAdmin(PostgresSearchMixin, LargeTableAdmin):
     inlines = (GenreFilmWorkInline,PersonFilmWorkInline,) 
 
     # Отображение полей в списке
-    list_display = ('title', 'type', 'creation_date', 'rating',)
+    list_display = ('title', 'type', 'creation_date', 'rating',
+                    'genre_list', 'actors_count', 'directors_count', 'writers_count',)
 
     # Фильтрация в списке
     list_filter = ('type',) 
 
-    # Поиск по полям
+    # Поиск по полям: подстрока в названии, слова в названии и описании, id целиком
     search_fields = ('title', 'description', 'id')
+    substring_search_fields = ('title',)
+    fulltext_search_fields = ('title', 'description')
+
+    ordering = ["creation_date", "id"]
+
+    def get_queryset(self, request):
+        # Одним запросом со страницей списка, см. movies/queries.py. COUNT(*) для пагинации их отбрасывает
+        return super().get_queryset(request).annotate(
+            genre_names=genre_names(),
+            actors_count=role_count('actor'),
+            directors_count=role_count('director'),
+            writers_count=role_count('writer'),
+        )
+
+    @admin.display(description='Жанры')
+    def genre_list(self, obj):
+        return ', '.join(obj.genre_names)
+
+    @admin.display(description='Актёры')
+    def actors_count(self, obj):
+        return obj.actors_count
 
-    ordering = ["creation_date"]
+    @admin.display(description='Режиссёры')
+    def directors_count(self, obj):
+        return obj.directors_count
 
+    @admin.display(description='Сценаристы')
+    def writers_count(self, obj):
+        return obj.writers_count
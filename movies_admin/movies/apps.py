@@ -1,8 +1,29 @@
 from django.apps import AppConfig
+from django.db import connections
+from django.db.models.signals import pre_migrate
 from django.utils.translation import gettext_lazy as _
 
+# Схема, в которой лежат таблицы приложения, см. db_table в models.py
+SCHEMA = 'content'
+
+
+def create_schema(sender, using, **kwargs):
+    # В рабочей базе схему создаёт SQL из schema_design, а в чистой (например, тестовой) её ещё нет.
+    # Миграции уже применены в рабочих базах, поэтому схема создаётся здесь, а не в 0001_initial.
+    # Сначала проверка: CREATE SCHEMA IF NOT EXISTS требует права CREATE на базу, даже если схема есть
+    connection = connections[using]
+    if connection.vendor != 'postgresql':
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SELECT 1 FROM pg_namespace WHERE nspname = %s', [SCHEMA])
+        if cursor.fetchone() is None:
+            cursor.execute(f'CREATE SCHEMA {connection.ops.quote_name(SCHEMA)}')
+
 
 class MoviesConfig(AppConfig):
     verbose_name = _('movies')
     default_auto_field = "django.db.models.BigAutoField"
     name = "movies"
+
+    def ready(self):
+        pre_migrate.connect(create_schema, sender=self)
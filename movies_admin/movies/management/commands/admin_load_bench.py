@@ -0,0 +1,65 @@
+import statistics
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+
+
+class Command(BaseCommand):
+    help = ('Нагрузочный замер страницы админки: задержки p50/p99 при текущих настройках соединений '
+            '(DB_POOL, DB_CONN_MAX_AGE)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='/admin/movies/filmwork/')
+        parser.add_argument('--requests', type=int, default=500, help='Всего запросов')
+        parser.add_argument('--concurrency', type=int, default=4, help='Одновременных клиентов (потоков)')
+        parser.add_argument('--warmup', type=int, default=20, help='Запросов до начала замера')
+        parser.add_argument('--username', default='admin', help='Пользователь с доступом к админке')
+
+    def handle(self, *args, **options):
+        user = get_user_model().objects.filter(username=options['username'], is_staff=True).first()
+        if user is None:
+            raise CommandError(f"Нет пользователя {options['username']} с доступом к админке, "
+                               f"создайте его через createsuperuser")
+        db_settings = connection.settings_dict
+        mode = (f"пул {db_settings['OPTIONS']['pool']}" if db_settings['OPTIONS'].get('pool')
+                else f"CONN_MAX_AGE={db_settings['CONN_MAX_AGE']}")
+        # Запрос из Client проходит через request_started/request_finished, как и в gunicorn:
+        # в конце запроса соединение закрывается, возвращается в пул или остаётся открытым
+        clients = []
+        for _ in range(options['concurrency']):
+            # Адрес не из INTERNAL_IPS, чтобы при DEBUG не замерять отрисовку debug_toolbar
+            client = Client(REMOTE_ADDR='192.0.2.1')
+            client.force_login(user)
+            clients.append(client)
+
+        def run(client: Client, count: int) -> list:
+            timings = []
+            for _ in range(count):
+                started = time.perf_counter()
+                response = client.get(options['url'])
+                timings.append(time.perf_counter() - started)
+                if response.status_code != 200:
+                    raise CommandError(f"{options['url']} вернул {response.status_code}")
+            return timings
+
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            self._measure(clients, run, options, mode)
+
+    def _measure(self, clients: list, run, options: dict, mode: str):
+        run(clients[0], options['warmup'])
+        per_client = max(options['requests'] // len(clients), 1)
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=len(clients)) as executor:
+            timings = sorted(t for result in executor.map(run, clients, [per_client] * len(clients))
+                             for t in result)
+        elapsed = time.perf_counter() - started
+
+        quantiles = statistics.quantiles(timings, n=100)
+        self.stdout.write(f"{options['url']} ({mode}, {len(clients)} клиентов): {len(timings)} запросов "
+                          f"за {elapsed:.1f} с, {len(timings) / elapsed:.0f} запросов/с, "
+                          f"p50 {quantiles[49] * 1000:.1f} мс, p99 {quantiles[98] * 1000:.1f} мс")
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:45
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индексы на больших таблицах строятся без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ("movies", "0002_remove_personfilmwork_unique_film_work_person_and_more"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="filmwork",
+            index=models.Index(
+                fields=["creation_date", "id"], name="film_work_creation_date_id_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="person",
+            index=models.Index(
+                fields=["full_name", "id"], name="person_full_name_id_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,52 @@
+# Generated by Django 5.2.18 on 2026-10-18 21:47
+
+import django.contrib.postgres.indexes
+import django.contrib.postgres.search
+import django.db.models.functions.text
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations
+
+from movies.operations import AddTrigramIndexConcurrently, OptionalTrigramExtension
+
+
+class Migration(migrations.Migration):
+    # Индексы на больших таблицах строятся без блокировки записи
+    atomic = False
+
+    dependencies = [
+        ("movies", "0003_keyset_indexes"),
+    ]
+
+    # Расширение pg_trgm и индексы по нему создаются, только если в Postgres есть пакет contrib,
+    # иначе пропускаются, и миграция применяется без них (см. movies/operations.py)
+    operations = [
+        OptionalTrigramExtension(),
+        AddTrigramIndexConcurrently(
+            model_name="filmwork",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("title"), name="gin_trgm_ops"
+                ),
+                name="film_work_title_trgm_idx",
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="filmwork",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.search.SearchVector(
+                    "title", "description", config="simple"
+                ),
+                name="film_work_search_idx",
+            ),
+        ),
+        AddTrigramIndexConcurrently(
+            model_name="person",
+            index=django.contrib.postgres.indexes.GinIndex(
+                django.contrib.postgres.indexes.OpClass(
+                    django.db.models.functions.text.Upper("full_name"),
+                    name="gin_trgm_ops",
+                ),
+                name="person_full_name_trgm_idx",
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-18 22:10
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Индекс (modified, id) для постраничного вывода по ключу в API (movies/views.py).
+    # CREATE INDEX CONCURRENTLY не выполняется в транзакции
+    atomic = False
+
+    dependencies = [
+        ("movies", "0004_search_indexes"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="filmwork",
+            index=models.Index(
+                fields=["modified", "id"], name="film_work_modified_id_idx"
+            ),
+        ),
+    ]
@@ -1,8 +1,12 @@
 import uuid
+from django.contrib.postgres.indexes import GinIndex, OpClass
 from django.db import models
+from django.db.models.functions import Upper
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils.translation import gettext_lazy as _
 
+from .search import search_vector
+
 
 class TimeStampedMixin(models.Model):
     # auto_now_add автоматически выставит дату создания записи 
@@ -54,6 +58,10 @@ class Person(UUIDMixin, TimeStampedMixin):
         verbose_name_plural = 'Персонал'
         indexes = [
             models.Index(fields=['full_name'], name='person_full_name_idx'),
+            # Для постраничного вывода по ключу в админке (KeysetChangeList)
+            models.Index(fields=['full_name', 'id'], name='person_full_name_id_idx'),
+            # Поиск подстроки в админке: icontains превращается в UPPER(full_name) LIKE '%...%'
+            GinIndex(OpClass(Upper('full_name'), name='gin_trgm_ops'), name='person_full_name_trgm_idx'),
         ]
     
     def __str__(self):
@@ -82,6 +90,13 @@ class FilmWork(UUIDMixin, TimeStampedMixin):
         verbose_name_plural = 'Кинопроизведения'
         indexes = [
             models.Index(fields=['title'], name='film_work_title_idx'),
+            # Для постраничного вывода по ключу в админке (KeysetChangeList)
+            models.Index(fields=['creation_date', 'id'], name='film_work_creation_date_id_idx'),
+            # Поиск в админке, см. movies/search.py
+            GinIndex(OpClass(Upper('title'), name='gin_trgm_ops'), name='film_work_title_trgm_idx'),
+            GinIndex(search_vector('title', 'description'), name='film_work_search_idx'),
+            # Постраничный вывод по ключу в API, см. movies/views.py
+            models.Index(fields=['modified', 'id'], name='film_work_modified_id_idx'),
         ]
 
     def __str__(self):
@@ -0,0 +1,42 @@
+import logging
+
+from django.contrib.postgres.operations import AddIndexConcurrently, TrigramExtension
+
+logger = logging.getLogger(__name__)
+
+
+def _trigram_available(schema_editor) -> bool:
+    # pg_trgm входит в пакет contrib, которого на сервере может не быть
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_available_extensions WHERE name = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+def _trigram_installed(schema_editor) -> bool:
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_extension WHERE extname = 'pg_trgm'")
+        return cursor.fetchone() is not None
+
+
+class OptionalTrigramExtension(TrigramExtension):
+    """TrigramExtension, которая пропускается, если в Postgres нет расширения pg_trgm"""
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql' and not _trigram_available(schema_editor):
+            logger.warning('Расширение pg_trgm недоступно (нет пакета contrib), trigram-индексы не создаются')
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
+
+
+class AddTrigramIndexConcurrently(AddIndexConcurrently):
+    """AddIndexConcurrently для индекса с gin_trgm_ops, который пропускается без pg_trgm
+
+    Индекс всё равно попадает в состояние миграций, как и в models.py. Поиск
+    по подстроке без него работает, но просматривает всю таблицу.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if not _trigram_installed(schema_editor):
+            logger.warning(f'Индекс {self.index.name} не создан: нет расширения pg_trgm')
+            return
+        super().database_forwards(app_label, schema_editor, from_state, to_state)
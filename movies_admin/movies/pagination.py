@@ -0,0 +1,128 @@
+import json
+
+from django.contrib.admin.options import IncorrectLookupParameters
+from django.contrib.admin.views.main import ChangeList, PAGE_VAR
+from django.core.exceptions import ObjectDoesNotExist, ValidationError
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.functional import cached_property
+
+# Параметр запроса со следующей страницей: id последней записи предыдущей страницы
+KEYSET_VAR = 'after'
+
+
+def keyset_conditions(field: str, value, pk) -> list:
+    """Условия на строки после (value, pk) при сортировке по field, pk
+
+    NULL в field идут в конце, как в Postgres, поэтому условий два: сначала
+    строки с непустым field, затем строки с NULL. Выборки по ним читаются по
+    очереди, пока не наберётся страница. В первом условии field >= value даёт
+    диапазон по индексу (field, id), остальное отсекает уже выданные строки.
+    """
+    if value is None:
+        return [Q(**{f'{field}__isnull': True, 'pk__gt': pk})]
+    return [Q(Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}), **{f'{field}__gte': value}),
+            Q(**{f'{field}__isnull': True})]
+
+
+class EstimatedCountPaginator(Paginator):
+    """Paginator, который не считает COUNT(*) по большой таблице
+
+    Без фильтров и поиска количество берётся из статистики Postgres
+    (pg_class.reltuples), с фильтрами считается не дальше estimate_threshold
+    строк, а дальше берётся оценка планировщика из EXPLAIN. Точное число
+    получается только для таблиц и выборок меньше порога.
+    """
+    estimate_threshold = 10_000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = self._table_estimate(queryset)
+            if estimate >= self.estimate_threshold:
+                return estimate
+            return super().count
+        # COUNT по подзапросу с LIMIT читает не больше estimate_threshold + 1 строк.
+        # В подзапросе только pk, иначе в нём вычислялись бы аннотации списка
+        capped = queryset.values('pk')[:self.estimate_threshold + 1].count()
+        if capped <= self.estimate_threshold:
+            return capped
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        return max(capped, int(plan[0]['Plan']['Plan Rows']))
+
+    @staticmethod
+    def _table_estimate(queryset) -> int:
+        # reltuples = -1, если по таблице ещё не было ANALYZE
+        connection = connections[queryset.db]
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT reltuples::bigint FROM pg_class WHERE oid = %s::regclass',
+                           [connection.ops.quote_name(queryset.model._meta.db_table)])
+            row = cursor.fetchone()
+        return row[0] if row else -1
+
+
+class KeysetChangeList(ChangeList):
+    """ChangeList с переходом на следующую страницу по ключу вместо OFFSET
+
+    Работает, когда список отсортирован по ModelAdmin.ordering вида
+    [<поле>, 'id'] (по ним должен быть индекс): ссылка «Далее» передаёт id
+    последней записи, и следующая страница читается по индексу с этого места,
+    так что время не зависит от номера страницы (см. keyset_conditions).
+    Номера страниц по-прежнему открываются через OFFSET, при сортировке
+    по другой колонке список тоже работает как обычно.
+    """
+
+    def __init__(self, request, *args, **kwargs):
+        # Читается до super().__init__, который уже строит страницу в get_results
+        self.keyset_after = request.GET.get(KEYSET_VAR)
+        super().__init__(request, *args, **kwargs)
+        # Параметры ChangeList попадают в скрытые поля формы поиска
+        self.params.pop(KEYSET_VAR, None)
+
+    def get_filters_params(self, params=None):
+        # Параметр не фильтр по полю модели
+        lookup_params = super().get_filters_params(params)
+        lookup_params.pop(KEYSET_VAR, None)
+        return lookup_params
+
+    def get_query_string(self, new_params=None, remove=None):
+        # Ссылки сортировки, фильтров и страниц не несут позицию текущей страницы
+        return super().get_query_string({KEYSET_VAR: None, **(new_params or {})}, remove)
+
+    def get_results(self, request):
+        super().get_results(request)
+        self.next_page_url = None
+        self.first_page_url = self.get_query_string(remove=[PAGE_VAR])
+        field = self._keyset_field()
+        if field is None or (self.show_all and self.can_show_all):
+            return
+        if self.keyset_after is not None:
+            self.result_list = self._seek(field, self.keyset_after)
+        elif not self.multi_page:
+            return
+        # Страница читается один раз, шаблон списка возьмёт её из кэша queryset
+        rows = list(self.result_list)
+        if len(rows) == self.list_per_page:
+            self.next_page_url = self.get_query_string({KEYSET_VAR: rows[-1].pk}, remove=[PAGE_VAR])
+
+    def _keyset_field(self):
+        # ChangeList.get_ordering дописывает к ModelAdmin.ordering сортировку из get_queryset, это те же поля
+        ordering = list(dict.fromkeys(self.queryset.query.order_by))
+        if (len(ordering) == 2 and all(isinstance(part, str) for part in ordering)
+                and ordering[1] in ('id', 'pk') and not ordering[0].startswith('-')):
+            return ordering[0]
+        return None
+
+    def _seek(self, field: str, after: str) -> list:
+        try:
+            value = self.model._default_manager.filter(pk=after).values_list(field, flat=True).get()
+        except (ObjectDoesNotExist, ValidationError):
+            raise IncorrectLookupParameters
+        rows = []
+        for condition in keyset_conditions(field, value, after):
+            rows += self.queryset.filter(condition)[:self.list_per_page - len(rows)]
+            if len(rows) == self.list_per_page:
+                break
+        return rows
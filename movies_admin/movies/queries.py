@@ -0,0 +1,31 @@
+from django.contrib.postgres.expressions import ArraySubquery
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce, JSONObject
+
+from .models import Genre, Person, PersonFilmWork
+
+# Роли из person_film_work, по которым группируется состав фильма
+ROLES = ('actor', 'director', 'writer')
+
+# Выражения для аннотаций FilmWork: жанры и состав считаются подзапросами в том же
+# запросе, что и сами фильмы. Подзапросы в SELECT Postgres выполняет только для
+# возвращаемых строк, после LIMIT, и только по индексам связей фильма.
+
+
+def genre_names() -> ArraySubquery:
+    genres = Genre.objects.filter(genrefilmwork__film_work=OuterRef('pk')).order_by('name')
+    return ArraySubquery(genres.values('name'))
+
+
+def role_persons(role: str) -> ArraySubquery:
+    """Участники фильма с ролью role: список {"id", "full_name"}"""
+    persons = (Person.objects.filter(personfilmwork__film_work=OuterRef('pk'), personfilmwork__role=role)
+               .order_by('full_name'))
+    return ArraySubquery(persons.values(json=JSONObject(id='id', full_name='full_name')))
+
+
+def role_count(role: str) -> Coalesce:
+    # По индексу film_work_person_role_idx (film_work_id, person_id, role)
+    links = (PersonFilmWork.objects.filter(film_work=OuterRef('pk'), role=role)
+             .order_by().values('film_work').annotate(count=Count('*')).values('count'))
+    return Coalesce(Subquery(links, output_field=IntegerField()), 0)
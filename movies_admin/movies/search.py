@@ -0,0 +1,43 @@
+from uuid import UUID
+
+from django.contrib.postgres.search import SearchQuery, SearchVector
+from django.db.models import Q
+
+# Конфигурация полнотекстового поиска: без стемминга, одинаково для русских и английских названий.
+# Должна совпадать с выражением индекса film_work_search_idx в models.py
+SEARCH_CONFIG = 'simple'
+
+
+def search_vector(*fields: str) -> SearchVector:
+    return SearchVector(*fields, config=SEARCH_CONFIG)
+
+
+class PostgresSearchMixin:
+    """Поиск в админке по индексам Postgres вместо ILIKE по всем search_fields
+
+    - строка, похожая на UUID, ищется только по первичному ключу;
+    - substring_search_fields ищутся по вхождению подстроки (icontains), это
+      UPPER(поле) LIKE, который обслуживает GIN-индекс pg_trgm по UPPER(поле);
+    - fulltext_search_fields ищутся по словам через to_tsvector с GIN-индексом
+      по тому же выражению.
+    search_fields по-прежнему нужны, чтобы в списке было поле поиска.
+    """
+    substring_search_fields = ()
+    fulltext_search_fields = ()
+
+    def get_search_results(self, request, queryset, search_term):
+        term = search_term.strip()
+        if not term:
+            return super().get_search_results(request, queryset, search_term)
+        try:
+            return queryset.filter(pk=UUID(term)), False
+        except ValueError:
+            pass
+
+        condition = Q()
+        for field in self.substring_search_fields:
+            condition |= Q(**{f'{field}__icontains': term})
+        if self.fulltext_search_fields:
+            queryset = queryset.alias(search_vector=search_vector(*self.fulltext_search_fields))
+            condition |= Q(search_vector=SearchQuery(term, config=SEARCH_CONFIG, search_type='websearch'))
+        return queryset.filter(condition), False
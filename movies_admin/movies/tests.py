@@ -1,3 +1,205 @@
+import datetime
+import json
+import uuid
+from unittest import mock
+
+from django.contrib.auth import get_user_model
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .admin import PersonFilmWorkInline
+from .pagination import EstimatedCountPaginator
+from .models import FilmWork, Genre, GenreFilmWork, Person, PersonFilmWork
+
+
+class FilmWorkChangeViewTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.genres = Genre.objects.bulk_create([Genre(name=f'Жанр {i}') for i in range(5)])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def make_film(self, cast_size: int) -> FilmWork:
+        film = FilmWork.objects.create(title=f'Фильм на {cast_size}', creation_date=datetime.date(2020, 1, 1),
+                                       rating=5)
+        GenreFilmWork.objects.bulk_create([GenreFilmWork(film_work=film, genre=genre) for genre in self.genres])
+        persons = Person.objects.bulk_create([Person(full_name=f'Персона {i}') for i in range(cast_size)])
+        PersonFilmWork.objects.bulk_create([PersonFilmWork(film_work=film, person=person, role='actor')
+                                            for person in persons])
+        return film
+
+    def count_queries(self, film: FilmWork, query: str = '') -> int:
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('admin:movies_filmwork_change', args=[film.pk]) + query)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_depend_on_cast_size(self):
+        small = self.count_queries(self.make_film(3))
+        large = self.count_queries(self.make_film(PersonFilmWorkInline.per_page * 3))
+        self.assertEqual(small, large)
+
+    def test_cast_is_paginated(self):
+        film = self.make_film(PersonFilmWorkInline.per_page + 5)
+        response = self.client.get(reverse('admin:movies_filmwork_change', args=[film.pk]) +
+                                   '?personfilmwork_set-page=2')
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'name="personfilmwork_set-INITIAL_FORMS" value="5"')
+        self.assertContains(response, 'selected>Персона ', count=5)
+
+
+class FilmWorkChangeListTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        # По несколько фильмов на дату, чтобы следующая страница начиналась внутри одной даты
+        FilmWork.objects.bulk_create([
+            FilmWork(title=f'Фильм {i}', creation_date=datetime.date(2000 + i % 4, 1, 1), rating=5)
+            for i in range(25)
+        ])
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('admin:movies_filmwork_changelist')
+
+    def test_next_pages_follow_ordering(self):
+        seen = []
+        query = ''
+        with mock.patch('movies.admin.FilmWorkkAdmin.list_per_page', 7):
+            while query is not None:
+                response = self.client.get(self.url + query)
+                self.assertEqual(response.status_code, 200)
+                cl = response.context['cl']
+                seen += [film.pk for film in cl.result_list]
+                query = cl.next_page_url
+        self.assertEqual(seen, list(FilmWork.objects.order_by('creation_date', 'id').values_list('pk', flat=True)))
+
+    def test_key_is_kept_out_of_filters_and_links(self):
+        first = FilmWork.objects.order_by('creation_date', 'id').first()
+        with mock.patch('movies.admin.FilmWorkkAdmin.list_per_page', 7):
+            response = self.client.get(f'{self.url}?type=movie&after={first.pk}')
+        self.assertEqual(response.status_code, 200)
+        # Запрос остаётся как пришёл
+        self.assertEqual(response.wsgi_request.GET['after'], str(first.pk))
+        cl = response.context['cl']
+        self.assertNotIn('after', cl.params)
+        self.assertEqual(cl.get_query_string({'o': '1'}), '?o=1&type=movie')
+        self.assertIn('after=', cl.next_page_url)
+
+    def test_list_columns_do_not_query_per_row(self):
+        with CaptureQueriesContext(connection) as before:
+            self.client.get(self.url)
+        genre = Genre.objects.create(name='Драма')
+        person = Person.objects.create(full_name='Персона')
+        for film in FilmWork.objects.all():
+            GenreFilmWork.objects.create(film_work=film, genre=genre)
+            PersonFilmWork.objects.create(film_work=film, person=person, role='actor')
+            PersonFilmWork.objects.create(film_work=film, person=person, role='director')
+        with CaptureQueriesContext(connection) as after:
+            response = self.client.get(self.url)
+        self.assertEqual(len(before), len(after))
+        film = response.context['cl'].result_list[0]
+        self.assertEqual((film.genre_names, film.actors_count, film.directors_count, film.writers_count),
+                         (['Драма'], 1, 1, 0))
+
+    def test_unknown_key_is_rejected(self):
+        response = self.client.get(self.url + '?after=not-a-uuid')
+        self.assertRedirects(response, self.url + '?e=1')
+
+    def test_count_is_estimated_above_threshold(self):
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE "content"."film_work"')
+        with mock.patch.object(EstimatedCountPaginator, 'estimate_threshold', 10):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(self.url)
+                search = self.client.get(self.url + '?q=Фильм')
+        self.assertEqual(response.context['cl'].result_count, 25)
+        self.assertGreater(search.context['cl'].result_count, 10)
+        self.assertFalse([query for query in queries
+                          if query['sql'].startswith('SELECT COUNT(*)') and 'LIMIT' not in query['sql']])
+
+
+class FilmWorkSearchTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = get_user_model().objects.create_superuser('admin', 'admin@example.com', 'admin')
+        cls.space = FilmWork.objects.create(title='Звёздные войны', description='Космическая опера',
+                                            creation_date=datetime.date(1977, 5, 25), rating=9)
+        cls.trek = FilmWork.objects.create(title='Star Trek', description='',
+                                           creation_date=datetime.date(2009, 5, 7), rating=8)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+
+    def search(self, term: str) -> list:
+        response = self.client.get(reverse('admin:movies_filmwork_changelist'), {'q': term})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context['cl'].result_list)
+
+    def test_uuid_matches_only_primary_key(self):
+        self.assertEqual(self.search(str(self.trek.pk)), [self.trek])
+
+    def test_title_substring_and_description_words(self):
+        self.assertEqual(self.search('здные'), [self.space])
+        self.assertEqual(self.search('trek'), [self.trek])
+        self.assertEqual(self.search('опера'), [self.space])
+        # Описание ищется по словам, а не по подстроке
+        self.assertEqual(self.search('пера'), [])
+
+
+class FilmApiTests(TestCase):
+    @classmethod
+    def setUpTestData(cls):
+        genre = Genre.objects.create(name='Драма')
+        director = Person.objects.create(full_name='Режиссёр')
+        cls.films = FilmWork.objects.bulk_create([
+            FilmWork(title=f'Фильм {i}', creation_date=datetime.date(2020, 1, 1), rating=5) for i in range(7)
+        ])
+        for film in cls.films:
+            GenreFilmWork.objects.create(film_work=film, genre=genre)
+            PersonFilmWork.objects.create(film_work=film, person=director, role='director')
+
+    def get_page(self, url: str) -> dict:
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return json.loads(b''.join(response.streaming_content))
+
+    def test_pages_follow_modified_and_id(self):
+        ids = []
+        url = reverse('film-list') + '?limit=3'
+        while url:
+            with CaptureQueriesContext(connection) as queries:
+                page = self.get_page(url)
+            # Запрос на страницу плюс, на последней, запрос строк с пустым modified
+            self.assertLessEqual(len(queries), 2)
+            ids += [film['id'] for film in page['results']]
+            url = page['next']
+        expected = FilmWork.objects.order_by('modified', 'id').values_list('id', flat=True)
+        self.assertEqual(ids, [str(pk) for pk in expected])
+
+    async def test_asgi_response_is_streamed_asynchronously(self):
+        response = await self.async_client.get(reverse('film-list') + '?limit=5')
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        page = json.loads(b''.join([chunk async for chunk in response.streaming_content]))
+        expected = FilmWork.objects.order_by('modified', 'id').values_list('id', flat=True)[:5]
+        self.assertEqual([film['id'] for film in page['results']], [str(pk) async for pk in expected])
+        self.assertIsNotNone(page['next'])
+
+    def test_film_has_genres_and_persons_by_role(self):
+        film = self.films[0]
+        response = self.client.get(reverse('film-detail', args=[film.pk]))
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['genres'], ['Драма'])
+        self.assertEqual([person['full_name'] for person in data['directors']], ['Режиссёр'])
+        self.assertEqual(data['actors'], [])
 
-# Create your tests here.
+    def test_bad_requests(self):
+        self.assertEqual(self.client.get(reverse('film-list') + '?limit=0').status_code, 400)
+        self.assertEqual(self.client.get(reverse('film-list') + '?after=x,y').status_code, 400)
+        self.assertEqual(self.client.get(reverse('film-detail', args=[uuid.uuid4()])).status_code, 404)
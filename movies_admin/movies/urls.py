@@ -0,0 +1,8 @@
+from django.urls import path
+
+from .views import FilmDetailApi, FilmListApi
+
+urlpatterns = [
+    path('films/', FilmListApi.as_view(), name='film-list'),
+    path('films/<uuid:pk>/', FilmDetailApi.as_view(), name='film-detail'),
+]
@@ -1,3 +1,152 @@
-from django.shortcuts import render
+import json
+from typing import AsyncIterator, Iterator, List
+from uuid import UUID
 
-# Create your views here.
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q, QuerySet
+from django.http import JsonResponse, StreamingHttpResponse
+from django.utils.dateparse import parse_datetime
+from django.utils.http import urlencode
+from django.views import View
+
+from .models import FilmWork
+from .pagination import keyset_conditions
+from .queries import ROLES, genre_names, role_persons
+
+FILM_FIELDS = ('id', 'title', 'description', 'creation_date', 'rating', 'type', 'modified')
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+# Сколько фильмов читается из курсора и отправляется клиенту за раз
+STREAM_CHUNK = 100
+
+
+def films() -> QuerySet:
+    """Фильмы словарями с жанрами и составом по ролям (actors, directors, writers)
+
+    Всё одним запросом: связи собираются подзапросами ARRAY(...) по индексам
+    genre_film_work и person_film_work, без запроса на каждый фильм.
+    """
+    persons = {f'{role}s': role_persons(role) for role in ROLES}
+    return FilmWork.objects.values(*FILM_FIELDS).annotate(genres=genre_names(), **persons)
+
+
+def _parse_cursor(cursor: str) -> tuple:
+    """Курсор следующей страницы: "<modified в ISO 8601>,<id>", modified пустой для NULL"""
+    modified, _, pk = cursor.rpartition(',')
+    value = parse_datetime(modified) if modified else None
+    if modified and value is None:
+        raise ValueError(f'Некорректная дата в курсоре: {modified}')
+    return value, UUID(pk)
+
+
+class _JsonPage:
+    """Тело ответа списка по частям: строки пачками по STREAM_CHUNK и хвост со ссылкой next"""
+
+    def __init__(self, path: str, limit: int):
+        self.encoder = DjangoJSONEncoder()
+        self.path = path
+        self.limit = limit
+        self.chunk = []
+        self.sent = 0
+        self.last = None
+        self.has_next = False
+
+    def add(self, row: dict) -> bool:
+        """Добавить строку. False - страница уже набрана, а строка относится к следующей"""
+        if self.sent + len(self.chunk) == self.limit:
+            self.has_next = True
+            return False
+        self.chunk.append(self.encoder.encode(row))
+        self.last = row
+        return True
+
+    def flush(self, force: bool = False) -> str:
+        """Накопленные строки, когда их набралось STREAM_CHUNK (или сколько есть при force)"""
+        if not self.chunk or (len(self.chunk) < STREAM_CHUNK and not force):
+            return ''
+        data = (',' if self.sent else '') + ','.join(self.chunk)
+        self.sent += len(self.chunk)
+        self.chunk = []
+        return data
+
+    def end(self) -> str:
+        next_url = None
+        if self.has_next:
+            modified = self.last['modified'].isoformat() if self.last['modified'] else ''
+            cursor = f"{modified},{self.last['id']}"
+            next_url = f"{self.path}?{urlencode({'limit': self.limit, 'after': cursor})}"
+        return f'{self.flush(force=True)}], "next": {json.dumps(next_url)}}}'
+
+
+class FilmListApi(View):
+    """Список фильмов по modified, id с постраничным выводом по ключу
+
+    Параметры: limit (до MAX_PAGE_SIZE) и after - курсор из поля next
+    предыдущей страницы. Время ответа не зависит от того, насколько далеко
+    клиент продвинулся по списку. Ответ отдаётся потоком, по мере чтения из базы:
+    под WSGI обычным итератором, под ASGI асинхронным через aiterator(),
+    иначе Django собрал бы синхронный итератор в список целиком.
+    """
+
+    def get(self, request):
+        try:
+            limit = int(request.GET.get('limit', PAGE_SIZE))
+            if not 1 <= limit <= MAX_PAGE_SIZE:
+                raise ValueError(f'limit должен быть от 1 до {MAX_PAGE_SIZE}')
+            after = request.GET.get('after')
+            conditions = keyset_conditions('modified', *_parse_cursor(after)) if after else [Q()]
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
+
+        queryset = films().order_by('modified', 'id')
+        stream = self._astream if isinstance(request, ASGIRequest) else self._stream
+        return StreamingHttpResponse(stream(request, queryset, conditions, limit),
+                                     content_type='application/json')
+
+    @staticmethod
+    def _rows(queryset: QuerySet, conditions: List[Q], limit: int) -> Iterator[dict]:
+        for condition in conditions:
+            for row in queryset.filter(condition)[:limit].iterator(chunk_size=STREAM_CHUNK):
+                yield row
+                limit -= 1
+            if not limit:
+                return
+
+    @staticmethod
+    async def _arows(queryset: QuerySet, conditions: List[Q], limit: int) -> AsyncIterator[dict]:
+        for condition in conditions:
+            async for row in queryset.filter(condition)[:limit].aiterator(chunk_size=STREAM_CHUNK):
+                yield row
+                limit -= 1
+            if not limit:
+                return
+
+    def _stream(self, request, queryset: QuerySet, conditions: List[Q], limit: int) -> Iterator[str]:
+        page = _JsonPage(request.path, limit)
+        yield '{"results": ['
+        # Строка сверх limit читается только чтобы узнать, есть ли следующая страница
+        for row in self._rows(queryset, conditions, limit + 1):
+            if not page.add(row):
+                break
+            if data := page.flush():
+                yield data
+        yield page.end()
+
+    async def _astream(self, request, queryset: QuerySet, conditions: List[Q], limit: int) -> AsyncIterator[str]:
+        page = _JsonPage(request.path, limit)
+        yield '{"results": ['
+        async for row in self._arows(queryset, conditions, limit + 1):
+            if not page.add(row):
+                break
+            if data := page.flush():
+                yield data
+        yield page.end()
+
+
+class FilmDetailApi(View):
+    def get(self, request, pk: UUID):
+        film = films().filter(pk=pk).first()
+        if film is None:
+            return JsonResponse({'error': 'Фильм не найден'}, status=404)
+        return JsonResponse(film)
@@ -0,0 +1,246 @@
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from typing import List, Tuple
+
+from psycopg import AsyncClientCursor, AsyncCursor
+from psycopg.rows import dict_row, tuple_row
+
+try:
+    from psycopg_pool import AsyncConnectionPool
+except ImportError:
+    AsyncConnectionPool = None
+
+from load_from_sqlite import KeyRangeScan, SQLiteLoader
+from migration import ENTITY_TABLES, LINK_TABLES, CONFLICT_FIELDS, MigrationOptions, adjust_batch_size
+from parallel import PARTITIONED_TABLES, TASK_RETRIES
+from save_to_postgres import BasePostgresSaver
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class AsyncPostgresSaver(BasePostgresSaver):
+    """PostgresSaver на AsyncConnection: те же запросы, точки сохранения и учёт пакетов"""
+
+    async def commit(self, table_name: str):
+        """Коммит транзакции с учётом его времени в метриках таблицы table_name"""
+        started = time.perf_counter()
+        await self.conn.commit()
+        if self.metrics:
+            self.metrics.record_commit(table_name, time.perf_counter() - started)
+
+    async def save_rows(self, rows: List[tuple], table_name: str, column_names: List[str],
+                        conflict_col: str = 'id'):
+        """Сохранение готовых кортежей, см. PostgresSaver.save_rows"""
+        if not rows:
+            logger.info("Нет данных для сохранения")
+            return
+
+        self.last_batch_stats = None
+        try:
+            started = time.perf_counter()
+            rejected_before = self.rejected_rows
+            affected = await self._save_batch(rows, table_name, column_names, conflict_col)
+            self._batch_saved(rows, table_name, affected, time.perf_counter() - started,
+                              self.rejected_rows - rejected_before)
+
+        except Exception as e:
+            logger.error(f"Критическая ошибка при сохранении данных: {e}")
+            raise
+
+    async def _save_batch(self, batch: List[tuple], table_name: str,
+                          column_names: List[str], conflict_col: str):
+        try:
+            if self.isolate_failures:
+                affected = await self._save_isolated(batch, table_name, column_names, conflict_col)
+            else:
+                async with self._savepoint():
+                    affected = await self._write_batch(batch, table_name, column_names, conflict_col)
+                await self._clear_staging(table_name)
+            logger.debug(f"Сохранен пакет из {len(batch)} записей в {table_name}")
+            return affected
+
+        except Exception as e:
+            self._batch_failed(e)
+
+    async def _save_isolated(self, batch: List[tuple], table_name: str,
+                             column_names: List[str], conflict_col: str) -> int:
+        """Запись пакета с поиском битых строк делением пополам, см. PostgresSaver._save_isolated"""
+        try:
+            async with self._savepoint():
+                affected = await self._write_batch(batch, table_name, column_names, conflict_col)
+            await self._clear_staging(table_name)
+            return affected
+        except self.NOT_ISOLATED_ERRORS:
+            raise
+        except Exception as e:
+            if len(batch) == 1:
+                self._reject(table_name, column_names, batch[0], e)
+                return 0
+            middle = len(batch) // 2
+            return (await self._save_isolated(batch[:middle], table_name, column_names, conflict_col)
+                    + await self._save_isolated(batch[middle:], table_name, column_names, conflict_col))
+
+    @asynccontextmanager
+    async def _savepoint(self):
+        await self.cursor.execute('SAVEPOINT batch')
+        try:
+            yield
+        except BaseException:
+            if not self.conn.broken:
+                await self.cursor.execute('ROLLBACK TO SAVEPOINT batch')
+            raise
+        await self.cursor.execute('RELEASE SAVEPOINT batch')
+
+    async def _write_batch(self, batch: List[tuple], table_name: str,
+                           column_names: List[str], conflict_col: str) -> int:
+        if self.save_mode == 'copy':
+            return await self._copy_batch(batch, table_name, column_names, conflict_col)
+        if self.save_mode == 'pipeline':
+            return await self._pipeline_batch(batch, table_name, column_names, conflict_col)
+        return await self._insert_batch(batch, table_name, column_names, conflict_col)
+
+    async def _insert_batch(self, batch: List[tuple], table_name: str,
+                            column_names: List[str], conflict_col: str) -> int:
+        col_count = ', '.join(['%s'] * len(column_names))
+        bind_values = ','.join(self.cursor.mogrify(f"({col_count})", row) for row in batch)
+
+        await self.cursor.execute(self._insert_query(table_name, column_names, conflict_col, bind_values))
+        return self.cursor.rowcount
+
+    async def _pipeline_batch(self, batch: List[tuple], table_name: str,
+                              column_names: List[str], conflict_col: str) -> int:
+        cursor = AsyncCursor(self.conn)
+        async with self.conn.pipeline():
+            await cursor.executemany(self._prepared_query(table_name, column_names, conflict_col), batch)
+        return cursor.rowcount
+
+    async def _copy_batch(self, batch: List[tuple], table_name: str,
+                          column_names: List[str], conflict_col: str) -> int:
+        column_types = await self._get_column_types(table_name, column_names)
+        create, copy_query, insert = self._copy_queries(table_name, column_names, conflict_col)
+
+        await self.cursor.execute(create)
+        async with self.cursor.copy(copy_query) as copy:
+            copy.set_types(column_types)
+            for row in batch:
+                await copy.write_row(row)
+
+        await self.cursor.execute(insert)
+        return self.cursor.rowcount
+
+    async def _clear_staging(self, table_name: str):
+        if self.save_mode == 'copy':
+            await self.cursor.execute(f"TRUNCATE {self._staging_table(table_name)}")
+
+    async def _get_column_types(self, table_name: str, column_names: List[str]) -> List[str]:
+        key = (table_name, tuple(column_names))
+        if key not in self._column_types:
+            cursor = self.conn.cursor(row_factory=tuple_row)
+            await cursor.execute(self.COLUMN_TYPES_QUERY, (table_name,))
+            types = dict(await cursor.fetchall())
+            self._column_types[key] = [types[col] for col in column_names]
+        return self._column_types[key]
+
+
+async def _migrate_table_task(pool: 'AsyncConnectionPool', sqlite_path: str, options: MigrationOptions,
+                              scan: KeyRangeScan) -> int:
+    """Перенос диапазона ключа таблицы на одном соединении из пула
+
+    Следующий пакет читается из SQLite в потоке, пока текущий пишется
+    в Postgres, поэтому чтение и запись одной задачи тоже идут одновременно.
+    Пакеты коммитятся по одному, после коммита scan.last_key сдвигается,
+    как в migration.migrate_scan.
+
+    Returns:
+        Количество прочитанных из SQLite записей
+    """
+    table_name = scan.table_name
+    # Генератор пакетов продвигается из разных потоков asyncio.to_thread, но всегда по одному
+    with options.connect_sqlite(sqlite_path, check_same_thread=False) as sqlite_conn:
+        async with pool.connection() as pg_conn:
+            postgres_saver = options.make_async_saver(pg_conn)
+            sqlite_loader = options.make_loader(sqlite_conn, postgres_saver)
+            column_names = sqlite_loader.get_columns(table_name)
+            if options.batch_sizer:
+                sqlite_loader.set_batch_size(options.batch_sizer.get_size(table_name))
+
+            rows = 0
+            batches = scan.batches(sqlite_loader)
+            pending = asyncio.create_task(asyncio.to_thread(next, batches, None))
+            try:
+                while (item := await pending) is not None:
+                    last_key, batch = item
+                    pending = asyncio.create_task(asyncio.to_thread(next, batches, None))
+                    failed_batches = postgres_saver.failed_batches
+                    await postgres_saver.save_rows(batch, f'content.{table_name}', column_names,
+                                                   CONFLICT_FIELDS.get(table_name, 'id'))
+                    await postgres_saver.commit(table_name)
+                    if postgres_saver.failed_batches != failed_batches:
+                        raise RuntimeError(f'Пакет таблицы {table_name} после {scan.key} {scan.last_key} не сохранён')
+                    scan.last_key = last_key
+                    rows += len(batch)
+                    adjust_batch_size(sqlite_loader, postgres_saver, table_name, options.batch_sizer)
+            finally:
+                # Поток чтения нельзя прервать, дожидаемся его до закрытия соединения с SQLite
+                await asyncio.gather(pending, return_exceptions=True)
+    return rows
+
+
+async def _migrate_scan_with_retries(pool: 'AsyncConnectionPool', sqlite_path: str, options: MigrationOptions,
+                                     scan: KeyRangeScan) -> int:
+    """_migrate_table_task с перезапуском до TASK_RETRIES раз с первого незакоммиченного пакета"""
+    for attempt in range(TASK_RETRIES + 1):
+        try:
+            return await _migrate_table_task(pool, sqlite_path, options, scan)
+        except Exception as e:
+            if attempt >= TASK_RETRIES:
+                raise
+            logger.warning(f"Задача по таблице {scan.table_name} ({scan.key} {scan.low}-{scan.high}) упала: "
+                           f"{e}, перезапуск после {scan.key} {scan.last_key}")
+
+
+async def load_async(sqlite_path: str, dsl: dict, writers: int = 4, options: MigrationOptions = None):
+    """Перенос на asyncio: несколько таблиц и частей таблиц пишутся одновременно
+
+    Порядок и запросы те же, что у load_parallel: сначала film_work, genre
+    и person, затем таблицы связей, person_film_work делится по диапазонам
+    rowid. Вместо процессов задачи - корутины на общем пуле из writers
+    соединений, чтение из SQLite уходит в потоки через asyncio.to_thread.
+    Упавшая задача перезапускается, как в load_parallel, и продолжает
+    с первого незакоммиченного пакета.
+    """
+    if AsyncConnectionPool is None:
+        raise RuntimeError("Для асинхронного переноса нужен пакет psycopg_pool (pip install psycopg-pool)")
+    options = options or MigrationOptions()
+    with options.connect_sqlite(sqlite_path) as sqlite_conn:
+        planner = SQLiteLoader(sqlite_conn)
+        tasks = {table_name: planner.plan_scans(table_name, writers if table_name in PARTITIONED_TABLES else 1)
+                 for table_name in ENTITY_TABLES + LINK_TABLES}
+
+    async def configure(pg_conn):
+        # Отдельным коммитом, как в MigrationOptions.make_saver
+        await pg_conn.execute('SET synchronous_commit = off')
+        await pg_conn.commit()
+
+    pool = AsyncConnectionPool(kwargs={**dsl, 'row_factory': dict_row, 'cursor_factory': AsyncClientCursor},
+                               min_size=writers, max_size=writers, open=False,
+                               configure=None if options.synchronous_commit else configure)
+    async with pool:
+        for stage in (ENTITY_TABLES, LINK_TABLES):
+            scans = [scan for table_name in stage for scan in tasks[table_name]]
+            # Если задача упала окончательно, TaskGroup отменит остальные и дождётся их до закрытия пула
+            try:
+                async with asyncio.TaskGroup() as group:
+                    jobs = [group.create_task(_migrate_scan_with_retries(pool, sqlite_path, options, scan))
+                            for scan in scans]
+            except ExceptionGroup as e:
+                for error in e.exceptions[1:]:
+                    logger.error(f"Ошибка переноса: {error}")
+                raise e.exceptions[0]
+            for scan, job in zip(scans, jobs):
+                logger.info(f"Задача по таблице {scan.table_name} завершена, прочитано {job.result()} записей")
+
+    logger.info('Данные из sqlite загружены в postgres')
@@ -0,0 +1,75 @@
+import logging
+import threading
+from dataclasses import dataclass
+from typing import Dict
+
+from locks import PicklableLock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(frozen=True, slots=True)
+class BatchStats:
+    """Замеры по одному сохранённому пакету"""
+    rows: int
+    seconds: float
+    nbytes: int
+
+
+class AdaptiveBatchSizer(PicklableLock):
+    """Подбор размера пакета для каждой таблицы по задержке записи и объёму данных
+
+    После каждого пакета по сглаженным затратам на строку считается размер,
+    при котором запись пакета укладывается в target_latency секунд, а сам
+    пакет - в max_batch_bytes байт. За один шаг размер меняется не более чем
+    вдвое и всегда остается в пределах [min_size, max_size].
+    """
+
+    # Вес нового замера в скользящем среднем
+    SMOOTHING = 0.3
+
+    def __init__(self, initial_size: int = 100, min_size: int = 10, max_size: int = 50_000,
+                 target_latency: float = 0.25, max_batch_bytes: int = 64 * 2 ** 20):
+        self.initial_size = initial_size
+        self.min_size = min_size
+        self.max_size = max_size
+        self.target_latency = target_latency
+        self.max_batch_bytes = max_batch_bytes
+        self._sizes: Dict[str, int] = {}
+        self._row_seconds: Dict[str, float] = {}
+        self._row_bytes: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def get_size(self, table_name: str) -> int:
+        """Текущий размер пакета для таблицы"""
+        return self._sizes.get(table_name, self.initial_size)
+
+    def set_size(self, table_name: str, size: int):
+        """Задать размер пакета для таблицы, например подобранный в другом процессе"""
+        self._sizes[table_name] = size
+
+    def update(self, table_name: str, stats: BatchStats) -> int:
+        """Учесть замеры очередного пакета и вернуть размер следующего"""
+        if not stats.rows:
+            return self.get_size(table_name)
+        with self._lock:
+            row_seconds = self._smooth(self._row_seconds, table_name, stats.seconds / stats.rows)
+            row_bytes = self._smooth(self._row_bytes, table_name, stats.nbytes / stats.rows)
+            desired = min(self.target_latency / max(row_seconds, 1e-9),
+                          self.max_batch_bytes / max(row_bytes, 1.0))
+            size = self.get_size(table_name)
+            size = int(min(max(desired, size / 2), size * 2))
+            size = min(max(size, self.min_size), self.max_size)
+            self._sizes[table_name] = size
+        logger.debug(f"Размер пакета для {table_name}: {size}")
+        return size
+
+    def report(self) -> Dict[str, int]:
+        """Размеры пакетов, на которых остановился подбор, по таблицам"""
+        return dict(self._sizes)
+
+    def _smooth(self, averages: Dict[str, float], table_name: str, value: float) -> float:
+        previous = averages.get(table_name)
+        averages[table_name] = value if previous is None else previous + self.SMOOTHING * (value - previous)
+        return averages[table_name]
@@ -0,0 +1,65 @@
+"""Микробенчмарк разбора строк: dataclass из models.py против RowCodec
+
+Запуск из каталога sqlite_to_postgres:
+    python -m benchmarks.codec_bench [--rows N]
+"""
+import argparse
+import sqlite3
+import time
+import uuid
+from operator import attrgetter
+
+from load_from_sqlite import SQLiteLoader
+from row_codecs import RowCodec
+
+TIMESTAMP = '2021-06-16 20:14:09.221838+00'
+
+
+def _make_source(rows: int) -> sqlite3.Connection:
+    conn = sqlite3.connect(':memory:')
+    conn.executescript("""
+        CREATE TABLE film_work (id TEXT, title TEXT, description TEXT, creation_date DATE, rating FLOAT,
+                                type TEXT, created_at TEXT, updated_at TEXT);
+        CREATE TABLE person_film_work (id TEXT, film_work_id TEXT, person_id TEXT, role TEXT, created_at TEXT);
+    """)
+    conn.executemany('INSERT INTO film_work VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                     ((str(uuid.uuid4()), f'Film {i}', 'Description ' * 10, '2020-01-01', 8.5, 'movie',
+                       TIMESTAMP, TIMESTAMP) for i in range(rows)))
+    conn.executemany('INSERT INTO person_film_work VALUES (?, ?, ?, ?, ?)',
+                     ((str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4()), 'actor', TIMESTAMP)
+                      for _ in range(rows)))
+    return conn
+
+
+def _dataclass_path(loader: SQLiteLoader, table_name: str, batch: list) -> list:
+    """То, что делал load_data + save_data: dict -> dataclass -> кортеж"""
+    object_class = loader.table_class_map[table_name]
+    getter = attrgetter(*loader.get_columns(table_name))
+    return [getter(object_class(**dict(row))) for row in batch]
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--rows', type=int, default=200_000)
+    args = arg_parser.parse_args()
+
+    loader = SQLiteLoader(_make_source(args.rows))
+    for table_name in ('film_work', 'person_film_work'):
+        loader.set_batch_size(args.rows)
+        batch = next(loader._iter_batches(table_name))
+
+        variants = {
+            'dataclass': lambda: _dataclass_path(loader, table_name, batch),
+            'codec (UUID)': lambda: RowCodec(loader.table_class_map[table_name]).decode_batch(batch),
+            'codec (uuid как текст)': lambda: RowCodec(loader.table_class_map[table_name],
+                                                      uuid_as_text=True).decode_batch(batch),
+        }
+        for name, run in variants.items():
+            started = time.perf_counter()
+            run()
+            elapsed = time.perf_counter() - started
+            print(f'{table_name:<17} {name:<24} {args.rows / elapsed:>12,.0f} строк/с')
+
+
+if __name__ == '__main__':
+    main()
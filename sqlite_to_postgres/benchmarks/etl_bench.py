@@ -0,0 +1,181 @@
+"""Бенчмарк полного переноса load_from_sqlite_to_postgres на синтетических базах
+
+Для каждого масштаба (строк в таблицах связей) база генерируется
+benchmarks.generate_sqlite (и переиспользуется из --data-dir), после чего
+перенос запускается в отдельном процессе, чтобы пик памяти (max RSS) не
+копился между запусками. По каждой таблице записываются строки в секунду,
+процессорное время и, с --trace-memory, пик памяти Python по tracemalloc
+(tracemalloc заметно замедляет перенос, поэтому по умолчанию выключен).
+
+Нужен отдельный Postgres со схемой content из schema_design, параметры
+подключения берутся из тех же переменных окружения, что и в main.py.
+Таблицы перед каждым запуском очищаются, поэтому без --truncate бенчмарк
+работает только с пустыми таблицами.
+
+С несколькими --save-mode каждый масштаб переносится каждым способом
+записи, в конце выводится сравнение скорости способов.
+
+С --baseline результаты сравниваются с сохранённым ранее --output, и
+если скорость переноса упала больше чем на --tolerance, код возврата 1.
+
+Запуск из каталога sqlite_to_postgres:
+    python -m benchmarks.etl_bench [--scales 10k 100k 1M 10M] [--save-mode {insert,copy,pipeline} ...] [--truncate]
+        [--trace-memory] [--output FILE] [--baseline FILE [--tolerance 0.2]]
+"""
+import argparse
+import json
+import logging
+import os
+import resource
+import sqlite3
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+
+from psycopg.rows import tuple_row
+
+from benchmarks.generate_sqlite import generate
+from main import load_from_sqlite_to_postgres
+from metrics import MigrationMetrics
+from migration import TABLES, MigrationOptions, connect_postgres
+from save_to_postgres import PostgresSaver
+
+SUFFIXES = {'k': 10 ** 3, 'm': 10 ** 6}
+
+
+def _parse_scale(value: str) -> int:
+    suffix = value[-1].lower()
+    if suffix in SUFFIXES:
+        return int(float(value[:-1]) * SUFFIXES[suffix])
+    return int(value)
+
+
+def _dsl() -> dict:
+    return {'dbname': os.environ.get('DB_NAME'),
+            'user': os.environ.get('DB_USER'),
+            'password': os.environ.get('DB_PASSWORD'),
+            'host': os.environ.get('DB_HOST', '127.0.0.1'),
+            'port': os.environ.get('DB_PORT', 5432),
+            'options': '-c client_encoding=UTF8'}
+
+
+def _prepare_target(dsl: dict, truncate: bool):
+    """Очистить таблицы content или убедиться, что они пусты"""
+    tables = ', '.join(f'content.{table_name}' for table_name in TABLES)
+    with connect_postgres(dsl) as pg_conn:
+        if truncate:
+            pg_conn.execute(f'TRUNCATE {tables}')
+            return
+        cursor = pg_conn.cursor(row_factory=tuple_row)
+        for table_name in TABLES:
+            if cursor.execute(f'SELECT EXISTS (SELECT 1 FROM content.{table_name})').fetchone()[0]:
+                sys.exit(f'Таблица content.{table_name} не пуста, запустите бенчмарк с --truncate')
+
+
+def _run_once(sqlite_path: str, dsl: dict, save_mode: str, trace_memory: bool) -> dict:
+    """Один перенос в отдельном процессе, возвращает отчёт MigrationMetrics"""
+    logging.getLogger().setLevel(logging.WARNING)
+    if trace_memory:
+        tracemalloc.start()
+    options = MigrationOptions(save_mode, metrics=MigrationMetrics(), log_batches=False)
+    started, cpu_started = time.perf_counter(), time.process_time()
+    with sqlite3.connect(sqlite_path) as sqlite_conn, connect_postgres(dsl) as pg_conn:
+        load_from_sqlite_to_postgres(sqlite_conn, pg_conn, options)
+    report = options.metrics.report()
+    report['total'].update({
+        'wall_seconds': round(time.perf_counter() - started, 3),
+        'process_cpu_seconds': round(time.process_time() - cpu_started, 3),
+        # ru_maxrss в Linux в килобайтах
+        'max_rss_bytes': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024,
+    })
+    return report
+
+
+def _print_report(link_rows: int, save_mode: str, report: dict):
+    total = report['total']
+    print(f"\n{link_rows} строк связей, {save_mode}: {total['rows_read']} строк за {total['wall_seconds']} с, "
+          f"{total['rows_per_second']} строк/с, CPU {total['process_cpu_seconds']} с, "
+          f"max RSS {total['max_rss_bytes'] / 2 ** 20:.1f} МиБ")
+    print(f"{'таблица':<18}{'строк':>10}{'строк/с':>12}{'CPU, с':>10}{'пик, МиБ':>10}")
+    for table_name, table in report['tables'].items():
+        peak = table['peak_memory_bytes']
+        peak = f'{peak / 2 ** 20:.1f}' if peak is not None else '-'
+        print(f"{table_name:<18}{table['rows_read']:>10}{table['rows_per_second'] or 0:>12.0f}"
+              f"{table['time']['cpu']:>10.2f}{peak:>10}")
+
+
+def _check_baseline(results: dict, baseline_path: str, tolerance: float) -> bool:
+    """Сравнить скорость переноса с базовой, True если регрессий нет"""
+    with open(baseline_path, encoding='utf-8') as f:
+        baseline = json.load(f)
+    ok = True
+    for scale, reports in results.items():
+        for save_mode, report in reports.items():
+            if save_mode not in baseline.get(scale, {}):
+                continue
+            expected = baseline[scale][save_mode]['total']['rows_per_second']
+            actual = report['total']['rows_per_second']
+            if expected and actual < expected * (1 - tolerance):
+                print(f'Регрессия на {scale} строк связей ({save_mode}): {actual} строк/с '
+                      f'против {expected} в {baseline_path}')
+                ok = False
+    return ok
+
+
+def _print_comparison(results: dict, save_modes: list):
+    """Скорость переноса каждым способом записи относительно первого из save_modes"""
+    print(f"\n{'строк связей':<14}" + ''.join(f'{save_mode:>20}' for save_mode in save_modes))
+    for scale, reports in results.items():
+        base = reports[save_modes[0]]['total']['wall_seconds']
+        cells = [f"{reports[save_mode]['total']['wall_seconds']:.1f} с (x{base / reports[save_mode]['total']['wall_seconds']:.2f})"
+                 for save_mode in save_modes]
+        print(f'{scale:<14}' + ''.join(f'{cell:>20}' for cell in cells))
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--scales', nargs='+', default=['10k', '100k'],
+                            help='Строк в таблицах связей для каждого запуска, например 10k 1M')
+    arg_parser.add_argument('--save-mode', nargs='+', choices=PostgresSaver.SAVE_MODES, default=['copy'],
+                            help='Способы записи пакетов; несколько способов сравниваются между собой')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    arg_parser.add_argument('--data-dir', default=tempfile.gettempdir(),
+                            help='Каталог для сгенерированных баз SQLite')
+    arg_parser.add_argument('--truncate', action='store_true',
+                            help='Очищать таблицы content перед каждым запуском')
+    arg_parser.add_argument('--trace-memory', action='store_true',
+                            help='Измерять пик памяти по таблицам через tracemalloc')
+    arg_parser.add_argument('--output', help='Сохранить результаты в JSON')
+    arg_parser.add_argument('--baseline', help='JSON с прошлыми результатами для проверки регрессий')
+    arg_parser.add_argument('--tolerance', type=float, default=0.2,
+                            help='Допустимое падение скорости относительно --baseline (доля)')
+    args = arg_parser.parse_args()
+
+    dsl = _dsl()
+    results = {}
+    for link_rows in map(_parse_scale, args.scales):
+        sqlite_path = os.path.join(args.data_dir, f'movies_{link_rows}_{args.seed}.sqlite')
+        if not os.path.exists(sqlite_path):
+            generate(sqlite_path, link_rows, args.seed)
+        results[str(link_rows)] = {}
+        for save_mode in args.save_mode:
+            _prepare_target(dsl, args.truncate)
+            with ProcessPoolExecutor(max_workers=1) as executor:
+                report = executor.submit(_run_once, sqlite_path, dsl, save_mode, args.trace_memory).result()
+            results[str(link_rows)][save_mode] = report
+            _print_report(link_rows, save_mode, report)
+
+    if len(args.save_mode) > 1:
+        _print_comparison(results, args.save_mode)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, ensure_ascii=False, indent=2)
+    if args.baseline and not _check_baseline(results, args.baseline, args.tolerance):
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
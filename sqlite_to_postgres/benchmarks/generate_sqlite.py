@@ -0,0 +1,134 @@
+"""Генератор синтетической базы SQLite со схемой из пяти таблиц для бенчмарков
+
+Масштаб задаётся количеством строк в таблицах связей: на каждый фильм
+приходится 2 жанра и 5 персон, поэтому film_work содержит около 1/7 от
+этого числа строк, person - столько же, сколько фильмов. Данные зависят
+только от --seed, так что одинаковые параметры дают одинаковую базу.
+Строки генерируются и вставляются потоком, память не растёт с масштабом.
+
+Запуск из каталога sqlite_to_postgres:
+    python -m benchmarks.generate_sqlite PATH [--link-rows N] [--seed N]
+"""
+import argparse
+import hashlib
+import math
+import os
+import random
+import sqlite3
+import uuid
+from datetime import datetime, timedelta, timezone
+from typing import Iterator
+
+SCHEMA = """
+    CREATE TABLE film_work (id TEXT PRIMARY KEY, title TEXT NOT NULL, description TEXT, creation_date DATE,
+                            file_path TEXT, rating FLOAT, type TEXT not null,
+                            created_at timestamp with time zone, updated_at timestamp with time zone);
+    CREATE TABLE genre (id TEXT PRIMARY KEY, name TEXT NOT NULL, description TEXT,
+                        created_at timestamp with time zone, updated_at timestamp with time zone);
+    CREATE TABLE person (id TEXT PRIMARY KEY, full_name TEXT NOT NULL,
+                         created_at timestamp with time zone, updated_at timestamp with time zone);
+    CREATE TABLE genre_film_work (id TEXT PRIMARY KEY, film_work_id TEXT NOT NULL, genre_id TEXT NOT NULL,
+                                  created_at timestamp with time zone);
+    CREATE UNIQUE INDEX film_work_genre ON genre_film_work (film_work_id, genre_id);
+    CREATE TABLE person_film_work (id TEXT PRIMARY KEY, film_work_id TEXT NOT NULL, person_id TEXT NOT NULL,
+                                   role TEXT NOT NULL, created_at timestamp with time zone);
+    CREATE UNIQUE INDEX film_work_person_role ON person_film_work (film_work_id, person_id, role);
+"""
+
+GENRES = 26
+GENRES_PER_FILM = 2
+PERSONS_PER_FILM = 5
+ROLES = ('actor', 'director', 'writer')
+EPOCH = datetime(2021, 6, 16, tzinfo=timezone.utc)
+
+
+class SyntheticSource:
+    """Детерминированные строки таблиц для заданного масштаба
+
+    id записей вычисляются по номеру записи, поэтому таблицы связей
+    ссылаются на фильмы, жанры и персон без хранения списков id в памяти.
+    """
+
+    def __init__(self, link_rows: int, seed: int = 0):
+        self.seed = seed
+        self.films = max(math.ceil(link_rows / (GENRES_PER_FILM + PERSONS_PER_FILM)), 1)
+        self.persons = max(self.films, PERSONS_PER_FILM)
+        self.rng = random.Random(seed)
+
+    def make_id(self, kind: str, number: int) -> str:
+        digest = hashlib.md5(f'{self.seed}:{kind}:{number}'.encode()).digest()
+        return str(uuid.UUID(bytes=digest, version=4))
+
+    def timestamp(self) -> str:
+        moment = EPOCH + timedelta(seconds=self.rng.randrange(10 ** 7), microseconds=self.rng.randrange(10 ** 6))
+        return moment.strftime('%Y-%m-%d %H:%M:%S.%f+00')
+
+    def genres(self) -> Iterator[tuple]:
+        for n in range(GENRES):
+            yield (self.make_id('genre', n), f'Genre {n}', None if n % 3 else f'Genre {n} description',
+                   self.timestamp(), self.timestamp())
+
+    def film_works(self) -> Iterator[tuple]:
+        rng = self.rng
+        for n in range(self.films):
+            yield (self.make_id('film_work', n), f'Film {n}', 'Long description ' * rng.randrange(21) or None,
+                   None if n % 2 else f'20{n % 24:02d}-{n % 12 + 1:02d}-{n % 28 + 1:02d}', None,
+                   round(rng.random() * 10, 1) if n % 5 else None, 'movie' if n % 3 else 'tv_show',
+                   self.timestamp(), self.timestamp())
+
+    def persons_rows(self) -> Iterator[tuple]:
+        for n in range(self.persons):
+            yield self.make_id('person', n), f'Person {n}', self.timestamp(), self.timestamp()
+
+    def genre_film_works(self) -> Iterator[tuple]:
+        for n in range(self.films):
+            film_id = self.make_id('film_work', n)
+            for i, genre in enumerate(self.rng.sample(range(GENRES), GENRES_PER_FILM)):
+                yield (self.make_id('genre_film_work', n * GENRES_PER_FILM + i), film_id,
+                       self.make_id('genre', genre), self.timestamp())
+
+    def person_film_works(self) -> Iterator[tuple]:
+        for n in range(self.films):
+            film_id = self.make_id('film_work', n)
+            for i, person in enumerate(self.rng.sample(range(self.persons), PERSONS_PER_FILM)):
+                yield (self.make_id('person_film_work', n * PERSONS_PER_FILM + i), film_id,
+                       self.make_id('person', person), self.rng.choice(ROLES), self.timestamp())
+
+
+def generate(path: str, link_rows: int, seed: int = 0) -> str:
+    """Создать базу по пути path (существующий файл перезаписывается)
+
+    База собирается во временном файле рядом, так что прерванная генерация
+    не оставляет по пути path неполную базу.
+    """
+    tmp_path = f'{path}.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    source = SyntheticSource(link_rows, seed)
+    with sqlite3.connect(tmp_path) as conn:
+        conn.execute('PRAGMA journal_mode = OFF')
+        conn.execute('PRAGMA synchronous = OFF')
+        conn.executescript(SCHEMA)
+        conn.executemany('INSERT INTO genre VALUES (?, ?, ?, ?, ?)', source.genres())
+        conn.executemany('INSERT INTO film_work VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', source.film_works())
+        conn.executemany('INSERT INTO person VALUES (?, ?, ?, ?)', source.persons_rows())
+        conn.executemany('INSERT INTO genre_film_work VALUES (?, ?, ?, ?)', source.genre_film_works())
+        conn.executemany('INSERT INTO person_film_work VALUES (?, ?, ?, ?, ?)', source.person_film_works())
+    conn.close()
+    os.replace(tmp_path, path)
+    return path
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('path')
+    arg_parser.add_argument('--link-rows', type=int, default=10_000,
+                            help='Строк в genre_film_work и person_film_work вместе')
+    arg_parser.add_argument('--seed', type=int, default=0)
+    args = arg_parser.parse_args()
+    generate(args.path, args.link_rows, args.seed)
+    print(f'{args.path}: {args.link_rows} строк в таблицах связей')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,57 @@
+"""Память на пакет записей: обычный dataclass, dataclass со __slots__ и кортежи RowCodec
+
+Запуск из каталога sqlite_to_postgres:
+    python -m benchmarks.memory_bench [--batch-size N]
+"""
+import argparse
+import tracemalloc
+import uuid
+from dataclasses import fields, make_dataclass
+
+from models import FilmWork, PersonFilmWork
+from row_codecs import RowCodec
+
+TIMESTAMP = '2021-06-16 20:14:09.221838+00'
+SOURCE_ROWS = {
+    FilmWork: lambda i: (str(uuid.uuid4()), f'Film {i}', 'Description ' * 10, '2020-01-01', 8.5, 'movie',
+                         TIMESTAMP, TIMESTAMP),
+    PersonFilmWork: lambda i: (str(uuid.uuid4()), str(uuid.uuid4()), str(uuid.uuid4()), 'actor', TIMESTAMP),
+}
+
+
+def _measure(build) -> int:
+    """Пик памяти в байтах на построение пакета; значения полей общие у всех вариантов,
+    поэтому меряется только раскладка записей"""
+    tracemalloc.start()
+    tracemalloc.reset_peak()
+    result = build()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del result
+    return peak
+
+
+def main():
+    arg_parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    arg_parser.add_argument('--batch-size', type=int, default=50_000)
+    args = arg_parser.parse_args()
+
+    for object_class, make_row in SOURCE_ROWS.items():
+        codec = RowCodec(object_class)
+        decoded = [codec.decode(make_row(i)) for i in range(args.batch_size)]
+        # Прежняя раскладка: такой же dataclass, но с __dict__ у каждого экземпляра
+        plain_class = make_dataclass(f'Plain{object_class.__name__}', [(f.name, f.type) for f in fields(object_class)])
+
+        variants = {
+            'dataclass с __dict__': lambda: [plain_class(*row) for row in decoded],
+            'dataclass со __slots__': lambda: [object_class(*row) for row in decoded],
+            'кортежи RowCodec': lambda: [(*row,) for row in decoded],
+        }
+        for name, build in variants.items():
+            peak = _measure(build)
+            print(f'{object_class.__name__:<15} {name:<24} {peak / 2 ** 20:>8.1f} МиБ '
+                  f'({peak / args.batch_size:>5.0f} байт на запись)')
+
+
+if __name__ == '__main__':
+    main()
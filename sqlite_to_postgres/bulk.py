@@ -0,0 +1,114 @@
+import logging
+import time
+
+from psycopg import connection as _connection
+from psycopg.rows import tuple_row
+
+from migration import TABLES
+from state import State
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Ключ состояния, под которым хранятся DDL снятых индексов и внешних ключей
+STATE_KEY = 'deferred_ddl'
+
+
+class DeferredIndexes:
+    """Снятие вторичных индексов и внешних ключей на время первичной загрузки
+
+    Снимаются только неуникальные индексы, не связанные с ограничениями,
+    и внешние ключи схемы. Первичные ключи и уникальные индексы остаются:
+    на них опирается ON CONFLICT в PostgresSaver. DDL снятых объектов
+    сохраняется в state до удаления, поэтому после сбоя загрузки повторный
+    запуск восстановит их в restore().
+
+    Использование:
+        deferred = DeferredIndexes(pg_conn, state)
+        deferred.defer()
+        ... загрузка ...
+        deferred.restore()
+    """
+
+    def __init__(self, pg_conn: _connection, state: State, schema: str = 'content',
+                 maintenance_work_mem: str = '1GB', maintenance_workers: int = 4):
+        """
+        Args:
+            pg_conn: Соединение с Postgres, отдельное от соединений загрузки
+            state: Где хранить DDL снятых объектов
+            schema: Схема, в которой снимаются индексы и внешние ключи
+            maintenance_work_mem: Память на построение одного индекса
+            maintenance_workers: max_parallel_maintenance_workers при построении индексов
+        """
+        self.conn = pg_conn
+        self.cursor = pg_conn.cursor(row_factory=tuple_row)
+        self.state = state
+        self.schema = schema
+        self.maintenance_work_mem = maintenance_work_mem
+        self.maintenance_workers = maintenance_workers
+
+    def defer(self):
+        """Удалить вторичные индексы и внешние ключи, сохранив их DDL в state"""
+        if self.state.get_state(STATE_KEY):
+            logger.warning("Индексы и внешние ключи сняты прошлым незавершённым запуском, "
+                           "они будут восстановлены после загрузки")
+            return
+
+        self.cursor.execute("""SELECT c.relname, pg_get_indexdef(i.indexrelid)
+                FROM pg_index i
+                JOIN pg_class c ON c.oid = i.indexrelid
+                JOIN pg_namespace n ON n.oid = c.relnamespace
+                WHERE n.nspname = %s AND NOT i.indisunique AND NOT i.indisprimary
+                  AND NOT EXISTS (SELECT 1 FROM pg_constraint WHERE conindid = i.indexrelid)""", (self.schema,))
+        indexes = [{'name': name, 'ddl': ddl} for name, ddl in self.cursor.fetchall()]
+        self.cursor.execute("""SELECT conrelid::regclass::text, conname, pg_get_constraintdef(oid)
+                FROM pg_constraint
+                WHERE contype = 'f' AND connamespace = %s::regnamespace""", (self.schema,))
+        foreign_keys = [{'table': table, 'name': name, 'definition': definition}
+                        for table, name, definition in self.cursor.fetchall()]
+        self.state.set_state(STATE_KEY, {'indexes': indexes, 'foreign_keys': foreign_keys})
+
+        for foreign_key in foreign_keys:
+            self.cursor.execute(f"ALTER TABLE {foreign_key['table']} DROP CONSTRAINT {foreign_key['name']}")
+        for index in indexes:
+            self.cursor.execute(f"DROP INDEX {self.schema}.{index['name']}")
+        self.conn.commit()
+        logger.info(f"На время загрузки сняты индексы {[index['name'] for index in indexes]} "
+                    f"и внешние ключи {[foreign_key['name'] for foreign_key in foreign_keys]}")
+
+    def restore(self):
+        """Построить снятые индексы и вернуть внешние ключи с проверкой данных"""
+        deferred = self.state.get_state(STATE_KEY)
+        if not deferred:
+            return
+
+        # Построение btree-индекса Postgres распараллеливает сам в пределах этих настроек
+        self.cursor.execute(f"SET maintenance_work_mem = '{self.maintenance_work_mem}'")
+        self.cursor.execute(f"SET max_parallel_maintenance_workers = {int(self.maintenance_workers)}")
+        for index in deferred['indexes']:
+            started = time.perf_counter()
+            self.cursor.execute(index['ddl'].replace('CREATE INDEX ', 'CREATE INDEX IF NOT EXISTS ', 1))
+            self.conn.commit()
+            logger.info(f"Индекс {index['name']} построен за {time.perf_counter() - started:.1f} с")
+
+        for foreign_key in deferred['foreign_keys']:
+            started = time.perf_counter()
+            self.cursor.execute("SELECT EXISTS (SELECT 1 FROM pg_constraint WHERE conrelid = %s::regclass "
+                                "AND conname = %s)", (foreign_key['table'], foreign_key['name']))
+            if not self.cursor.fetchone()[0]:
+                # NOT VALID не проверяет строки и не блокирует запись надолго, проверка идёт отдельно
+                self.cursor.execute(f"ALTER TABLE {foreign_key['table']} ADD CONSTRAINT {foreign_key['name']} "
+                                    f"{foreign_key['definition']} NOT VALID")
+                self.conn.commit()
+            self.cursor.execute(f"ALTER TABLE {foreign_key['table']} VALIDATE CONSTRAINT {foreign_key['name']}")
+            self.conn.commit()
+            logger.info(f"Внешний ключ {foreign_key['name']} проверен за {time.perf_counter() - started:.1f} с")
+
+        self.cursor.execute("RESET maintenance_work_mem")
+        self.cursor.execute("RESET max_parallel_maintenance_workers")
+        # После загрузки статистики планировщика ещё нет
+        for table_name in TABLES:
+            self.cursor.execute(f"ANALYZE {self.schema}.{table_name}")
+        self.conn.commit()
+        self.state.set_state(STATE_KEY, None)
+        logger.info("Индексы и внешние ключи восстановлены")
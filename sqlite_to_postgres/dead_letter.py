@@ -0,0 +1,29 @@
+import json
+import os
+from typing import List, Tuple
+
+
+class DeadLetterFile:
+    """Файл JSON Lines для строк, которые не попали в Postgres
+
+    Каждая строка файла - таблица, причина, подробности (например, текст
+    ошибки) и сама строка с именами колонок. Файл открывается с O_APPEND,
+    и каждая строка пишется одним os.write, поэтому один путь можно отдавать
+    загрузчикам и сохранятелям в потоках и в процессах (--workers): строки
+    разных писателей не перемешиваются.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+
+    def write(self, table_name: str, column_names: List[str], rejects: List[Tuple[tuple, dict]], reason: str):
+        """Дописать строки rejects - пары (строка, подробности)"""
+        lines = [json.dumps({'table': table_name, 'reason': reason, **details, 'row': dict(zip(column_names, row))},
+                            ensure_ascii=False, default=str).encode() + b'\n'
+                 for row, details in rejects]
+        fd = os.open(self.path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+        try:
+            for line in lines:
+                os.write(fd, line)
+        finally:
+            os.close(fd)
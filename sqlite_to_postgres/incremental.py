@@ -0,0 +1,61 @@
+import logging
+import sqlite3
+
+from psycopg import connection as _connection
+
+from load_from_sqlite import SQLiteLoader
+from migration import TABLES, MigrationOptions, migrate_table
+from state import State
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _rejected_rows(sqlite_loader: SQLiteLoader, table_name: str) -> int:
+    """Сколько строк таблицы отсеял reference_filter загрузчика"""
+    if sqlite_loader.reference_filter is None:
+        return 0
+    return sqlite_loader.reference_filter.rejected.get(table_name, 0)
+
+
+def load_incremental(connection: sqlite3.Connection, pg_conn: _connection, state: State,
+                     options: MigrationOptions = None):
+    """Перенос только новых и изменённых с прошлого запуска записей
+
+    Для каждой таблицы в state хранится максимальное значение updated_at
+    (created_at для таблиц связей), которое уже перенесено в Postgres.
+    Читаются только записи новее него, а в Postgres они вставляются или
+    обновляются через ON CONFLICT ... DO UPDATE. Отметка сдвигается после
+    коммита таблицы и только если ни один пакет не был откачен и
+    check_references не отсеял ни одной строки: связь, родитель которой
+    появится позже, будет перечитана следующим запуском.
+    """
+    options = options or MigrationOptions()
+    postgres_saver = options.make_saver(pg_conn, upsert=True)
+    sqlite_loader = options.make_loader(connection, postgres_saver)
+
+    for table_name in TABLES:
+        state_key = f'{table_name}_watermark'
+        watermark = state.get_state(state_key)
+        # Отметку берём до чтения: записи, появившиеся во время переноса, попадут в следующий запуск
+        new_watermark = sqlite_loader.get_max_value(table_name, sqlite_loader.watermark_column(table_name))
+        if new_watermark is None or new_watermark == watermark:
+            logger.info(f"Нет новых записей в таблице {table_name}")
+            continue
+
+        failed_batches = postgres_saver.failed_batches
+        rejected = _rejected_rows(sqlite_loader, table_name)
+        rows = migrate_table(sqlite_loader, postgres_saver, table_name, since=watermark,
+                             batch_sizer=options.batch_sizer)
+        postgres_saver.commit(table_name)
+        if postgres_saver.failed_batches != failed_batches:
+            logger.error(f"Часть пакетов таблицы {table_name} не сохранена, отметка не сдвигается")
+            continue
+        if _rejected_rows(sqlite_loader, table_name) != rejected:
+            logger.warning(f"В таблице {table_name} отсеяны строки со ссылками на отсутствующие записи, "
+                           f"отметка не сдвигается, они будут перечитаны в следующий запуск")
+            continue
+        state.set_state(state_key, new_watermark)
+        logger.info(f"Перенесено {rows} новых и изменённых записей таблицы {table_name}")
+
+    logger.info('Изменения из sqlite загружены в postgres')
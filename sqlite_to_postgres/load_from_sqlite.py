@@ -1,21 +1,78 @@
 import sqlite3
 import logging
+import os
+import time
+from urllib.request import pathname2url
+from operator import attrgetter
 from uuid import UUID
 from models import FilmWork, Person, Genre, GenreFilmWork, PersonFilmWork
-from typing import List, Generator
-from dataclasses import fields
+from row_codecs import RowCodec
+from metrics import MigrationMetrics
+from references import ReferenceFilter
+from typing import Any, List, Generator, Tuple
+from dataclasses import dataclass, fields
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Настройки соединения в режиме read_only: отображение файла в память (SQLite ограничит
+# его своим SQLITE_MAX_MMAP_SIZE) и кэш страниц в КиБ (отрицательное cache_size)
+SQLITE_MMAP_SIZE = 2 ** 40
+SQLITE_CACHE_KIB = 256 * 1024
+
+
+def connect_sqlite(path: str, read_only: bool = False, check_same_thread: bool = True) -> sqlite3.Connection:
+    """Подключение к исходной базе SQLite
+
+    С read_only файл открывается как неизменяемый (mode=ro&immutable=1):
+    SQLite не берет блокировок и не проверяет журнал, поэтому несколько
+    процессов читают один файл без ожидания друг друга. Страницы читаются
+    через mmap прямо из кэша ОС, без системного вызова на каждую, временные
+    структуры (сортировки, индексы для ORDER BY) строятся в памяти. Файл
+    не должен меняться, пока с ним работает соединение.
+    """
+    if not read_only:
+        return sqlite3.connect(path, check_same_thread=check_same_thread)
+    if not os.path.exists(path):
+        raise FileNotFoundError(path)
+    uri = f'file:{pathname2url(os.path.abspath(path))}?mode=ro&immutable=1'
+    conn = sqlite3.connect(uri, uri=True, check_same_thread=check_same_thread)
+    conn.execute(f'PRAGMA mmap_size = {SQLITE_MMAP_SIZE}')
+    conn.execute(f'PRAGMA cache_size = -{SQLITE_CACHE_KIB}')
+    conn.execute('PRAGMA temp_store = MEMORY')
+    return conn
+
 
 class SQLiteLoader:
 
-    def __init__(self, conn: sqlite3.Connection):
+    def __init__(self, conn: sqlite3.Connection, validate: bool = False, uuid_as_text: bool = False,
+                 metrics: MigrationMetrics = None, log_batches: bool = True,
+                 reference_filter: ReferenceFilter = None):
+        """
+        Args:
+            conn: Соединение с SQLite
+            validate: load_rows разбирает строки через dataclass из models.py
+                (медленнее, для проверки и отладки) вместо RowCodec
+            uuid_as_text: load_rows оставляет UUID строками, см. RowCodec
+            metrics: Куда записывать время чтения и разбора строк
+            log_batches: Писать в лог INFO о каждом загруженном пакете
+            reference_filter: load_rows отсеивает строки таблиц связей с битыми ссылками
+        """
         self.conn = conn
-        self.conn.row_factory = sqlite3.Row
+        # Строки читаются обычными кортежами в порядке get_columns, без sqlite3.Row
         self.cursor = self.conn.cursor()
+        self.cursor.row_factory = None
         self.batch_size = 100
+        # rowid последней записи, отданной load_data в режиме постраничного чтения по ключу
+        self.last_rowid = None
+        # id последней записи, отданной keyset_scan
+        self.last_id = None
+        self.validate = validate
+        self.uuid_as_text = uuid_as_text
+        self.metrics = metrics
+        self.log_batches = log_batches
+        self.reference_filter = reference_filter
+        self._codecs = {}
         self.transform_col_name = {'modified':'updated_at',
                                    'created':'created_at'}
         self.table_class_map = {
@@ -38,13 +95,71 @@ class SQLiteLoader:
         """Получение количества строк в таблице"""
         try:
             query = f"SELECT COUNT(*) as count FROM {table_name}"
-            result = self.cursor.execute(query)
-            return result[0]['count'] if result else 0
+            return self.cursor.execute(query).fetchone()[0]
         except Exception as e:
             logger.error(f"Ошибка при получении количества строк в таблице {table_name}: {e}")
             return 0
 
-    def _execute_query(self, query: str, params: tuple = None) -> Generator[List[sqlite3.Row], None, None]:
+    def watermark_column(self, table_name: str) -> str:
+        """Колонка SQLite, по которой отслеживаются новые и изменённые записи"""
+        need_columns = [f.name for f in fields(self.table_class_map[table_name])]
+        return self.transform_col_name['modified' if 'modified' in need_columns else 'created']
+
+    def get_max_value(self, table_name: str, column: str):
+        """Максимальное значение колонки в таблице"""
+        return self.cursor.execute(f"SELECT MAX({column}) FROM {table_name}").fetchone()[0]
+
+    def split_rowid_ranges(self, table_name: str, parts: int) -> List[Tuple[int, int]]:
+        """Разбиение таблицы на parts непересекающихся диапазонов rowid"""
+        min_rowid, max_rowid = self.cursor.execute(f"SELECT MIN(rowid), MAX(rowid) FROM {table_name}").fetchone()
+        if min_rowid is None:
+            return []
+        step = max((max_rowid - min_rowid + 1) // max(parts, 1), 1)
+        ranges = []
+        start = min_rowid
+        while start <= max_rowid:
+            end = start + step - 1
+            if len(ranges) == parts - 1:
+                end = max_rowid
+            ranges.append((start, min(end, max_rowid)))
+            start = end + 1
+        return ranges
+
+    def split_key_ranges(self, table_name: str, parts: int, key: str = 'rowid') -> List[Tuple]:
+        """Разбиение таблицы на parts непересекающихся диапазонов key (включительно) с равным числом строк
+
+        В отличие от split_rowid_ranges, границы - квантили ключа, а не
+        равные отрезки между MIN и MAX, поэтому дыры в rowid не перекашивают
+        части, и так же делятся таблицы по id (UUID строками). Каждая граница -
+        запрос ORDER BY key LIMIT 2 OFFSET ? по индексу ключа: он отдает
+        последний ключ одной части и первый ключ следующей.
+
+        Args:
+            table_name: Имя таблицы
+            parts: Количество частей (меньше, если строк меньше)
+            key: rowid или id
+        """
+        total = self.get_table_row_count(table_name)
+        if not total:
+            return []
+        parts = max(min(parts, total), 1)
+        first, last = self.cursor.execute(f"SELECT MIN({key}), MAX({key}) FROM {table_name}").fetchone()
+        ranges = []
+        start = first
+        for i in range(1, parts):
+            end, next_start = [row[0] for row in self.cursor.execute(
+                f"SELECT {key} FROM {table_name} ORDER BY {key} LIMIT 2 OFFSET ?", (total * i // parts - 1,))]
+            ranges.append((start, end))
+            start = next_start
+        ranges.append((start, last))
+        return ranges
+
+    def plan_scans(self, table_name: str, parts: int, key: str = 'rowid') -> List['KeyRangeScan']:
+        """Независимые чтения частей таблицы по split_key_ranges, см. KeyRangeScan"""
+        return [KeyRangeScan(table_name, key, low, high)
+                for low, high in self.split_key_ranges(table_name, parts, key)]
+
+    def _execute_query(self, query: str, params: tuple = None) -> Generator[List[tuple], None, None]:
         """Выполнение SQL запроса с обработкой ошибок"""
         try:
             if params:
@@ -61,14 +176,41 @@ class SQLiteLoader:
             logger.error(f"Неожиданная ошибка при выполнении запроса: {e}")
             raise
 
-    def load_data(self, table_name) -> Generator[List[FilmWork | Person | Genre | PersonFilmWork | GenreFilmWork], None, None]:
-        """Загрузка данных из таблицы table_name"""
+    def _execute_keyset_query(self, query: str, params: tuple, key: str, after_key, key_index: int
+                              ) -> Generator[List[tuple], None, None]:
+        """Постраничное чтение по ключу: каждый пакет - отдельный запрос WHERE key > ? ORDER BY key
+
+        query должен заканчиваться условием на key, значение ключа в строке
+        результата берется из колонки key_index.
+        """
+        try:
+            while results := self.cursor.execute(f'{query} ORDER BY {key} LIMIT ?',
+                                                 (*params, after_key, self.batch_size)).fetchall():
+                after_key = results[-1][key_index]
+                yield results
+        except sqlite3.Error as e:
+            logger.error(f"Ошибка выполнения запроса: {e}")
+            logger.error(f"Запрос: {query}")
+            raise
+        except Exception as e:
+            logger.error(f"Неожиданная ошибка при выполнении запроса: {e}")
+            raise
+
+    def get_columns(self, table_name: str) -> List[str]:
+        """Колонки таблицы в Postgres в том порядке, в котором их отдает load_rows"""
+        return [f.name for f in fields(self._get_object_class(table_name))]
+
+    def _get_object_class(self, table_name: str) -> type:
         if table_name not in self.table_class_map.keys():
             logger.error(f"Попытка загрузки данных с незарегистрированной таблицы - {table_name}")
             raise ValueError(f"Попытка загрузки данных с незарегистрированной таблицы - {table_name}")
-        
-        object_class = self.table_class_map[table_name]
-        need_columns = [f.name for f in fields(object_class)]
+        return self.table_class_map[table_name]
+
+    def _iter_batches(self, table_name: str, rowid_range: Tuple[int, int] = None, since: str = None,
+                      after_rowid: int = None, id_range: Tuple[str, str] = None, after_id: str = None
+                      ) -> Generator[List[tuple], None, None]:
+        """Чтение сырых строк таблицы пакетами, параметры как у load_data"""
+        need_columns = [f.name for f in fields(self._get_object_class(table_name))]
         fields_str = ''
         for col in need_columns:
             if col in self.transform_col_name.keys():
@@ -77,16 +219,186 @@ class SQLiteLoader:
                 fields_str += f"{col}, "
         fields_str = fields_str[:-2]
         
-        for batch in self._execute_query(f'SELECT {fields_str} FROM {table_name}'):
+        conditions = []
+        params = ()
+        if rowid_range:
+            conditions.append('rowid BETWEEN ? AND ?')
+            params += tuple(rowid_range)
+        if since is not None:
+            conditions.append(f'{self.watermark_column(table_name)} > ?')
+            params += (since,)
+        if id_range:
+            conditions.append('id BETWEEN ? AND ?')
+            params += tuple(id_range)
+        if after_rowid is not None:
+            fields_str += ', rowid as _rowid'
+            conditions.append('rowid > ?')
+        elif after_id is not None:
+            conditions.append('id > ?')
+        query = f'SELECT {fields_str} FROM {table_name}'
+        if conditions:
+            query += ' WHERE ' + ' AND '.join(conditions)
+
+        id_index = need_columns.index('id')
+        if after_rowid is not None:
+            batches = self._execute_keyset_query(query, params, 'rowid', after_rowid, -1)
+        elif after_id is not None:
+            batches = self._execute_keyset_query(query, params, 'id', after_id, id_index)
+        else:
+            batches = self._execute_query(query, params)
+
+        started = time.perf_counter()
+        for batch in batches:
+            if self.metrics:
+                self.metrics.record_fetch(table_name, len(batch), time.perf_counter() - started)
+            if after_rowid is not None:
+                self.last_rowid = batch[-1][-1]
+            elif after_id is not None:
+                self.last_id = batch[-1][id_index]
+            yield batch
+            started = time.perf_counter()
+
+    def load_data(self, table_name, rowid_range: Tuple[int, int] = None, since: str = None,
+                  after_rowid: int = None, id_range: Tuple[str, str] = None,
+                  after_id: str = None) -> Generator[List[FilmWork | Person | Genre | PersonFilmWork | GenreFilmWork], None, None]:
+        """Загрузка данных из таблицы table_name
+
+        Args:
+            table_name: Имя таблицы
+            rowid_range: Границы rowid (включительно), если нужна только часть таблицы
+            since: Загружать только записи, у которых watermark_column больше этого значения
+            after_rowid: Читать по ключу начиная с записи, следующей за этим rowid;
+                после каждого пакета его последний rowid доступен в self.last_rowid
+            id_range: Границы id (включительно, строками), см. verify.ConsistencyChecker
+            after_id: Читать по ключу в порядке id начиная с записи, следующей за этим id, см. keyset_scan
+        """
+        object_class = self._get_object_class(table_name)
+        column_names = self.get_columns(table_name)
+
+        for batch in self._iter_batches(table_name, rowid_range, since, after_rowid, id_range, after_id):
+            started = time.perf_counter()
             data: List[FilmWork | Person | Genre | PersonFilmWork | GenreFilmWork] = []
             for result in batch:
                 try:
-                    result = dict(result)
+                    # zip отбрасывает _rowid в конце строки
+                    result = dict(zip(column_names, result))
                     film = object_class(**result)
                     data.append(film)
                 except Exception as e:
                     logger.error(f"Ошибка обработки строки: {e}")
                     logger.error(f"Данные строки: {dict(result)}")
                     continue
-            logger.info(f"Успешно загружено {len(data)} записей из {table_name}")
+            self._batch_decoded(table_name, batch, data, started)
             yield data
+
+    def load_rows(self, table_name, rowid_range: Tuple[int, int] = None, since: str = None,
+                  after_rowid: int = None, id_range: Tuple[str, str] = None) -> Generator[List[tuple], None, None]:
+        """Загрузка данных из таблицы table_name кортежами в порядке get_columns
+
+        Параметры как у load_data. Строки разбираются RowCodec, а при
+        validate=True - через dataclass из models.py. Если задан
+        reference_filter, строки с битыми ссылками в пакет не попадают.
+        """
+        batches = self._decode_rows(table_name, rowid_range, since, after_rowid, id_range)
+        yield from self._filter_references(table_name, batches)
+
+    def keyset_scan(self, table_name, after_id: str = '', id_range: Tuple[str, str] = None
+                    ) -> Generator[List[tuple], None, None]:
+        """Чтение таблицы кортежами в порядке id, каждый пакет - отдельный запрос WHERE id > ?
+
+        Пакеты те же, что у load_rows, но упорядочены по id и читаются по
+        индексу первичного ключа без OFFSET. После каждого пакета его
+        последний id доступен в self.last_id: с него можно продолжить
+        чтение (after_id), в том числе в другом процессе или соединении.
+
+        Args:
+            table_name: Имя таблицы
+            after_id: Читать записи с id больше этого значения, '' - с начала таблицы
+            id_range: Границы id (включительно), если нужна только часть таблицы
+        """
+        batches = self._decode_rows(table_name, id_range=id_range, after_id=after_id)
+        yield from self._filter_references(table_name, batches)
+
+    def _filter_references(self, table_name: str, batches: Generator[List[tuple], None, None]
+                           ) -> Generator[List[tuple], None, None]:
+        if self.reference_filter is None:
+            yield from batches
+            return
+        column_names = self.get_columns(table_name)
+        for batch in batches:
+            yield self.reference_filter.filter_rows(table_name, column_names, batch)
+
+    def _decode_rows(self, table_name, rowid_range: Tuple[int, int] = None, since: str = None,
+                     after_rowid: int = None, id_range: Tuple[str, str] = None,
+                     after_id: str = None) -> Generator[List[tuple], None, None]:
+        if self.validate:
+            getter = attrgetter(*self.get_columns(table_name))
+            for batch in self.load_data(table_name, rowid_range, since, after_rowid, id_range, after_id):
+                yield [getter(item) for item in batch]
+            return
+
+        codec = self._get_codec(table_name)
+        for batch in self._iter_batches(table_name, rowid_range, since, after_rowid, id_range, after_id):
+            started = time.perf_counter()
+            try:
+                data = codec.decode_batch(batch)
+            except Exception:
+                # Ищем битые строки только если пакет целиком не разобрался
+                data = []
+                for result in batch:
+                    try:
+                        data.append(codec.decode(result))
+                    except Exception as e:
+                        logger.error(f"Ошибка обработки строки: {e}")
+                        logger.error(f"Данные строки: {tuple(result)}")
+            self._batch_decoded(table_name, batch, data, started)
+            yield data
+
+    def _batch_decoded(self, table_name: str, batch: list, data: list, started: float):
+        if self.metrics:
+            self.metrics.record_decode(table_name, len(batch), len(data), time.perf_counter() - started)
+        if self.log_batches:
+            logger.info(f"Успешно загружено {len(data)} записей из {table_name}")
+
+    def _get_codec(self, table_name: str) -> RowCodec:
+        if table_name not in self._codecs:
+            self._codecs[table_name] = RowCodec(self._get_object_class(table_name), self.uuid_as_text)
+        return self._codecs[table_name]
+
+
+@dataclass
+class KeyRangeScan:
+    """Чтение одного диапазона ключа таблицы пакетами, которое можно повторить с места сбоя
+
+    Каждый пакет - отдельный запрос WHERE key > ? по индексу ключа, поэтому
+    несколько чтений по одному загрузчику можно чередовать, а разные
+    диапазоны читать одновременно в разных процессах или потоках (каждый
+    со своим SQLiteLoader). Сам KeyRangeScan не держит соединения и
+    передаётся в другой процесс. last_key сдвигает потребитель, когда пакет
+    обработан (например, закоммичен): если обработка упала, повторный вызов
+    batches() снова отдаст пакет, на котором произошёл сбой.
+    """
+    table_name: str
+    # rowid или id
+    key: str
+    low: Any
+    high: Any
+    # Последний ключ пакета, обработанного потребителем
+    last_key: Any = None
+
+    def batches(self, loader: SQLiteLoader) -> Generator[Tuple[Any, List[tuple]], None, None]:
+        """Пары (последний ключ пакета, пакет) начиная после last_key, пакеты как у SQLiteLoader.load_rows"""
+        if self.key == 'rowid':
+            after = self.low - 1 if self.last_key is None else self.last_key
+            batches = loader.load_rows(self.table_name, rowid_range=(self.low, self.high), after_rowid=after)
+            last_key = attrgetter('last_rowid')
+        else:
+            after = '' if self.last_key is None else self.last_key
+            batches = loader.keyset_scan(self.table_name, after, id_range=(self.low, self.high))
+            last_key = attrgetter('last_id')
+        for batch in batches:
+            yield last_key(loader), batch
+
+    @property
+    def finished(self) -> bool:
+        return self.last_key == self.high
@@ -0,0 +1,18 @@
+import threading
+
+
+class PicklableLock:
+    """Примесь для объектов с блокировкой self._lock, которые передаются в другие процессы
+
+    Блокировку нельзя передать в другой процесс, поэтому pickle сохраняет
+    объект без неё, а при восстановлении создаётся своя.
+    """
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        del state['_lock']
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
@@ -1,48 +1,185 @@
+import argparse
+import asyncio
+import contextlib
 import sqlite3
 import os
 import psycopg
 import logging
 
 from dotenv import load_dotenv
-from psycopg import ClientCursor, connection as _connection
-from psycopg.rows import dict_row
+from psycopg import connection as _connection
 
 load_dotenv() 
 
 from load_from_sqlite import SQLiteLoader
 from save_to_postgres import PostgresSaver
+from migration import TABLES, MigrationOptions, connect_postgres, migrate_table
+from batching import AdaptiveBatchSizer
+from bulk import DeferredIndexes
+from metrics import MigrationMetrics, ProgressReporter
+from parallel import load_parallel
+from pipelined import load_pipelined
+from async_migration import load_async
+from incremental import load_incremental
+from resumable import load_resumable
+from state import JsonFileStorage, State
+from verify import ConsistencyChecker
+from snapshot import export_snapshot, import_snapshot
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-def load_from_sqlite_to_postgres(connection: sqlite3.Connection, pg_conn: _connection):
+def load_from_sqlite_to_postgres(connection: sqlite3.Connection, pg_conn: _connection,
+                                 options: MigrationOptions = None):
     """Основной метод загрузки данных из SQLite в Postgres"""
-    postgres_saver = PostgresSaver(pg_conn)
-    sqlite_loader = SQLiteLoader(connection)
+    options = options or MigrationOptions()
+    postgres_saver = options.make_saver(pg_conn)
+    sqlite_loader = options.make_loader(connection, postgres_saver)
 
-    conflict_fields = {'genre_film_work': 'genre_id, film_work_id',
-                       'person_film_work': 'person_id, film_work_id, role'}
-
-    for table_name in ['film_work', 'genre', 'person', 'genre_film_work', 'person_film_work']:
-        for batch in sqlite_loader.load_data(table_name):
-            postgres_saver.save_data(batch, f'content.{table_name}', conflict_fields.get(table_name, 'id'))
+    for table_name in TABLES:
+        migrate_table(sqlite_loader, postgres_saver, table_name, batch_sizer=options.batch_sizer)
+        postgres_saver.commit(table_name)
 
     logging.info('Данные из sqlite загружены в postgres')
 
 
 if __name__ == '__main__':
+    arg_parser = argparse.ArgumentParser(description='Перенос данных из SQLite в Postgres')
+    arg_parser.add_argument('--save-mode', choices=PostgresSaver.SAVE_MODES, default='copy',
+                            help='Способ записи пакетов в Postgres (по умолчанию copy)')
+    arg_parser.add_argument('--validate', action='store_true',
+                            help='Разбирать строки через dataclass из models.py (медленнее, для отладки)')
+    arg_parser.add_argument('--adaptive-batch', action='store_true',
+                            help='Подбирать размер пакета по задержке записи и объёму данных')
+    arg_parser.add_argument('--target-latency', type=float, default=0.25,
+                            help='Желаемое время записи одного пакета в секундах (для --adaptive-batch)')
+    arg_parser.add_argument('--batch-memory-mb', type=int, default=64,
+                            help='Предельный объём одного пакета в МиБ (для --adaptive-batch)')
+    arg_parser.add_argument('--workers', type=int, default=1,
+                            help='Количество процессов для параллельного переноса таблиц')
+    arg_parser.add_argument('--pipelined', action='store_true',
+                            help='Читать из SQLite и писать в Postgres одновременно')
+    arg_parser.add_argument('--async', action='store_true', dest='use_async',
+                            help='Переносить таблицы одновременно на asyncio и пуле соединений (нужен psycopg_pool)')
+    arg_parser.add_argument('--writers', type=int, default=2,
+                            help='Количество потоков записи в режиме --pipelined или соединений в режиме --async')
+    arg_parser.add_argument('--queue-size', type=int, default=4,
+                            help='Максимум готовых пакетов в очереди в режиме --pipelined')
+    arg_parser.add_argument('--incremental', action='store_true',
+                            help='Переносить только записи, изменённые с прошлого запуска')
+    arg_parser.add_argument('--resume', action='store_true',
+                            help='Коммитить каждый пакет и продолжать перенос с места прошлого сбоя')
+    arg_parser.add_argument('--state-file', default='migration_state.json',
+                            help='Файл с состоянием миграции')
+    arg_parser.add_argument('--metrics-file',
+                            help='Сохранить отчёт с метриками переноса по таблицам в JSON-файл')
+    arg_parser.add_argument('--progress-interval', type=float, default=0,
+                            help='Выводить прогресс и оценку оставшегося времени раз в указанное число секунд')
+    arg_parser.add_argument('--no-batch-log', action='store_true',
+                            help='Не писать в лог о каждом пакете')
+    arg_parser.add_argument('--bulk', action='store_true',
+                            help='Первичная загрузка: снять вторичные индексы и внешние ключи, '
+                                 'писать с synchronous_commit=off и построить индексы в конце')
+    arg_parser.add_argument('--maintenance-work-mem', default='1GB',
+                            help='maintenance_work_mem при построении индексов в режиме --bulk')
+    arg_parser.add_argument('--maintenance-workers', type=int, default=4,
+                            help='max_parallel_maintenance_workers при построении индексов в режиме --bulk')
+    arg_parser.add_argument('--check-references', action='store_true',
+                            help='Не отправлять в Postgres строки таблиц связей со ссылками на отсутствующие записи')
+    arg_parser.add_argument('--isolate-failures', action='store_true',
+                            help='Если пакет не записался, найти битые строки делением пакета и сохранить остальные')
+    arg_parser.add_argument('--rejects-file',
+                            help='Записывать строки, отсеянные --check-references и отброшенные --isolate-failures, '
+                                 'в файл JSON Lines')
+    arg_parser.add_argument('--sqlite-read-only', action='store_true',
+                            help='Открыть файл SQLite только на чтение как неизменяемый, с mmap и большим кэшем страниц')
+    snapshot = arg_parser.add_mutually_exclusive_group()
+    snapshot.add_argument('--export-snapshot', metavar='DIR',
+                          help='Только выгрузить таблицы SQLite в файлы бинарного COPY с манифестом, без Postgres')
+    snapshot.add_argument('--from-snapshot', metavar='DIR',
+                          help='Загрузить в Postgres выгрузку --export-snapshot вместо чтения SQLite')
+    arg_parser.add_argument('--verify', action='store_true',
+                            help='После переноса сверить таблицы по контрольным суммам')
+    args = arg_parser.parse_args()
+    # Режимы переноса выбираются по очереди (см. ниже), лишний молча игнорировался бы
+    modes = {'--export-snapshot': args.export_snapshot, '--from-snapshot': args.from_snapshot,
+             '--workers': args.workers > 1, '--incremental': args.incremental, '--resume': args.resume,
+             '--async': args.use_async, '--pipelined': args.pipelined}
+    chosen = [name for name, enabled in modes.items() if enabled]
+    if len(chosen) > 1:
+        arg_parser.error(f"Режимы {', '.join(chosen)} нельзя совмещать, выберите один")
+    if args.bulk and args.resume:
+        # Контрольная точка может опередить коммиты, потерянные сервером при synchronous_commit=off
+        arg_parser.error('--bulk нельзя совмещать с --resume')
+    if args.export_snapshot and (args.bulk or args.verify):
+        # Выгрузка не пишет в Postgres: --bulk зря снял бы индексы и ключи, а --verify сверил бы старые данные
+        arg_parser.error('--export-snapshot нельзя совмещать с --bulk и --verify')
+
     dsl = {'dbname': os.environ.get('DB_NAME'),
            'user': os.environ.get('DB_USER'),
            'password': os.environ.get('DB_PASSWORD'),
            'host': os.environ.get('DB_HOST', '127.0.0.1'),
            'port': os.environ.get('DB_PORT', 5432),
            'options':'-c client_encoding=UTF8'}
+    batch_sizer = None
+    if args.adaptive_batch:
+        batch_sizer = AdaptiveBatchSizer(target_latency=args.target_latency,
+                                         max_batch_bytes=args.batch_memory_mb * 2 ** 20)
+    metrics = MigrationMetrics() if args.metrics_file or args.progress_interval else None
+    options = MigrationOptions(args.save_mode, args.validate, batch_sizer, metrics, not args.no_batch_log,
+                               synchronous_commit=not args.bulk, check_references=args.check_references,
+                               isolate_failures=args.isolate_failures, rejects_path=args.rejects_file,
+                               sqlite_read_only=args.sqlite_read_only)
+    sqlite_path = fr"{os.environ.get('FILE_PATH')}"
+    deferred = None
     try:
-        with sqlite3.connect(fr"{os.environ.get('FILE_PATH')}") as sqlite_conn, psycopg.connect(
-            **dsl, row_factory=dict_row, cursor_factory=ClientCursor
-        ) as pg_conn:
-            load_from_sqlite_to_postgres(sqlite_conn, pg_conn)
+        progress = contextlib.nullcontext()
+        if args.progress_interval:
+            with options.connect_sqlite(sqlite_path) as sqlite_conn:
+                counter = SQLiteLoader(sqlite_conn)
+                totals = {table_name: counter.get_table_row_count(table_name) for table_name in TABLES}
+            progress = ProgressReporter(metrics, totals, args.progress_interval)
+
+        if args.bulk:
+            deferred = DeferredIndexes(connect_postgres(dsl), State(JsonFileStorage(args.state_file)),
+                                       maintenance_work_mem=args.maintenance_work_mem,
+                                       maintenance_workers=args.maintenance_workers)
+            deferred.defer()
+
+        with progress:
+            if args.export_snapshot:
+                with options.connect_sqlite(sqlite_path) as sqlite_conn:
+                    export_snapshot(sqlite_conn, args.export_snapshot)
+            elif args.from_snapshot:
+                with connect_postgres(dsl) as pg_conn:
+                    import_snapshot(pg_conn, args.from_snapshot, options)
+            elif args.workers > 1:
+                load_parallel(sqlite_path, dsl, args.workers, options)
+            elif args.incremental:
+                with options.connect_sqlite(sqlite_path) as sqlite_conn, connect_postgres(dsl) as pg_conn:
+                    load_incremental(sqlite_conn, pg_conn, State(JsonFileStorage(args.state_file)), options)
+            elif args.resume:
+                with options.connect_sqlite(sqlite_path) as sqlite_conn, connect_postgres(dsl) as pg_conn:
+                    load_resumable(sqlite_conn, pg_conn, State(JsonFileStorage(args.state_file)), options)
+            elif args.use_async:
+                asyncio.run(load_async(sqlite_path, dsl, args.writers, options))
+            elif args.pipelined:
+                with options.connect_sqlite(sqlite_path) as sqlite_conn:
+                    load_pipelined(sqlite_conn, dsl, args.writers, args.queue_size, options)
+            else:
+                with options.connect_sqlite(sqlite_path) as sqlite_conn, connect_postgres(dsl) as pg_conn:
+                    load_from_sqlite_to_postgres(sqlite_conn, pg_conn, options)
+        if deferred:
+            deferred.restore()
+        if batch_sizer:
+            logging.info(f"Подобранные размеры пакетов: {batch_sizer.report()}")
+        if args.verify:
+            with options.connect_sqlite(sqlite_path) as sqlite_conn, connect_postgres(dsl) as pg_conn:
+                ConsistencyChecker(sqlite_conn, pg_conn).check_all()
+        if args.metrics_file:
+            metrics.save_report(args.metrics_file)
+            logging.info(f"Метрики переноса сохранены в {args.metrics_file}")
     except sqlite3.Error as e:
         logging.error(f"Ошибка подключения к SQLite: {e}")
     except FileNotFoundError:
@@ -54,4 +191,7 @@ if __name__ == '__main__':
     except psycopg.InterfaceError as e:
         logging.error(f"Ошибка интерфейса PostgreSQL: {e}")
     except Exception as e:
-        logging.error(f'Непредвиденная ошибка при подключении к базам данных: е={e}.')
\ No newline at end of file
+        logging.error(f'Непредвиденная ошибка при подключении к базам данных: е={e}.')
+    finally:
+        if deferred:
+            deferred.conn.close()
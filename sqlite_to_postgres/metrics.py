@@ -0,0 +1,235 @@
+import json
+import logging
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Dict
+
+from locks import PicklableLock
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+@dataclass(slots=True)
+class TableMetrics:
+    """Счётчики и время переноса одной таблицы"""
+    rows_read: int = 0
+    rows_written: int = 0
+    rows_skipped: int = 0
+    rows_failed_decode: int = 0
+    rows_failed_save: int = 0
+    rows_rejected: int = 0
+    fetch_seconds: float = 0.0
+    decode_seconds: float = 0.0
+    send_seconds: float = 0.0
+    commit_seconds: float = 0.0
+    # Процессорное время и пик памяти Python (если включен tracemalloc), см. MigrationMetrics.track_table
+    cpu_seconds: float = 0.0
+    peak_memory: int = None
+    started: float = None
+    finished: float = None
+    batch_sizes: Counter = field(default_factory=Counter)
+
+    def touch(self):
+        now = time.monotonic()
+        if self.started is None:
+            self.started = now
+        self.finished = now
+
+    def merge(self, other: 'TableMetrics'):
+        for name in ('rows_read', 'rows_written', 'rows_skipped', 'rows_failed_decode', 'rows_failed_save',
+                     'rows_rejected',
+                     'fetch_seconds', 'decode_seconds', 'send_seconds', 'commit_seconds', 'cpu_seconds'):
+            setattr(self, name, getattr(self, name) + getattr(other, name))
+        if other.peak_memory is not None:
+            self.peak_memory = max(self.peak_memory or 0, other.peak_memory)
+        if other.started is not None:
+            self.started = other.started if self.started is None else min(self.started, other.started)
+            self.finished = other.finished if self.finished is None else max(self.finished, other.finished)
+        self.batch_sizes.update(other.batch_sizes)
+
+    def report(self) -> dict:
+        seconds = (self.finished - self.started) if self.started is not None else 0.0
+        sizes = sorted(self.batch_sizes.elements())
+        histogram = Counter()
+        for size, count in self.batch_sizes.items():
+            histogram[f'<={1 << max(size - 1, 0).bit_length()}'] += count
+        return {
+            'rows_read': self.rows_read,
+            'rows_written': self.rows_written,
+            'rows_skipped_on_conflict': self.rows_skipped,
+            'rows_failed_decode': self.rows_failed_decode,
+            'rows_failed_save': self.rows_failed_save,
+            'rows_rejected': self.rows_rejected,
+            'seconds': round(seconds, 3),
+            'rows_per_second': round(self.rows_read / seconds, 1) if seconds else None,
+            'time': {
+                'sqlite_fetch': round(self.fetch_seconds, 3),
+                'decode': round(self.decode_seconds, 3),
+                'postgres_send': round(self.send_seconds, 3),
+                'postgres_commit': round(self.commit_seconds, 3),
+                'cpu': round(self.cpu_seconds, 3),
+            },
+            'peak_memory_bytes': self.peak_memory,
+            'batch_sizes': {
+                'count': len(sizes),
+                'min': sizes[0] if sizes else None,
+                'median': sizes[len(sizes) // 2] if sizes else None,
+                'max': sizes[-1] if sizes else None,
+                'histogram': dict(sorted(histogram.items(), key=lambda item: int(item[0][2:]))),
+            },
+        }
+
+
+class MigrationMetrics(PicklableLock):
+    """Метрики переноса по таблицам, общие для загрузчика, сохранятеля и потоков записи"""
+
+    def __init__(self):
+        self.tables: Dict[str, TableMetrics] = {}
+        self._lock = threading.Lock()
+
+    def record_fetch(self, table_name: str, rows: int, seconds: float):
+        with self._lock:
+            metrics = self._get(table_name)
+            metrics.rows_read += rows
+            metrics.fetch_seconds += seconds
+            metrics.touch()
+
+    def record_decode(self, table_name: str, rows: int, decoded: int, seconds: float):
+        with self._lock:
+            metrics = self._get(table_name)
+            metrics.rows_failed_decode += rows - decoded
+            metrics.decode_seconds += seconds
+            metrics.touch()
+
+    def record_save(self, table_name: str, rows: int, affected: int | None, seconds: float):
+        """affected - строк, вставленных сервером, или None, если пакет не сохранён"""
+        with self._lock:
+            metrics = self._get(table_name)
+            metrics.batch_sizes[rows] += 1
+            metrics.send_seconds += seconds
+            if affected is None:
+                metrics.rows_failed_save += rows
+            else:
+                metrics.rows_written += affected
+                metrics.rows_skipped += rows - affected
+            metrics.touch()
+
+    def record_rejected(self, table_name: str, rows: int):
+        """Строки, отсеянные до записи в Postgres, см. references.ReferenceFilter"""
+        with self._lock:
+            metrics = self._get(table_name)
+            metrics.rows_rejected += rows
+            metrics.touch()
+
+    def record_commit(self, table_name: str, seconds: float):
+        with self._lock:
+            metrics = self._get(table_name)
+            metrics.commit_seconds += seconds
+            metrics.touch()
+
+    @contextmanager
+    def track_table(self, table_name: str):
+        """Учесть процессорное время блока и, если запущен tracemalloc, пик памяти в нём
+
+        Процессорное время считается по всему процессу, поэтому точно только
+        когда процесс в это время переносит одну таблицу.
+        """
+        tracing = tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.reset_peak()
+        started = time.process_time()
+        try:
+            yield
+        finally:
+            cpu_seconds = time.process_time() - started
+            peak = tracemalloc.get_traced_memory()[1] if tracing else None
+            with self._lock:
+                metrics = self._get(table_name)
+                metrics.cpu_seconds += cpu_seconds
+                if peak is not None:
+                    metrics.peak_memory = max(metrics.peak_memory or 0, peak)
+
+    def rows_read(self, table_name: str) -> int:
+        with self._lock:
+            return self._get(table_name).rows_read
+
+    def merge(self, other: 'MigrationMetrics'):
+        """Добавить метрики, собранные в другом процессе"""
+        for table_name, metrics in other.tables.items():
+            with self._lock:
+                self._get(table_name).merge(metrics)
+
+    def report(self) -> dict:
+        with self._lock:
+            tables = {table_name: metrics.report() for table_name, metrics in self.tables.items()}
+            started = [m.started for m in self.tables.values() if m.started is not None]
+            finished = [m.finished for m in self.tables.values() if m.finished is not None]
+        seconds = max(finished) - min(started) if started else 0.0
+        rows = sum(table['rows_read'] for table in tables.values())
+        return {
+            'total': {
+                'rows_read': rows,
+                'rows_written': sum(table['rows_written'] for table in tables.values()),
+                'cpu_seconds': round(sum(table['time']['cpu'] for table in tables.values()), 3),
+                'seconds': round(seconds, 3),
+                'rows_per_second': round(rows / seconds, 1) if seconds else None,
+            },
+            'tables': tables,
+        }
+
+    def save_report(self, file_path: str):
+        with open(file_path, 'w', encoding='utf-8') as f:
+            json.dump(self.report(), f, ensure_ascii=False, indent=2)
+
+    def _get(self, table_name: str) -> TableMetrics:
+        # Сохранятель работает с именами вида content.<table>
+        table_name = table_name.split('.')[-1]
+        if table_name not in self.tables:
+            self.tables[table_name] = TableMetrics()
+        return self.tables[table_name]
+
+
+class ProgressReporter:
+    """Периодический вывод прогресса переноса с оценкой оставшегося времени
+
+    Использование:
+        with ProgressReporter(metrics, totals, interval=10):
+            ...
+    где totals - количество строк по таблицам (SQLiteLoader.get_table_row_count).
+    """
+
+    def __init__(self, metrics: MigrationMetrics, totals: Dict[str, int], interval: float = 10.0):
+        self.metrics = metrics
+        self.totals = totals
+        self.interval = interval
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._started = None
+
+    def __enter__(self):
+        self._started = time.monotonic()
+        self._thread.start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self._stop.set()
+        self._thread.join()
+
+    def log_progress(self):
+        done = {table_name: min(self.metrics.rows_read(table_name), total)
+                for table_name, total in self.totals.items()}
+        done_rows, total_rows = sum(done.values()), sum(self.totals.values())
+        elapsed = time.monotonic() - self._started
+        rate = done_rows / elapsed if elapsed else 0.0
+        eta = f'{(total_rows - done_rows) / rate:.0f} с' if rate else 'неизвестно'
+        tables = ', '.join(f'{table_name} {done[table_name]}/{total}' for table_name, total in self.totals.items())
+        logger.info(f"Прогресс: {done_rows}/{total_rows} строк, {rate:.0f} строк/с, осталось {eta} ({tables})")
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            self.log_progress()
@@ -0,0 +1,156 @@
+import contextlib
+import logging
+import sqlite3
+from dataclasses import dataclass
+from typing import Tuple
+
+import psycopg
+from psycopg import ClientCursor
+from psycopg.rows import dict_row
+
+from batching import AdaptiveBatchSizer
+from load_from_sqlite import KeyRangeScan, SQLiteLoader, connect_sqlite
+from save_to_postgres import PostgresSaver
+from metrics import MigrationMetrics
+from references import ReferenceFilter
+from dead_letter import DeadLetterFile
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Таблицы без внешних зависимостей и таблицы связей, которые грузятся после них
+ENTITY_TABLES = ('film_work', 'genre', 'person')
+LINK_TABLES = ('genre_film_work', 'person_film_work')
+TABLES = ENTITY_TABLES + LINK_TABLES
+
+# Поля, по которым контролируется уникальность при повторной загрузке
+CONFLICT_FIELDS = {'genre_film_work': 'genre_id, film_work_id',
+                   'person_film_work': 'person_id, film_work_id, role'}
+
+
+@dataclass
+class MigrationOptions:
+    """Общие настройки переноса, одинаковые для всех режимов"""
+    # Способ записи пакетов, один из PostgresSaver.SAVE_MODES
+    save_mode: str = 'copy'
+    # Разбирать строки через dataclass из models.py вместо RowCodec
+    validate: bool = False
+    # Подбор размера пакета, без него используется SQLiteLoader.batch_size
+    batch_sizer: AdaptiveBatchSizer = None
+    # Сбор метрик переноса
+    metrics: MigrationMetrics = None
+    # Писать в лог INFO о каждом пакете
+    log_batches: bool = True
+    # Ждать записи WAL на диск при каждом коммите; для первичной загрузки можно отключить
+    synchronous_commit: bool = True
+    # Отсеивать строки таблиц связей со ссылками на отсутствующие записи
+    check_references: bool = False
+    # Искать и отбрасывать битые строки в пакетах, которые не записались
+    isolate_failures: bool = False
+    # Файл JSON Lines для отсеянных и отброшенных строк, без него они только учитываются
+    rejects_path: str = None
+    # Открывать SQLite только на чтение с mmap и большим кэшем, см. connect_sqlite
+    sqlite_read_only: bool = False
+
+    def connect_sqlite(self, path: str, check_same_thread: bool = True) -> sqlite3.Connection:
+        return connect_sqlite(path, self.sqlite_read_only, check_same_thread)
+
+    def make_saver(self, pg_conn: psycopg.Connection, upsert: bool = False) -> PostgresSaver:
+        if not self.synchronous_commit:
+            # Отдельным коммитом, чтобы настройку сессии не отменил откат пакета
+            pg_conn.execute('SET synchronous_commit = off')
+            pg_conn.commit()
+        return PostgresSaver(pg_conn, **self._saver_options(upsert))
+
+    def make_async_saver(self, pg_conn: psycopg.AsyncConnection, upsert: bool = False) -> 'AsyncPostgresSaver':
+        """AsyncPostgresSaver с теми же настройками, что у make_saver
+
+        synchronous_commit асинхронным соединениям задаёт пул, см. async_migration.load_async.
+        """
+        # async_migration сам импортирует этот модуль
+        from async_migration import AsyncPostgresSaver
+        return AsyncPostgresSaver(pg_conn, **self._saver_options(upsert))
+
+    def make_loader(self, connection: sqlite3.Connection, postgres_saver: PostgresSaver) -> SQLiteLoader:
+        """Загрузчик, отдающий строки в том виде, который принимает postgres_saver"""
+        reference_filter = None
+        if self.check_references:
+            reference_filter = ReferenceFilter(connection, self._dead_letter(), self.metrics)
+        return SQLiteLoader(connection, self.validate, postgres_saver.text_uuids, self.metrics, self.log_batches,
+                            reference_filter)
+
+    def _saver_options(self, upsert: bool) -> dict:
+        return {'save_mode': self.save_mode, 'upsert': upsert, 'metrics': self.metrics,
+                'log_batches': self.log_batches, 'isolate_failures': self.isolate_failures,
+                'dead_letter': self._dead_letter()}
+
+    def _dead_letter(self) -> DeadLetterFile:
+        return DeadLetterFile(self.rejects_path) if self.rejects_path else None
+
+
+def connect_postgres(dsl: dict) -> psycopg.Connection:
+    """Подключение к Postgres с настройками, которые ожидает PostgresSaver"""
+    return psycopg.connect(**dsl, row_factory=dict_row, cursor_factory=ClientCursor)
+
+
+def migrate_table(sqlite_loader: SQLiteLoader, postgres_saver: PostgresSaver,
+                  table_name: str, rowid_range: Tuple[int, int] = None, since: str = None,
+                  batch_sizer: AdaptiveBatchSizer = None) -> int:
+    """Перенос одной таблицы (или диапазона rowid в ней) из SQLite в Postgres
+
+    Если передан batch_sizer, размер пакета подстраивается после каждой записи.
+
+    Returns:
+        Количество прочитанных из SQLite записей
+    """
+    rows = 0
+    column_names = sqlite_loader.get_columns(table_name)
+    if batch_sizer:
+        sqlite_loader.set_batch_size(batch_sizer.get_size(table_name))
+    metrics = sqlite_loader.metrics
+    with metrics.track_table(table_name) if metrics else contextlib.nullcontext():
+        for batch in sqlite_loader.load_rows(table_name, rowid_range, since):
+            postgres_saver.save_rows(batch, f'content.{table_name}', column_names,
+                                     CONFLICT_FIELDS.get(table_name, 'id'))
+            rows += len(batch)
+            adjust_batch_size(sqlite_loader, postgres_saver, table_name, batch_sizer)
+    return rows
+
+
+def migrate_scan(sqlite_loader: SQLiteLoader, postgres_saver: PostgresSaver, scan: KeyRangeScan,
+                 batch_sizer: AdaptiveBatchSizer = None) -> int:
+    """Перенос диапазона ключа таблицы с коммитом каждого пакета
+
+    После коммита пакета scan.last_key сдвигается на его последний ключ,
+    поэтому повторный вызов с тем же scan после сбоя продолжит с
+    несохранённого пакета. Пакет, откаченный postgres_saver, прерывает
+    перенос, не сдвигая last_key.
+
+    Returns:
+        Количество прочитанных из SQLite записей
+    """
+    rows = 0
+    table_name = scan.table_name
+    column_names = sqlite_loader.get_columns(table_name)
+    if batch_sizer:
+        sqlite_loader.set_batch_size(batch_sizer.get_size(table_name))
+    metrics = sqlite_loader.metrics
+    with metrics.track_table(table_name) if metrics else contextlib.nullcontext():
+        for last_key, batch in scan.batches(sqlite_loader):
+            failed_batches = postgres_saver.failed_batches
+            postgres_saver.save_rows(batch, f'content.{table_name}', column_names,
+                                     CONFLICT_FIELDS.get(table_name, 'id'))
+            postgres_saver.commit(table_name)
+            if postgres_saver.failed_batches != failed_batches:
+                raise RuntimeError(f'Пакет таблицы {table_name} после {scan.key} {scan.last_key} не сохранён')
+            scan.last_key = last_key
+            rows += len(batch)
+            adjust_batch_size(sqlite_loader, postgres_saver, table_name, batch_sizer)
+    return rows
+
+
+def adjust_batch_size(sqlite_loader: SQLiteLoader, postgres_saver: PostgresSaver, table_name: str,
+                      batch_sizer: AdaptiveBatchSizer = None):
+    """Передать замеры последнего сохранённого пакета в batch_sizer и применить новый размер"""
+    if batch_sizer and postgres_saver.last_batch_stats:
+        sqlite_loader.set_batch_size(batch_sizer.update(table_name, postgres_saver.last_batch_stats))
@@ -5,7 +5,7 @@ from dateutil import parser
 from dataclasses import dataclass, field
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class FilmWork:
     id: UUID
     title: str
@@ -19,13 +19,15 @@ class FilmWork:
     def __post_init__(self):
         if isinstance(self.id, str):
             object.__setattr__(self, 'id', UUID(self.id))
+        if isinstance(self.creation_date, str):
+            object.__setattr__(self, 'creation_date', datetime.date.fromisoformat(self.creation_date))
         if isinstance(self.created, str):
             object.__setattr__(self, 'created', parser.isoparse(self.created).replace(tzinfo=timezone.utc))
-        if isinstance(self.created, str):
+        if isinstance(self.modified, str):
             object.__setattr__(self, 'modified', parser.isoparse(self.modified).replace(tzinfo=timezone.utc))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Genre:
     id: UUID
     name: str
@@ -38,11 +40,11 @@ class Genre:
             object.__setattr__(self, 'id', UUID(self.id))
         if isinstance(self.created, str):
             object.__setattr__(self, 'created', parser.isoparse(self.created).replace(tzinfo=timezone.utc))
-        if isinstance(self.created, str):
+        if isinstance(self.modified, str):
             object.__setattr__(self, 'modified', parser.isoparse(self.modified).replace(tzinfo=timezone.utc))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class Person:
     id: UUID
     full_name: str
@@ -54,11 +56,11 @@ class Person:
             object.__setattr__(self, 'id', UUID(self.id))
         if isinstance(self.created, str):
             object.__setattr__(self, 'created', parser.isoparse(self.created).replace(tzinfo=timezone.utc))
-        if isinstance(self.created, str):
+        if isinstance(self.modified, str):
             object.__setattr__(self, 'modified', parser.isoparse(self.modified).replace(tzinfo=timezone.utc))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class GenreFilmWork:
     id: UUID
     genre_id: UUID
@@ -76,7 +78,7 @@ class GenreFilmWork:
             object.__setattr__(self, 'created', parser.isoparse(self.created).replace(tzinfo=timezone.utc))
 
 
-@dataclass
+@dataclass(frozen=True, slots=True)
 class PersonFilmWork:
     id: UUID
     person_id: UUID
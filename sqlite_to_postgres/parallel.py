@@ -0,0 +1,100 @@
+import logging
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from dataclasses import replace
+from typing import Any, Tuple
+
+from load_from_sqlite import KeyRangeScan, SQLiteLoader
+from metrics import MigrationMetrics
+from migration import ENTITY_TABLES, LINK_TABLES, MigrationOptions, connect_postgres, migrate_scan
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Таблицы, которые дополнительно делятся между процессами по диапазонам rowid
+PARTITIONED_TABLES = ('person_film_work',)
+# Сколько раз перезапускать задачу, завершившуюся ошибкой. Повтор продолжает
+# с первого незакоммиченного пакета её диапазона, см. KeyRangeScan
+TASK_RETRIES = 2
+
+
+class ScanInterrupted(Exception):
+    """Задача упала; last_key - ключ последнего закоммиченного ею пакета"""
+
+    def __init__(self, message: str, last_key: Any):
+        super().__init__(message)
+        self.last_key = last_key
+
+    def __reduce__(self):
+        # Исключение передаётся из процесса задачи pickle-ом вместе с last_key
+        return type(self), (self.args[0], self.last_key)
+
+
+def _migrate_table_task(sqlite_path: str, dsl: dict, options: MigrationOptions,
+                        scan: KeyRangeScan) -> Tuple[str, int, int, MigrationMetrics]:
+    """Задача процесса: своя пара SQLiteLoader/PostgresSaver на диапазон ключа таблицы
+
+    Пакеты коммитятся по одному (migrate_scan). Если задача упала, в
+    родительский процесс уходит ScanInterrupted с ключом, с которого её
+    можно продолжить.
+
+    Returns:
+        Имя таблицы, количество прочитанных записей, итоговый размер пакета и метрики задачи
+    """
+    # Копия options приходит в процесс вместе с уже собранными метриками, считаем только свои
+    options = replace(options, metrics=MigrationMetrics() if options.metrics else None)
+    with options.connect_sqlite(sqlite_path) as sqlite_conn, connect_postgres(dsl) as pg_conn:
+        postgres_saver = options.make_saver(pg_conn)
+        sqlite_loader = options.make_loader(sqlite_conn, postgres_saver)
+        try:
+            rows = migrate_scan(sqlite_loader, postgres_saver, scan, options.batch_sizer)
+        except Exception as e:
+            raise ScanInterrupted(str(e), scan.last_key) from e
+    return scan.table_name, rows, sqlite_loader.batch_size, options.metrics
+
+
+def load_parallel(sqlite_path: str, dsl: dict, workers: int, options: MigrationOptions = None):
+    """Параллельный перенос таблиц в пуле процессов
+
+    Сначала параллельно переносятся film_work, genre и person, затем,
+    когда родительские записи закоммичены, - таблицы связей. Каждая задача
+    читает свой диапазон rowid через KeyRangeScan, таблицы из
+    PARTITIONED_TABLES делятся на workers диапазонов с равным числом строк
+    (SQLiteLoader.plan_scans). Упавшая задача перезапускается отдельно от
+    остальных до TASK_RETRIES раз и продолжает с первого незакоммиченного
+    пакета. Размер пакета и метрики каждый процесс собирает в своей копии
+    options, итог переносится в переданный объект.
+    """
+    options = options or MigrationOptions()
+    with options.connect_sqlite(sqlite_path) as sqlite_conn:
+        planner = SQLiteLoader(sqlite_conn)
+        tasks = {table_name: planner.plan_scans(table_name, workers if table_name in PARTITIONED_TABLES else 1)
+                 for table_name in ENTITY_TABLES + LINK_TABLES}
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for stage in (ENTITY_TABLES, LINK_TABLES):
+            futures = {executor.submit(_migrate_table_task, sqlite_path, dsl, options, scan): (scan, 0)
+                       for table_name in stage for scan in tasks[table_name]}
+            # Задачи разбираются по мере завершения, упавшая перезапускается сразу
+            while futures:
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    scan, attempt = futures.pop(future)
+                    try:
+                        table_name, rows, batch_size, metrics = future.result()
+                    except Exception as e:
+                        if attempt >= TASK_RETRIES:
+                            raise
+                        if isinstance(e, ScanInterrupted):
+                            scan = replace(scan, last_key=e.last_key)
+                        logger.warning(f"Задача по таблице {scan.table_name} ({scan.key} {scan.low}-{scan.high}) "
+                                       f"упала: {e}, перезапуск после {scan.key} {scan.last_key}")
+                        futures[executor.submit(_migrate_table_task, sqlite_path, dsl, options, scan)] = \
+                            (scan, attempt + 1)
+                        continue
+                    if options.batch_sizer:
+                        options.batch_sizer.set_size(table_name, batch_size)
+                    if options.metrics:
+                        options.metrics.merge(metrics)
+                    logger.info(f"Задача по таблице {table_name} завершена, прочитано {rows} записей")
+
+    logger.info('Данные из sqlite загружены в postgres')
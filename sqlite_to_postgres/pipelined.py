@@ -0,0 +1,97 @@
+import logging
+import queue
+import sqlite3
+import threading
+
+from batching import AdaptiveBatchSizer
+from load_from_sqlite import SQLiteLoader
+from save_to_postgres import PostgresSaver
+from migration import TABLES, CONFLICT_FIELDS, MigrationOptions, connect_postgres
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _writer(batches: queue.Queue, sizes: queue.Queue, postgres_saver: PostgresSaver,
+            batch_sizer: AdaptiveBatchSizer, errors: list):
+    """Поток записи: забирает готовые пакеты из очереди и сохраняет их в Postgres
+
+    Новый размер пакета, подобранный batch_sizer, уходит читателю через sizes:
+    SQLiteLoader принадлежит потоку чтения, и тот применит размер к следующему fetchmany.
+    """
+    while (item := batches.get()) is not None:
+        table_name, column_names, batch = item
+        try:
+            if not errors:
+                postgres_saver.save_rows(batch, f'content.{table_name}', column_names,
+                                         CONFLICT_FIELDS.get(table_name, 'id'))
+                if batch_sizer and postgres_saver.last_batch_stats:
+                    sizes.put((table_name, batch_sizer.update(table_name, postgres_saver.last_batch_stats)))
+        except Exception as e:
+            errors.append(e)
+        finally:
+            batches.task_done()
+    batches.task_done()
+
+
+def _apply_batch_size(sizes: queue.Queue, sqlite_loader: SQLiteLoader, table_name: str):
+    """Применить последний размер пакета, подобранный потоками записи для table_name"""
+    while True:
+        try:
+            size_table, size = sizes.get_nowait()
+        except queue.Empty:
+            return
+        if size_table == table_name:
+            sqlite_loader.set_batch_size(size)
+
+
+def load_pipelined(connection: sqlite3.Connection, dsl: dict, writers: int = 2, queue_size: int = 4,
+                   options: MigrationOptions = None):
+    """Перенос с одновременным чтением из SQLite и записью в Postgres
+
+    Вызывающий поток читает пакеты и кладет их в ограниченную очередь,
+    потоки записи (каждый со своим соединением) сохраняют их в Postgres.
+    Если запись отстает, чтение блокируется на заполненной очереди, поэтому
+    в памяти одновременно не больше queue_size + writers пакетов.
+    Таблицы переносятся по очереди: перед следующей таблицей очередь
+    дочитывается и транзакции всех потоков записи коммитятся, чтобы таблицы
+    связей видели родительские записи.
+    """
+    options = options or MigrationOptions()
+    batches = queue.Queue(maxsize=queue_size)
+    sizes = queue.Queue()
+    errors = []
+    pg_conns = [connect_postgres(dsl) for _ in range(writers)]
+    savers = [options.make_saver(pg_conn) for pg_conn in pg_conns]
+    sqlite_loader = options.make_loader(connection, savers[0])
+    threads = [threading.Thread(target=_writer,
+                                args=(batches, sizes, postgres_saver, options.batch_sizer, errors),
+                                daemon=True)
+               for postgres_saver in savers]
+    for thread in threads:
+        thread.start()
+
+    try:
+        for table_name in TABLES:
+            column_names = sqlite_loader.get_columns(table_name)
+            if options.batch_sizer:
+                sqlite_loader.set_batch_size(options.batch_sizer.get_size(table_name))
+            for batch in sqlite_loader.load_rows(table_name):
+                if errors:
+                    break
+                batches.put((table_name, column_names, batch))
+                _apply_batch_size(sizes, sqlite_loader, table_name)
+            batches.join()
+            if errors:
+                raise errors[0]
+            for postgres_saver in savers:
+                postgres_saver.commit(table_name)
+    finally:
+        for _ in threads:
+            batches.put(None)
+        for thread in threads:
+            thread.join()
+        for pg_conn in pg_conns:
+            pg_conn.close()
+
+    logger.info('Данные из sqlite загружены в postgres')
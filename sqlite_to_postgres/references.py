@@ -0,0 +1,160 @@
+import heapq
+import logging
+import sqlite3
+import threading
+from array import array
+from bisect import bisect_left
+from typing import Dict, Iterable, Iterator, List
+from uuid import UUID
+
+from dead_letter import DeadLetterFile
+from metrics import MigrationMetrics
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Внешние ключи таблиц связей: колонка -> родительская таблица
+REFERENCES = {
+    'genre_film_work': {'film_work_id': 'film_work', 'genre_id': 'genre'},
+    'person_film_work': {'film_work_id': 'film_work', 'person_id': 'person'},
+}
+
+
+def _uuid_int(value) -> int:
+    # Для строк в несколько раз быстрее, чем UUID(value).int; ValueError, если это не UUID
+    if isinstance(value, UUID):
+        return value.int
+    digits = value.replace('-', '')
+    if len(digits) != 32:
+        raise ValueError(f'Не UUID: {value}')
+    return int(digits, 16)
+
+
+class IdSet:
+    """Компактное множество UUID: два отсортированных массива старших и младших 64 бит
+
+    16 байт на id вместо сотни с лишним у set строк или объектов UUID,
+    поиск - двоичный по старшей половине. Строится из отсортированных
+    порций по RUN_SIZE id, которые затем сливаются heapq.merge, так что
+    кроме самих массивов в памяти держится только одна порция.
+    """
+
+    RUN_SIZE = 1_000_000
+
+    def __init__(self):
+        self._high = array('Q')
+        self._low = array('Q')
+
+    @classmethod
+    def from_ids(cls, ids: Iterable) -> 'IdSet':
+        """Множество из UUID или их строк в любом порядке, строки не в формате UUID пропускаются"""
+        runs, run = [], []
+        for value in ids:
+            try:
+                run.append(_uuid_int(value))
+            except (ValueError, AttributeError):
+                continue
+            if len(run) == cls.RUN_SIZE:
+                runs.append(cls._pack(run))
+                run = []
+        if run:
+            runs.append(cls._pack(run))
+
+        id_set = cls()
+        previous = None
+        for value in heapq.merge(*(cls._unpack(high, low) for high, low in runs)):
+            if value != previous:
+                id_set._high.append(value >> 64)
+                id_set._low.append(value & 0xFFFFFFFFFFFFFFFF)
+                previous = value
+        return id_set
+
+    @staticmethod
+    def _pack(run: List[int]):
+        run.sort()
+        return array('Q', (value >> 64 for value in run)), array('Q', (value & 0xFFFFFFFFFFFFFFFF for value in run))
+
+    @staticmethod
+    def _unpack(high: array, low: array) -> Iterator[int]:
+        return ((h << 64) | l for h, l in zip(high, low))
+
+    def __contains__(self, value) -> bool:
+        try:
+            value = _uuid_int(value)
+        except (ValueError, AttributeError):
+            return False
+        high, low = value >> 64, value & 0xFFFFFFFFFFFFFFFF
+        i = bisect_left(self._high, high)
+        while i < len(self._high) and self._high[i] == high:
+            if self._low[i] == low:
+                return True
+            i += 1
+        return False
+
+    def __len__(self) -> int:
+        return len(self._high)
+
+    @property
+    def nbytes(self) -> int:
+        return (len(self._high) + len(self._low)) * self._high.itemsize
+
+
+class ReferenceFilter:
+    """Отсев строк таблиц связей, ссылающихся на отсутствующие фильмы, жанры или персон
+
+    Без проверки такая строка вызывает ForeignKeyViolation в Postgres, и
+    PostgresSaver откатывает весь пакет вместе с корректными строками.
+    id родительских таблиц один раз читаются из SQLite в IdSet при первом
+    обращении к таблице связей. Отсеянные строки с именами колонок с битыми
+    ссылками пишутся в dead_letter или, если он не задан, только учитываются.
+    """
+
+    def __init__(self, conn: sqlite3.Connection, dead_letter: DeadLetterFile = None,
+                 metrics: MigrationMetrics = None):
+        self.conn = conn
+        self.dead_letter = dead_letter
+        self.metrics = metrics
+        # Количество отсеянных строк по таблицам
+        self.rejected: Dict[str, int] = {}
+        self._id_sets: Dict[str, IdSet] = {}
+        self._lock = threading.Lock()
+
+    def get_id_set(self, table_name: str) -> IdSet:
+        with self._lock:
+            if table_name not in self._id_sets:
+                cursor = self.conn.cursor()
+                cursor.execute(f'SELECT id FROM {table_name}')
+                id_set = IdSet.from_ids(row[0] for batch in iter(lambda: cursor.fetchmany(10_000), [])
+                                        for row in batch)
+                logger.info(f"Загружено {len(id_set)} id таблицы {table_name} "
+                            f"({id_set.nbytes / 2 ** 20:.1f} МиБ) для проверки ссылок")
+                self._id_sets[table_name] = id_set
+            return self._id_sets[table_name]
+
+    def filter_rows(self, table_name: str, column_names: List[str], rows: List[tuple]) -> List[tuple]:
+        """Строки пакета, все ссылки которых существуют; для таблиц без ссылок пакет как есть"""
+        references = REFERENCES.get(table_name)
+        if not references:
+            return rows
+        checks = [(column_names.index(column), self.get_id_set(parent_table))
+                  for column, parent_table in references.items()]
+
+        valid, rejects = [], []
+        for row in rows:
+            broken = [column_names[i] for i, id_set in checks if row[i] is None or row[i] not in id_set]
+            if broken:
+                rejects.append((row, {'columns': broken}))
+            else:
+                valid.append(row)
+        if rejects:
+            self._reject(table_name, column_names, rejects)
+        return valid
+
+    def _reject(self, table_name: str, column_names: List[str], rejects: list):
+        with self._lock:
+            self.rejected[table_name] = self.rejected.get(table_name, 0) + len(rejects)
+        if self.dead_letter:
+            self.dead_letter.write(table_name, column_names, rejects, 'missing_reference')
+        if self.metrics:
+            self.metrics.record_rejected(table_name, len(rejects))
+        logger.warning(f"Отсеяно {len(rejects)} строк {table_name} со ссылками на отсутствующие записи")
@@ -0,0 +1,49 @@
+import logging
+import sqlite3
+
+from psycopg import connection as _connection
+
+from migration import TABLES, CONFLICT_FIELDS, MigrationOptions, adjust_batch_size
+from state import State
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def load_resumable(connection: sqlite3.Connection, pg_conn: _connection, state: State,
+                   options: MigrationOptions = None):
+    """Перенос с контрольными точками, который продолжается с места падения
+
+    Таблицы читаются по ключу (WHERE rowid > ? ORDER BY rowid), каждый пакет
+    коммитится отдельно, после чего его последний rowid записывается в state.
+    Повторный запуск после сбоя продолжает с сохранённых rowid. После
+    успешного переноса всех таблиц контрольные точки сбрасываются. Если
+    пакет не записался, контрольная точка остаётся на последнем сохранённом
+    пакете и перенос останавливается.
+    """
+    options = options or MigrationOptions()
+    postgres_saver = options.make_saver(pg_conn)
+    sqlite_loader = options.make_loader(connection, postgres_saver)
+    checkpoints = state.get_state('checkpoints', {})
+    if checkpoints:
+        logger.info(f"Продолжение переноса с контрольных точек: {checkpoints}")
+
+    for table_name in TABLES:
+        column_names = sqlite_loader.get_columns(table_name)
+        if options.batch_sizer:
+            sqlite_loader.set_batch_size(options.batch_sizer.get_size(table_name))
+        for batch in sqlite_loader.load_rows(table_name, after_rowid=checkpoints.get(table_name, 0)):
+            failed_batches = postgres_saver.failed_batches
+            postgres_saver.save_rows(batch, f'content.{table_name}', column_names,
+                                     CONFLICT_FIELDS.get(table_name, 'id'))
+            postgres_saver.commit(table_name)
+            if postgres_saver.failed_batches != failed_batches:
+                logger.error(f"Пакет таблицы {table_name} не сохранён, контрольная точка остаётся "
+                             f"на rowid {checkpoints.get(table_name, 0)}")
+                raise RuntimeError(f'Перенос таблицы {table_name} прерван на несохранённом пакете')
+            adjust_batch_size(sqlite_loader, postgres_saver, table_name, options.batch_sizer)
+            checkpoints[table_name] = sqlite_loader.last_rowid
+            state.set_state('checkpoints', checkpoints)
+
+    state.set_state('checkpoints', {})
+    logger.info('Данные из sqlite загружены в postgres')
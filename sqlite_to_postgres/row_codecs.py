@@ -0,0 +1,70 @@
+import datetime
+from dataclasses import fields
+from datetime import timezone
+from typing import Callable, List, Tuple, get_args
+from uuid import UUID
+
+
+def _parse_datetime(value):
+    if value is None:
+        return None
+    return datetime.datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+
+
+def _parse_date(value):
+    if value is None:
+        return None
+    return datetime.date.fromisoformat(value)
+
+
+def _parse_uuid(value):
+    if value is None:
+        return None
+    return UUID(value)
+
+
+def _field_type(annotation):
+    """Основной тип поля без учета None в аннотациях вида date | None"""
+    args = [arg for arg in get_args(annotation) if arg is not type(None)]
+    return args[0] if args else annotation
+
+
+class RowCodec:
+    """Преобразование строки SQLite сразу в кортеж для записи в Postgres
+
+    Делает то же, что dataclass из models.py с последующим astuple, но без
+    промежуточного словаря, объекта и __post_init__: для таблицы один раз
+    генерируется функция, которая разбирает только колонки с датами и
+    (если нужно) UUID. Колонки берутся в порядке полей dataclass, лишние
+    колонки строки в конце игнорируются.
+    """
+
+    def __init__(self, object_class: type, uuid_as_text: bool = False):
+        """
+        Args:
+            object_class: dataclass из models.py, задающий состав и типы колонок
+            uuid_as_text: Оставлять UUID строками - подходит, если Postgres
+                получает значения в текстовом виде (режим insert), но не для бинарного COPY
+        """
+        self.columns: List[str] = [f.name for f in fields(object_class)]
+        converters = {datetime.datetime: _parse_datetime, datetime.date: _parse_date}
+        if not uuid_as_text:
+            converters[UUID] = _parse_uuid
+
+        namespace = {}
+        items = []
+        for i, f in enumerate(fields(object_class)):
+            converter = converters.get(_field_type(f.type))
+            if converter is None:
+                items.append(f'row[{i}]')
+            else:
+                namespace[converter.__name__] = converter
+                items.append(f'{converter.__name__}(row[{i}])')
+        source = f"def decode(row):\n    return ({', '.join(items)},)\n"
+        exec(source, namespace)
+        self.decode: Callable[[tuple], Tuple] = namespace['decode']
+
+    def decode_batch(self, batch: List[tuple]) -> List[Tuple]:
+        """Преобразование пакета строк"""
+        decode = self.decode
+        return [decode(row) for row in batch]
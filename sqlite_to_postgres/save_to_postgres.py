@@ -1,20 +1,159 @@
 import psycopg
 import logging
+import sys
+import time
+from contextlib import contextmanager
 from psycopg import errors as pg_errors
+from psycopg.rows import tuple_row
 from models import FilmWork, Person, Genre, GenreFilmWork, PersonFilmWork
-from typing import List
-from dataclasses import fields, astuple
+from batching import BatchStats
+from metrics import MigrationMetrics
+from dead_letter import DeadLetterFile
+from operator import attrgetter
+from typing import Iterable, List, Tuple
+from dataclasses import fields
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 
-class PostgresSaver:
+class BasePostgresSaver:
+    """Настройки, тексты запросов и учёт пакетов, общие для синхронной и асинхронной записи
 
-    def __init__(self, conn):
-        self.conn: psycopg.connection = conn
+    Сами запросы выполняют наследники: PostgresSaver через обычное
+    соединение, async_migration.AsyncPostgresSaver - через AsyncConnection.
+    """
+    # insert - один INSERT ... VALUES на пакет, copy - COPY в промежуточную таблицу,
+    # pipeline - подготовленный INSERT на каждую строку через executemany в режиме конвейера
+    SAVE_MODES = ('insert', 'copy', 'pipeline')
+    # Ошибки, которые зависят не от данных: при них пакет не делится в режиме isolate_failures
+    NOT_ISOLATED_ERRORS = (pg_errors.OperationalError, pg_errors.InterfaceError,
+                           pg_errors.DeadlockDetected, pg_errors.SerializationFailure)
+    COLUMN_TYPES_QUERY = """SELECT attname, format_type(atttypid, atttypmod)
+            FROM pg_attribute
+            WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped"""
+
+    def __init__(self, conn, save_mode: str = 'copy', upsert: bool = False,
+                 metrics: MigrationMetrics = None, log_batches: bool = True,
+                 isolate_failures: bool = False, dead_letter: DeadLetterFile = None):
+        """
+        Args:
+            conn: Соединение с Postgres
+            save_mode: Способ записи пакетов, один из SAVE_MODES
+            upsert: Обновлять уже существующие записи (ON CONFLICT DO UPDATE) вместо пропуска
+            metrics: Куда записывать время записи и коммитов, вставленные и пропущенные строки
+            log_batches: Писать в лог INFO о каждом сохранённом пакете
+            isolate_failures: Если пакет не записался, искать битые строки делением
+                пакета пополам и сохранять остальные, см. PostgresSaver._save_isolated
+            dead_letter: Куда записывать строки, отброшенные в режиме isolate_failures
+        """
+        if save_mode not in self.SAVE_MODES:
+            raise ValueError(f"Неизвестный режим сохранения - {save_mode}")
+        self.conn = conn
         self.cursor = self.conn.cursor()
+        self.save_mode = save_mode
+        self.upsert = upsert
+        self.metrics = metrics
+        self.log_batches = log_batches
+        self.isolate_failures = isolate_failures
+        self.dead_letter = dead_letter
+        # Количество пакетов, которые не удалось сохранить и которые были откачены
+        self.failed_batches = 0
+        # Количество строк, отброшенных в режиме isolate_failures
+        self.rejected_rows = 0
+        # Время записи и примерный объём последнего пакета, см. AdaptiveBatchSizer
+        self.last_batch_stats = None
+        self._column_types = {}
+
+    @property
+    def text_uuids(self) -> bool:
+        """Можно ли передавать UUID строками (для бинарного COPY и режима pipeline нужны объекты UUID)"""
+        return self.save_mode == 'insert'
+
+    def _batch_saved(self, rows: List[tuple], table_name: str, affected: int | None,
+                     seconds: float, rejected: int):
+        """Учёт записанного пакета: замеры для AdaptiveBatchSizer, метрики и лог"""
+        self.last_batch_stats = BatchStats(len(rows), seconds, self._estimate_size(rows))
+        if self.metrics:
+            self.metrics.record_save(table_name, len(rows) - rejected, affected, seconds)
+
+        if self.log_batches:
+            logger.info(f"Успешно сохранено {len(rows)} записей в таблицу {table_name}")
+
+    def _batch_failed(self, error: Exception):
+        """Учёт пакета, который не удалось сохранить и который был откачен"""
+        self.failed_batches += 1
+        if isinstance(error, pg_errors.DeadlockDetected):
+            logger.warning(f"Обнаружена взаимная блокировка")
+        elif isinstance(error, pg_errors.UniqueViolation):
+            logger.warning(f"Нарушение уникальности: {error}")
+        elif isinstance(error, pg_errors.ForeignKeyViolation):
+            logger.error(f"Нарушение внешнего ключа: {error}")
+        elif isinstance(error, (pg_errors.OperationalError, pg_errors.InterfaceError)):
+            logger.error(f"Ошибка соединения")
+        else:
+            logger.error(f"Неожиданная ошибка при сохранении пакета: {error}")
+
+    @staticmethod
+    def _estimate_size(rows: List[tuple], sample: int = 20) -> int:
+        """Примерный объём пакета в памяти по нескольким первым строкам"""
+        sample_rows = rows[:sample]
+        sample_size = sum(sys.getsizeof(row) + sum(sys.getsizeof(value) for value in row)
+                          for row in sample_rows)
+        return sample_size * len(rows) // len(sample_rows)
+
+    def _reject(self, table_name: str, column_names: List[str], row: tuple, error: Exception):
+        logger.warning(f"Строка не сохранена в {table_name}: {error}")
+        self.rejected_rows += 1
+        if self.dead_letter:
+            self.dead_letter.write(table_name.split('.')[-1], column_names, [(row, {'error': str(error).strip()})],
+                                   'save_error')
+        if self.metrics:
+            self.metrics.record_rejected(table_name, 1)
+
+    def _insert_query(self, table_name: str, column_names: List[str], conflict_col: str,
+                      bind_values: str) -> str:
+        """INSERT ... VALUES с уже подставленными значениями строк bind_values"""
+        column_names_str = ','.join(column_names)
+        return (f"""INSERT INTO {table_name} ({column_names_str})
+                VALUES {bind_values}
+                {self._conflict_action(column_names, conflict_col)}""")
+
+    def _prepared_query(self, table_name: str, column_names: List[str], conflict_col: str) -> str:
+        """INSERT одной строки с бинарными параметрами: текст запроса одинаков для всех пакетов таблицы"""
+        return self._insert_query(table_name, column_names, conflict_col,
+                                  f"({', '.join(['%b'] * len(column_names))})")
+
+    def _copy_queries(self, table_name: str, column_names: List[str],
+                      conflict_col: str) -> Tuple[str, str, str]:
+        """Запросы режима copy: создание промежуточной таблицы, COPY в неё и перенос в table_name"""
+        column_names_str = ','.join(column_names)
+        staging_table = self._staging_table(table_name)
+        # Временная таблица живет до конца сессии, но пропадает при откате транзакции
+        create = f"""CREATE TEMP TABLE IF NOT EXISTS {staging_table}
+                (LIKE {table_name} INCLUDING DEFAULTS) ON COMMIT DELETE ROWS"""
+        copy = f"COPY {staging_table} ({column_names_str}) FROM STDIN (FORMAT BINARY)"
+        insert = f"""INSERT INTO {table_name} ({column_names_str})
+                SELECT {column_names_str} FROM {staging_table}
+                {self._conflict_action(column_names, conflict_col)}"""
+        return create, copy, insert
+
+    @staticmethod
+    def _staging_table(table_name: str) -> str:
+        return f"staging_{table_name.split('.')[-1]}"
+
+    def _conflict_action(self, column_names: List[str], conflict_col: str) -> str:
+        """Секция ON CONFLICT: пропуск существующих записей или их обновление"""
+        if not self.upsert:
+            return f"ON CONFLICT ({conflict_col}) DO NOTHING"
+        conflict_columns = {col.strip() for col in conflict_col.split(',')}
+        update_columns = [col for col in column_names if col not in conflict_columns and col != 'id']
+        set_str = ', '.join(f"{col} = EXCLUDED.{col}" for col in update_columns)
+        return f"ON CONFLICT ({conflict_col}) DO UPDATE SET {set_str}"
+
+
+class PostgresSaver(BasePostgresSaver):
 
     def close_connection(self):
         self.conn.close()
@@ -23,12 +162,18 @@ class PostgresSaver:
         """Получение количества строк в таблице"""
         try:
             query = f"SELECT COUNT(*) as count FROM {table_name}"
-            result = self.cursor.execute(query)
-            return result[0]['count'] if result else 0
+            return self.conn.cursor(row_factory=tuple_row).execute(query).fetchone()[0]
         except Exception as e:
             logger.error(f"Ошибка при получении количества строк в таблице {table_name}: {e}")
             return 0
 
+    def commit(self, table_name: str):
+        """Коммит транзакции с учётом его времени в метриках таблицы table_name"""
+        started = time.perf_counter()
+        self.conn.commit()
+        if self.metrics:
+            self.metrics.record_commit(table_name, time.perf_counter() - started)
+
     def save_data(self, batch: List[FilmWork | Person | Genre],
                   table_name: str, conflict_col: str = 'id'):
         """Сохранение данных в таблицы пачками с обработкой ошибок
@@ -42,57 +187,209 @@ class PostgresSaver:
         if not batch:
             logger.info("Нет данных для сохранения")
             return
-        
-        try:
-            column_names = [field.name for field in fields(batch[0])]
-            column_names_str = ','.join(column_names)
-            col_count = ', '.join(['%s'] * len(column_names))
 
-            self._save_batch(batch, table_name, column_names_str, col_count, conflict_col)
+        column_names = [field.name for field in fields(batch[0])]
+        getter = attrgetter(*column_names)
+        self.save_rows([getter(item) for item in batch], table_name, column_names, conflict_col)
+
+    def save_rows(self, rows: List[tuple], table_name: str, column_names: List[str],
+                  conflict_col: str = 'id'):
+        """Сохранение готовых кортежей (см. SQLiteLoader.load_rows) пачками с обработкой ошибок
 
-            logger.info(f"Успешно сохранено {len(batch)} записей в таблицу {table_name}")
+        Args:
+            rows: Список кортежей со значениями в порядке column_names
+            table_name: Имя таблицы
+            column_names: список наименований колонок
+            conflict_col: Поля, по которым происходит контроль уникальности
+        """
+
+        if not rows:
+            logger.info("Нет данных для сохранения")
+            return
+
+        self.last_batch_stats = None
+        try:
+            started = time.perf_counter()
+            rejected_before = self.rejected_rows
+            affected = self._save_batch(rows, table_name, column_names, conflict_col)
+            self._batch_saved(rows, table_name, affected, time.perf_counter() - started,
+                              self.rejected_rows - rejected_before)
 
         except Exception as e:
             logger.error(f"Критическая ошибка при сохранении данных: {e}")
             raise
 
-    def _save_batch(self, batch: List[FilmWork | Person | Genre], table_name: str, 
-                    column_names_str: str, col_count: str, conflict_col: str):
-        """Сохранение одного пакета данных
+    def save_copy_data(self, data: Iterable[bytes], rows: int, table_name: str, column_names: List[str],
+                       conflict_col: str = 'id'):
+        """Сохранение готовых данных бинарного COPY (см. snapshot.export_snapshot) через промежуточную таблицу
+
+        Данные передаются серверу как есть. В отличие от save_rows, ошибка
+        не перехватывается: после отката точки сохранения она уходит наружу,
+        искать битые строки в готовом потоке байтов нельзя.
 
         Args:
-            batch: Список объектов для сохранения
+            data: Части потока COPY, включая заголовок и завершающий маркер
+            rows: Количество строк в потоке, для метрик и лога
             table_name: Имя таблицы
-            column_names_str: строка со списком наименований колонок
-            col_count: строка с %S
+            column_names: Колонки в порядке полей потока
             conflict_col: Поля, по которым происходит контроль уникальности
         """
-        try:
-            bind_values = ','.join(self.cursor.mogrify(f"({col_count})", astuple(item)) for item in batch)
+        started = time.perf_counter()
+        create, copy_query, insert = self._copy_queries(table_name, column_names, conflict_col)
+        with self._savepoint():
+            self.cursor.execute(create)
+            with self.cursor.copy(copy_query) as copy:
+                for chunk in data:
+                    copy.write(chunk)
+            self.cursor.execute(insert)
+            affected = self.cursor.rowcount
+        self.cursor.execute(f"TRUNCATE {self._staging_table(table_name)}")
+        if self.metrics:
+            self.metrics.record_save(table_name, rows, affected, time.perf_counter() - started)
+        if self.log_batches:
+            logger.info(f"Успешно сохранено {rows} записей в таблицу {table_name}")
 
-            query = (f"""INSERT INTO {table_name} ({column_names_str}) 
-                    VALUES {bind_values} 
-                    ON CONFLICT ({conflict_col}) DO NOTHING""")
+    def _save_batch(self, batch: List[tuple], table_name: str,
+                    column_names: List[str], conflict_col: str):
+        """Сохранение одного пакета данных
 
-            self.cursor.execute(query)
+        Args:
+            batch: Список кортежей для сохранения
+            table_name: Имя таблицы
+            column_names: список наименований колонок
+            conflict_col: Поля, по которым происходит контроль уникальности
+
+        Пакет пишется внутри точки сохранения, поэтому ошибка откатывает
+        только его, а не ранее записанные в той же транзакции пакеты.
+
+        Returns:
+            Количество вставленных (или обновлённых) строк, None если пакет не сохранён
+        """
+        try:
+            if self.isolate_failures:
+                affected = self._save_isolated(batch, table_name, column_names, conflict_col)
+            else:
+                with self._savepoint():
+                    affected = self._write_batch(batch, table_name, column_names, conflict_col)
+                self._clear_staging(table_name)
             logger.debug(f"Сохранен пакет из {len(batch)} записей в {table_name}")
+            return affected
 
-        except pg_errors.DeadlockDetected:
-            logger.warning(f"Обнаружена взаимная блокировка")
-            self.conn.rollback()
+        except Exception as e:
+            self._batch_failed(e)
 
-        except pg_errors.UniqueViolation as e:
-            logger.warning(f"Нарушение уникальности: {e}")
-            self.conn.rollback()
+    def _save_isolated(self, batch: List[tuple], table_name: str,
+                       column_names: List[str], conflict_col: str) -> int:
+        """Запись пакета с поиском битых строк делением пополам
 
-        except pg_errors.ForeignKeyViolation as e:
-            logger.error(f"Нарушение внешнего ключа: {e}")
-            self.conn.rollback()
-        
-        except (pg_errors.OperationalError, pg_errors.InterfaceError) as e:
-            logger.error(f"Ошибка соединения")
-            
+        Если пакет не записался, каждая половина пробуется в своей точке
+        сохранения, и так далее до отдельных строк: k битых строк находятся
+        за O(k log n) запросов, остальные строки сохраняются, а битые
+        уходят в dead_letter. Ошибки соединения и взаимные блокировки
+        зависят не от данных, поэтому пакет при них целиком считается несохранённым.
+
+        Returns:
+            Количество вставленных (или обновлённых) строк
+        """
+        try:
+            with self._savepoint():
+                affected = self._write_batch(batch, table_name, column_names, conflict_col)
+            self._clear_staging(table_name)
+            return affected
+        except self.NOT_ISOLATED_ERRORS:
+            raise
         except Exception as e:
-            logger.error(f"Неожиданная ошибка при сохранении пакета: {e}")
-            self.conn.rollback()
+            if len(batch) == 1:
+                self._reject(table_name, column_names, batch[0], e)
+                return 0
+            middle = len(batch) // 2
+            return (self._save_isolated(batch[:middle], table_name, column_names, conflict_col)
+                    + self._save_isolated(batch[middle:], table_name, column_names, conflict_col))
+
+    @contextmanager
+    def _savepoint(self):
+        """Точка сохранения внутри текущей транзакции (открывает её, если нужно)"""
+        self.cursor.execute('SAVEPOINT batch')
+        try:
+            yield
+        except BaseException:
+            # После обрыва соединения откатывать нечего, наружу уходит исходная ошибка
+            if not self.conn.broken:
+                self.cursor.execute('ROLLBACK TO SAVEPOINT batch')
+            raise
+        self.cursor.execute('RELEASE SAVEPOINT batch')
+
+    def _write_batch(self, batch: List[tuple], table_name: str,
+                     column_names: List[str], conflict_col: str) -> int:
+        if self.save_mode == 'copy':
+            return self._copy_batch(batch, table_name, column_names, conflict_col)
+        if self.save_mode == 'pipeline':
+            return self._pipeline_batch(batch, table_name, column_names, conflict_col)
+        return self._insert_batch(batch, table_name, column_names, conflict_col)
+
+    def _insert_batch(self, batch: List[tuple], table_name: str,
+                      column_names: List[str], conflict_col: str) -> int:
+        """Сохранение пакета одним запросом INSERT ... VALUES"""
+        col_count = ', '.join(['%s'] * len(column_names))
+        bind_values = ','.join(self.cursor.mogrify(f"({col_count})", row) for row in batch)
+
+        self.cursor.execute(self._insert_query(table_name, column_names, conflict_col, bind_values))
+        return self.cursor.rowcount
+
+    def _pipeline_batch(self, batch: List[tuple], table_name: str,
+                        column_names: List[str], conflict_col: str) -> int:
+        """Сохранение пакета подготовленным INSERT в режиме конвейера
+
+        ClientCursor соединения подставляет значения в текст запроса сам,
+        поэтому здесь нужен обычный курсор с параметрами на сервере. После
+        prepare_threshold выполнений psycopg готовит запрос (PREPARE) и дальше
+        шлет только Bind/Execute, так что разбор и план запроса переиспользуются
+        всеми пакетами таблицы. Параметры передаются в бинарном виде, как
+        в COPY. В конвейере строки уходят без ожидания ответа на каждую,
+        синхронизация - одна на пакет при выходе из conn.pipeline(), там же
+        поднимается ошибка любой из строк.
+        """
+        cursor = psycopg.Cursor(self.conn)
+        with self.conn.pipeline():
+            cursor.executemany(self._prepared_query(table_name, column_names, conflict_col), batch)
+        return cursor.rowcount
+
+    def _copy_batch(self, batch: List[tuple], table_name: str,
+                    column_names: List[str], conflict_col: str) -> int:
+        """Сохранение пакета через COPY в промежуточную временную таблицу
+
+        Строки передаются в бинарном формате без разбора SQL на сервере,
+        а дубликаты отбрасываются при переносе из промежуточной таблицы
+        тем же ON CONFLICT DO NOTHING, что и в режиме insert.
+        """
+        column_types = self._get_column_types(table_name, column_names)
+        create, copy_query, insert = self._copy_queries(table_name, column_names, conflict_col)
+
+        self.cursor.execute(create)
+        with self.cursor.copy(copy_query) as copy:
+            copy.set_types(column_types)
+            for row in batch:
+                copy.write_row(row)
+
+        self.cursor.execute(insert)
+        return self.cursor.rowcount
+
+    def _clear_staging(self, table_name: str):
+        """Очистка промежуточной таблицы после записи пакета в режиме copy
+
+        Вызывается после RELEASE SAVEPOINT: TRUNCATE внутри точки сохранения
+        каждый раз создает новый файл таблицы, который держится до конца
+        транзакции, и запись замедляется в разы.
+        """
+        if self.save_mode == 'copy':
+            self.cursor.execute(f"TRUNCATE {self._staging_table(table_name)}")
 
+    def _get_column_types(self, table_name: str, column_names: List[str]) -> List[str]:
+        """Типы колонок таблицы в порядке column_names, нужны для бинарного COPY"""
+        key = (table_name, tuple(column_names))
+        if key not in self._column_types:
+            cursor = self.conn.cursor(row_factory=tuple_row)
+            cursor.execute(self.COLUMN_TYPES_QUERY, (table_name,))
+            types = dict(cursor.fetchall())
+            self._column_types[key] = [types[col] for col in column_names]
+        return self._column_types[key]
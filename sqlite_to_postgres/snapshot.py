@@ -0,0 +1,214 @@
+import datetime
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import struct
+import time
+from dataclasses import fields
+from datetime import timezone
+from typing import Callable, Dict, Iterator, List
+from uuid import UUID
+
+from load_from_sqlite import SQLiteLoader
+from migration import TABLES, CONFLICT_FIELDS, MigrationOptions
+from row_codecs import _field_type
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+MANIFEST = 'manifest.json'
+FORMAT = 'pgcopy-binary'
+# Заголовок бинарного COPY: сигнатура, флаги и длина расширения заголовка
+COPY_HEADER = b'PGCOPY\n\xff\r\n\x00' + struct.pack('!ii', 0, 0)
+COPY_TRAILER = struct.pack('!h', -1)
+NULL_FIELD = struct.pack('!i', -1)
+# Даты и время в бинарном формате Postgres отсчитываются от 2000-01-01
+PG_EPOCH = datetime.datetime(2000, 1, 1, tzinfo=timezone.utc)
+PG_EPOCH_DATE = PG_EPOCH.date()
+MICROSECOND = datetime.timedelta(microseconds=1)
+READ_CHUNK = 1 << 20
+
+_int32 = struct.Struct('!i')
+_int64_field = struct.Struct('!iq')
+_int32_field = struct.Struct('!ii')
+_float8_field = struct.Struct('!id')
+
+
+def _encode_text(value) -> bytes:
+    data = str(value).encode()
+    return _int32.pack(len(data)) + data
+
+
+def _encode_uuid(value) -> bytes:
+    return b'\x00\x00\x00\x10' + (value if isinstance(value, UUID) else UUID(value)).bytes
+
+
+def _encode_timestamptz(value: datetime.datetime) -> bytes:
+    return _int64_field.pack(8, (value - PG_EPOCH) // MICROSECOND)
+
+
+def _encode_date(value: datetime.date) -> bytes:
+    return _int32_field.pack(4, (value - PG_EPOCH_DATE).days)
+
+
+def _encode_float8(value) -> bytes:
+    return _float8_field.pack(8, float(value))
+
+
+# Кодировщик значения по типу поля dataclass из models.py: значение -> длина и байты поля
+ENCODERS: Dict[type, Callable] = {
+    UUID: _encode_uuid,
+    str: _encode_text,
+    datetime.datetime: _encode_timestamptz,
+    datetime.date: _encode_date,
+    float: _encode_float8,
+}
+
+
+class CopyRowEncoder:
+    """Строка в кортеже (см. SQLiteLoader.load_rows) -> кортеж бинарного COPY
+
+    Формат тот же, что psycopg отправляет при COPY ... (FORMAT BINARY),
+    но без соединения с Postgres: типы колонок берутся из dataclass.
+    """
+
+    def __init__(self, object_class: type):
+        self.encoders = [ENCODERS[_field_type(f.type)] for f in fields(object_class)]
+        self.row_header = struct.pack('!h', len(self.encoders))
+
+    def encode(self, row: tuple) -> bytes:
+        parts = [self.row_header]
+        for encode, value in zip(self.encoders, row):
+            parts.append(NULL_FIELD if value is None else encode(value))
+        return b''.join(parts)
+
+
+def _sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(READ_CHUNK):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def export_snapshot(connection: sqlite3.Connection, directory: str, chunk_rows: int = 1_000_000,
+                    batch_size: int = 10_000) -> dict:
+    """Выгрузка всех таблиц SQLite в файлы бинарного COPY с манифестом
+
+    Каждая таблица пишется частями по chunk_rows строк, каждая часть -
+    самостоятельный файл <таблица>.<номер>.pgcopy, который можно отдать
+    в COPY FROM целиком. Строки разбираются RowCodec один раз, здесь.
+    manifest.json с колонками, количеством строк и sha256 каждого файла
+    пишется последним, поэтому его наличие означает, что выгрузка завершена.
+
+    Returns:
+        Содержимое манифеста
+    """
+    os.makedirs(directory, exist_ok=True)
+    loader = SQLiteLoader(connection, log_batches=False)
+    loader.set_batch_size(batch_size)
+    manifest = {'format': FORMAT, 'created': datetime.datetime.now(timezone.utc).isoformat(), 'tables': {}}
+    for table_name in TABLES:
+        started = time.perf_counter()
+        encoder = CopyRowEncoder(loader.table_class_map[table_name])
+        files = []
+        writer = None
+        for batch in loader.load_rows(table_name):
+            for row in batch:
+                if writer is None:
+                    writer = _ChunkWriter(directory, f'{table_name}.{len(files) + 1:04d}.pgcopy')
+                writer.write(encoder.encode(row))
+                if writer.rows == chunk_rows:
+                    files.append(writer.close())
+                    writer = None
+        if writer is not None:
+            files.append(writer.close())
+        manifest['tables'][table_name] = {'columns': loader.get_columns(table_name), 'files': files}
+        logger.info(f"Таблица {table_name} выгружена: {sum(f['rows'] for f in files)} строк "
+                    f"в {len(files)} файлах за {time.perf_counter() - started:.1f} с")
+
+    tmp_path = os.path.join(directory, f'{MANIFEST}.tmp')
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        json.dump(manifest, f, ensure_ascii=False, indent=2)
+    os.replace(tmp_path, os.path.join(directory, MANIFEST))
+    return manifest
+
+
+class _ChunkWriter:
+    """Один файл бинарного COPY: пишется во временный файл, sha256 считается по ходу записи"""
+
+    def __init__(self, directory: str, name: str):
+        self.name = name
+        self.path = os.path.join(directory, name)
+        self.rows = 0
+        self.digest = hashlib.sha256(COPY_HEADER)
+        self.file = open(f'{self.path}.tmp', 'wb', buffering=READ_CHUNK)
+        self.file.write(COPY_HEADER)
+
+    def write(self, data: bytes):
+        self.file.write(data)
+        self.digest.update(data)
+        self.rows += 1
+
+    def close(self) -> dict:
+        self.file.write(COPY_TRAILER)
+        self.digest.update(COPY_TRAILER)
+        self.file.close()
+        os.replace(f'{self.path}.tmp', self.path)
+        return {'name': self.name, 'rows': self.rows, 'bytes': os.path.getsize(self.path),
+                'sha256': self.digest.hexdigest()}
+
+
+def read_manifest(directory: str) -> dict:
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as f:
+        manifest = json.load(f)
+    if manifest.get('format') != FORMAT:
+        raise ValueError(f"Неизвестный формат выгрузки в {directory}: {manifest.get('format')}")
+    return manifest
+
+
+def verify_snapshot(directory: str) -> List[str]:
+    """Имена файлов выгрузки, которых нет или sha256 которых не совпадает с манифестом"""
+    broken = []
+    for table in read_manifest(directory)['tables'].values():
+        for file in table['files']:
+            path = os.path.join(directory, file['name'])
+            if not os.path.exists(path) or _sha256(path) != file['sha256']:
+                broken.append(file['name'])
+    return broken
+
+
+def _read_checked(path: str, sha256: str) -> Iterator[bytes]:
+    """Содержимое файла частями; после последней части - ValueError, если sha256 не совпал"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        while chunk := f.read(READ_CHUNK):
+            digest.update(chunk)
+            yield chunk
+    if digest.hexdigest() != sha256:
+        raise ValueError(f"Контрольная сумма файла {path} не совпадает с манифестом")
+
+
+def import_snapshot(pg_conn, directory: str, options: MigrationOptions = None):
+    """Загрузка выгрузки export_snapshot в Postgres без чтения SQLite
+
+    Файлы передаются в COPY как есть, без разбора строк в Python, так
+    что на каждую целевую базу уходит только время самого COPY. Контрольная
+    сумма файла проверяется по ходу передачи: если она не совпала, COPY
+    этого файла откатывается. Конфликты обрабатываются так же, как при
+    обычном переносе (PostgresSaver.save_copy_data), каждая таблица
+    коммитится отдельно.
+    """
+    options = options or MigrationOptions()
+    manifest = read_manifest(directory)
+    postgres_saver = options.make_saver(pg_conn)
+    for table_name in TABLES:
+        table = manifest['tables'][table_name]
+        for file in table['files']:
+            postgres_saver.save_copy_data(_read_checked(os.path.join(directory, file['name']), file['sha256']),
+                                          file['rows'], f'content.{table_name}', table['columns'],
+                                          CONFLICT_FIELDS.get(table_name, 'id'))
+        postgres_saver.commit(table_name)
+        logger.info(f"Таблица {table_name} загружена из {len(table['files'])} файлов выгрузки")
@@ -0,0 +1,59 @@
+import abc
+import json
+import os
+from typing import Any, Dict
+
+
+class BaseStorage(abc.ABC):
+    """Абстрактное хранилище состояния миграции"""
+
+    @abc.abstractmethod
+    def save_state(self, state: Dict[str, Any]) -> None:
+        """Сохранить состояние в хранилище"""
+
+    @abc.abstractmethod
+    def retrieve_state(self) -> Dict[str, Any]:
+        """Получить состояние из хранилища"""
+
+
+class JsonFileStorage(BaseStorage):
+    """Хранилище состояния в JSON-файле"""
+
+    def __init__(self, file_path: str):
+        self.file_path = file_path
+
+    def save_state(self, state: Dict[str, Any]) -> None:
+        # Пишем во временный файл и подменяем, чтобы падение не оставило битый JSON
+        tmp_path = f'{self.file_path}.tmp'
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            json.dump(state, f, ensure_ascii=False, indent=2)
+        os.replace(tmp_path, self.file_path)
+
+    def retrieve_state(self) -> Dict[str, Any]:
+        if not os.path.exists(self.file_path):
+            return {}
+        with open(self.file_path, encoding='utf-8') as f:
+            return json.load(f)
+
+
+class State:
+    """Состояние миграции поверх хранилища, каждое изменение сразу сохраняется
+
+    Перед записью состояние перечитывается из хранилища, поэтому несколько
+    State над одним файлом (например, --bulk вместе с --incremental) не
+    затирают ключи друг друга.
+    """
+
+    def __init__(self, storage: BaseStorage):
+        self.storage = storage
+        self.state = storage.retrieve_state()
+
+    def set_state(self, key: str, value: Any) -> None:
+        """Установить состояние для определённого ключа"""
+        self.state = self.storage.retrieve_state()
+        self.state[key] = value
+        self.storage.save_state(self.state)
+
+    def get_state(self, key: str, default: Any = None) -> Any:
+        """Получить состояние по определённому ключу"""
+        return self.state.get(key, default)
@@ -8,7 +8,7 @@ load_dotenv()
 
 from load_from_sqlite import SQLiteLoader
 from save_to_postgres import PostgresSaver
-from models import FilmWork, Person, Genre, PersonFilmWork, GenreFilmWork
+from verify import ConsistencyChecker
 from psycopg import ClientCursor, connection as _connection
 from psycopg.rows import dict_row
 
@@ -44,41 +44,7 @@ def test_rows_in_tables_in_two_db_is_same(sqlite: SQLiteLoader, postgres: Postgr
     assert sqlite_count == postgres_count
 
 
-def test_film_work_data_in_two_db_is_same(sqlite: SQLiteLoader, postgres: PostgresSaver):
-    for original_batch in sqlite.load_film_work():
-        ids = [item.id for item in original_batch]
-        postgres.cursor.execute('SELECT * FROM content.film_work WHERE id = ANY(%s)', [ids])
-        transferred_batch = [FilmWork(**item) for item in postgres.cursor.fetchall()]
-        assert original_batch == transferred_batch 
-
-
-def test_person_data_in_two_db_is_same(sqlite: SQLiteLoader, postgres: PostgresSaver):
-    for original_batch in sqlite.load_person():
-        ids = [item.id for item in original_batch]
-        postgres.cursor.execute('SELECT * FROM content.person WHERE id = ANY(%s)', [ids])
-        transferred_batch = [Person(**item) for item in postgres.cursor.fetchall()]
-        assert original_batch == transferred_batch 
-
-
-def test_genre_data_in_two_db_is_same(sqlite: SQLiteLoader, postgres: PostgresSaver):
-    for original_batch in sqlite.load_genre():
-        ids = [item.id for item in original_batch]
-        postgres.cursor.execute('SELECT * FROM content.genre WHERE id = ANY(%s)', [ids])
-        transferred_batch = [Person(**item) for item in postgres.cursor.fetchall()]
-        assert original_batch == transferred_batch 
-
-
-def test_genre_film_work_data_in_two_db_is_same(sqlite: SQLiteLoader, postgres: PostgresSaver):
-    for original_batch in sqlite.load_genre_fim_work():
-        ids = [item.id for item in original_batch]
-        postgres.cursor.execute('SELECT * FROM content.genre_film_work WHERE id = ANY(%s)', [ids])
-        transferred_batch = [Person(**item) for item in postgres.cursor.fetchall()]
-        assert original_batch == transferred_batch 
-
-
-def test_person_film_work_data_in_two_db_is_same(sqlite: SQLiteLoader, postgres: PostgresSaver):
-    for original_batch in sqlite.load_person_fim_work():
-        ids = [item.id for item in original_batch]
-        postgres.cursor.execute('SELECT * FROM content.person_film_work WHERE id = ANY(%s)', [ids])
-        transferred_batch = [Person(**item) for item in postgres.cursor.fetchall()]
-        assert original_batch == transferred_batch 
\ No newline at end of file
+@pytest.mark.parametrize('table_name', ['film_work', 'genre', 'person', 'genre_film_work', 'person_film_work'])
+def test_data_in_two_db_is_same(sqlite: SQLiteLoader, postgres: PostgresSaver, table_name):
+    diff = ConsistencyChecker(sqlite.conn, postgres.conn).check_table(table_name)
+    assert diff.consistent, diff
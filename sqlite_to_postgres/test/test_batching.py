@@ -0,0 +1,48 @@
+import pickle
+
+from batching import AdaptiveBatchSizer, BatchStats
+
+
+def test_size_grows_when_writes_are_fast():
+    sizer = AdaptiveBatchSizer(initial_size=100, target_latency=0.25)
+    # 1 мс на строку: желаемый размер 250, но за шаг не больше чем вдвое
+    assert sizer.update('genre', BatchStats(rows=100, seconds=0.01, nbytes=1000)) == 200
+    assert sizer.update('genre', BatchStats(rows=200, seconds=0.02, nbytes=2000)) == 400
+    assert sizer.get_size('person') == 100
+
+
+def test_size_shrinks_when_writes_are_slow():
+    sizer = AdaptiveBatchSizer(initial_size=100, target_latency=0.25)
+    # 10 мс на строку: нужно 25 строк, за шаг размер падает только вдвое
+    assert sizer.update('genre', BatchStats(rows=100, seconds=1.0, nbytes=1000)) == 50
+    assert sizer.update('genre', BatchStats(rows=50, seconds=0.5, nbytes=500)) == 25
+
+
+def test_size_is_capped_by_batch_memory():
+    sizer = AdaptiveBatchSizer(initial_size=100, max_batch_bytes=100 * 1024)
+    # Запись быстрая, но строка занимает 1 КиБ: в пакет помещается 100 строк
+    assert sizer.update('film_work', BatchStats(rows=100, seconds=0.001, nbytes=100 * 1024)) == 100
+
+
+def test_size_stays_within_floor_and_ceiling():
+    sizer = AdaptiveBatchSizer(initial_size=20, max_size=30)
+    assert sizer.update('genre', BatchStats(rows=20, seconds=0.0001, nbytes=20)) == 30
+    slow = AdaptiveBatchSizer(initial_size=16)
+    for _ in range(5):
+        size = slow.update('genre', BatchStats(rows=slow.get_size('genre'), seconds=100.0, nbytes=1))
+    # Пол по умолчанию ниже прежнего фиксированного размера пакета в 100 строк
+    assert size == slow.min_size == 10
+
+
+def test_empty_batch_keeps_size():
+    sizer = AdaptiveBatchSizer(initial_size=100)
+    assert sizer.update('genre', BatchStats(rows=0, seconds=1.0, nbytes=0)) == 100
+
+
+def test_pickle_round_trip_keeps_sizes():
+    sizer = AdaptiveBatchSizer()
+    sizer.set_size('person', 500)
+    sizer.update('genre', BatchStats(rows=100, seconds=0.01, nbytes=1000))
+    copy = pickle.loads(pickle.dumps(sizer))
+    assert copy.report() == {'person': 500, 'genre': 200}
+    assert copy.update('genre', BatchStats(rows=200, seconds=0.02, nbytes=2000)) == 400
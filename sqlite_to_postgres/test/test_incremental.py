@@ -0,0 +1,30 @@
+import uuid
+
+from incremental import load_incremental
+from migration import MigrationOptions
+from state import JsonFileStorage, State
+from test_resumable import FlakySaver
+from test_snapshot import _create_source
+
+
+def test_watermark_is_held_while_references_are_missing(tmp_path, monkeypatch):
+    conn = _create_source(str(tmp_path / 'movies.sqlite'))
+    genre_id = conn.execute('SELECT id FROM genre').fetchone()[0]
+    film_id = str(uuid.uuid4())
+    # Фильм связи ещё не перенесён в SQLite
+    conn.execute('INSERT INTO genre_film_work VALUES (?, ?, ?, ?)',
+                 (str(uuid.uuid4()), genre_id, film_id, '2021-06-16 20:14:09.221838+00'))
+    conn.commit()
+    monkeypatch.setattr(MigrationOptions, 'make_saver', lambda self, pg_conn, upsert=False: FlakySaver(fail_on=0))
+    state = State(JsonFileStorage(str(tmp_path / 'state.json')))
+    options = MigrationOptions(check_references=True, log_batches=False)
+
+    load_incremental(conn, None, state, options)
+    assert state.get_state('genre_watermark') == '2021-06-16 20:14:09.221838+00'
+    assert state.get_state('genre_film_work_watermark') is None
+
+    conn.execute("INSERT INTO film_work (id, title, updated_at) VALUES (?, 'Фильм', '2021-06-16 20:14:09.221838+00')",
+                 (film_id,))
+    conn.commit()
+    load_incremental(conn, None, state, options)
+    assert state.get_state('genre_film_work_watermark') == '2021-06-16 20:14:09.221838+00'
@@ -0,0 +1,55 @@
+import logging
+import pickle
+
+from metrics import MigrationMetrics, ProgressReporter
+
+
+def _worker_metrics(rows: int, affected: int) -> MigrationMetrics:
+    metrics = MigrationMetrics()
+    metrics.record_fetch('person_film_work', rows, 0.5)
+    metrics.record_save('content.person_film_work', rows, affected, 1.0)
+    metrics.record_commit('person_film_work', 0.25)
+    return metrics
+
+
+def test_merge_adds_metrics_from_processes():
+    total = MigrationMetrics()
+    total.record_fetch('genre', 10, 0.1)
+    # Метрики приходят из процессов задач pickle-ом
+    for worker in (_worker_metrics(100, 90), _worker_metrics(50, 50)):
+        total.merge(pickle.loads(pickle.dumps(worker)))
+
+    table = total.tables['person_film_work']
+    assert (table.rows_read, table.rows_written, table.rows_skipped) == (150, 140, 10)
+    assert (table.fetch_seconds, table.send_seconds, table.commit_seconds) == (1.0, 2.0, 0.5)
+    assert table.batch_sizes == {100: 1, 50: 1}
+    assert total.rows_read('genre') == 10
+
+
+def test_report_totals_and_batch_sizes():
+    metrics = _worker_metrics(100, 90)
+    metrics.record_save('person_film_work', 20, None, 0.1)
+    metrics.record_rejected('person_film_work', 3)
+
+    report = metrics.report()
+    table = report['tables']['person_film_work']
+    assert (table['rows_read'], table['rows_written'], table['rows_skipped_on_conflict']) == (100, 90, 10)
+    assert (table['rows_failed_save'], table['rows_rejected']) == (20, 3)
+    assert table['batch_sizes']['count'] == 2
+    assert (table['batch_sizes']['min'], table['batch_sizes']['max']) == (20, 100)
+    assert report['total']['rows_read'] == 100
+    assert report['total']['rows_written'] == 90
+
+
+def test_report_of_empty_metrics():
+    assert MigrationMetrics().report()['total'] == {'rows_read': 0, 'rows_written': 0, 'cpu_seconds': 0,
+                                                    'seconds': 0.0, 'rows_per_second': None}
+
+
+def test_progress_reporter_logs_rows_per_table(caplog):
+    metrics = _worker_metrics(100, 100)
+    with caplog.at_level(logging.INFO, logger='metrics'):
+        with ProgressReporter(metrics, {'person_film_work': 400, 'genre': 26}, interval=60) as progress:
+            progress.log_progress()
+    assert 'Прогресс: 100/426 строк' in caplog.text
+    assert 'person_film_work 100/400, genre 0/26' in caplog.text
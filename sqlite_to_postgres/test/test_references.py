@@ -0,0 +1,63 @@
+import json
+import sqlite3
+import uuid
+from concurrent.futures import ProcessPoolExecutor
+
+from dead_letter import DeadLetterFile
+from references import IdSet, ReferenceFilter
+
+
+def test_id_set_membership_across_runs(monkeypatch):
+    monkeypatch.setattr(IdSet, 'RUN_SIZE', 7)
+    ids = [uuid.uuid4() for _ in range(50)]
+    id_set = IdSet.from_ids([str(value) for value in ids] + [ids[0]])
+    assert len(id_set) == 50
+    assert id_set.nbytes == 50 * 16
+    assert all(value in id_set for value in ids)
+    assert str(ids[3]) in id_set
+    assert uuid.uuid4() not in id_set
+
+
+def test_empty_id_set():
+    assert uuid.uuid4() not in IdSet.from_ids([])
+
+
+def test_id_set_skips_malformed_ids():
+    id_set = IdSet.from_ids(['bad', 'not-a-uuid'])
+    assert len(id_set) == 0
+    assert 'bad' not in id_set
+    assert None not in id_set
+
+
+def test_reference_filter_drops_orphans(tmp_path):
+    conn = sqlite3.connect(':memory:')
+    film_id, genre_id = str(uuid.uuid4()), str(uuid.uuid4())
+    conn.execute('CREATE TABLE film_work (id TEXT)')
+    conn.execute('CREATE TABLE genre (id TEXT)')
+    conn.execute('INSERT INTO film_work VALUES (?)', (film_id,))
+    conn.execute('INSERT INTO genre VALUES (?)', (genre_id,))
+    rejects_path = tmp_path / 'rejects.jsonl'
+
+    reference_filter = ReferenceFilter(conn, DeadLetterFile(str(rejects_path)))
+    columns = ['id', 'genre_id', 'film_work_id', 'created']
+    good = (str(uuid.uuid4()), genre_id, film_id, None)
+    orphan = (str(uuid.uuid4()), genre_id, str(uuid.uuid4()), None)
+    assert reference_filter.filter_rows('genre_film_work', columns, [good, orphan]) == [good]
+    assert reference_filter.rejected == {'genre_film_work': 1}
+    assert '"columns": ["film_work_id"]' in rejects_path.read_text()
+    assert reference_filter.filter_rows('genre', ['id'], [orphan]) == [orphan]
+
+
+def _write_rejects(path: str, worker: int):
+    dead_letter = DeadLetterFile(path)
+    for _ in range(50):
+        dead_letter.write('genre', ['id', 'name'], [((str(uuid.uuid4()), 'x' * 5000), {'worker': worker})] * 4, 'test')
+
+
+def test_dead_letter_lines_from_processes_do_not_interleave(tmp_path):
+    path = str(tmp_path / 'rejects.jsonl')
+    with ProcessPoolExecutor(max_workers=4) as executor:
+        list(executor.map(_write_rejects, [path] * 4, range(4)))
+    with open(path, encoding='utf-8') as f:
+        records = [json.loads(line) for line in f]
+    assert len(records) == 4 * 50 * 4
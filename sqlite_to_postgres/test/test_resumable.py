@@ -0,0 +1,71 @@
+import pickle
+
+import pytest
+
+from batching import AdaptiveBatchSizer
+from load_from_sqlite import SQLiteLoader
+from migration import MigrationOptions, migrate_scan
+from parallel import ScanInterrupted
+from resumable import load_resumable
+from state import JsonFileStorage, State
+from test_snapshot import _create_source
+
+
+class FlakySaver:
+    """Заменяет PostgresSaver: пакет с номером fail_on не сохраняется, как при откате в _save_batch"""
+
+    text_uuids = True
+    last_batch_stats = None
+
+    def __init__(self, fail_on: int):
+        self.fail_on = fail_on
+        self.failed_batches = 0
+        self.saved = []
+        self._batches = 0
+
+    def save_rows(self, rows, table_name, column_names, conflict_field):
+        self._batches += 1
+        if self._batches == self.fail_on:
+            self.failed_batches += 1
+        else:
+            self.saved += rows
+
+    def commit(self, table_name):
+        pass
+
+
+def test_resumable_keeps_checkpoint_on_failed_batch(tmp_path, monkeypatch):
+    conn = _create_source(str(tmp_path / 'movies.sqlite'))
+    saver = FlakySaver(fail_on=2)
+    monkeypatch.setattr(MigrationOptions, 'make_saver', lambda self, pg_conn, upsert=False: saver)
+    state = State(JsonFileStorage(str(tmp_path / 'state.json')))
+    options = MigrationOptions(batch_sizer=AdaptiveBatchSizer(initial_size=2, min_size=1))
+
+    with pytest.raises(RuntimeError):
+        load_resumable(conn, None, state, options)
+
+    last_saved = conn.execute('SELECT rowid FROM genre WHERE id = ?', (saver.saved[-1][0],)).fetchone()[0]
+    assert len(saver.saved) == 2
+    assert State(JsonFileStorage(str(tmp_path / 'state.json'))).get_state('checkpoints') == {'genre': last_saved}
+
+
+def test_scan_retry_continues_after_last_committed_batch(tmp_path):
+    conn = _create_source(str(tmp_path / 'movies.sqlite'))
+    loader = SQLiteLoader(conn, uuid_as_text=True, log_batches=False)
+    loader.set_batch_size(2)
+    scan, = loader.plan_scans('genre', 1)
+
+    saver = FlakySaver(fail_on=2)
+    with pytest.raises(RuntimeError):
+        migrate_scan(loader, saver, scan)
+    assert scan.last_key == 2
+
+    # Исключение задачи передаётся из процесса pickle-ом вместе с ключом
+    error = pickle.loads(pickle.dumps(ScanInterrupted('сбой', scan.last_key)))
+    assert error.last_key == 2
+
+    retry = FlakySaver(fail_on=0)
+    assert migrate_scan(loader, retry, scan) == 3
+    assert scan.finished
+    assert sorted(row[0] for row in saver.saved + retry.saved) == \
+        sorted(row[0] for row in conn.execute('SELECT id FROM genre'))
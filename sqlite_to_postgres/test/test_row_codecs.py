@@ -0,0 +1,34 @@
+from operator import attrgetter
+
+import pytest
+
+from models import FilmWork, Person, Genre, PersonFilmWork, GenreFilmWork
+from row_codecs import RowCodec
+
+TIMESTAMP = '2021-06-16 20:14:09.221838+00'
+ROWS = {
+    FilmWork: ('3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff', 'Star Wars', None, '1977-05-25', 8.6, 'movie',
+               TIMESTAMP, TIMESTAMP),
+    Genre: ('3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff', 'Action', 'desc', TIMESTAMP, TIMESTAMP),
+    Person: ('3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff', 'George Lucas', TIMESTAMP, TIMESTAMP),
+    GenreFilmWork: ('3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff', '120a21cf-9097-479e-904a-13dd7198c1dd',
+                    '0312ed51-8833-413f-bff5-0e139c11264a', TIMESTAMP),
+    PersonFilmWork: ('3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff', '120a21cf-9097-479e-904a-13dd7198c1dd',
+                     '0312ed51-8833-413f-bff5-0e139c11264a', 'director', TIMESTAMP),
+}
+
+
+@pytest.mark.parametrize('object_class', ROWS.keys())
+def test_codec_matches_dataclass(object_class):
+    row = ROWS[object_class]
+    codec = RowCodec(object_class)
+    expected = attrgetter(*codec.columns)(object_class(*row))
+    assert codec.decode(row) == expected
+
+
+@pytest.mark.parametrize('object_class', ROWS.keys())
+def test_codec_keeps_uuid_as_text(object_class):
+    row = ROWS[object_class]
+    decoded = RowCodec(object_class, uuid_as_text=True).decode(row + ('ignored rowid',))
+    assert decoded[0] == row[0]
+    assert len(decoded) == len(row)
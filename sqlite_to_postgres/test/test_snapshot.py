@@ -0,0 +1,64 @@
+import datetime
+import os
+import sqlite3
+import struct
+import uuid
+from dataclasses import fields
+from datetime import timezone
+
+from load_from_sqlite import SQLiteLoader
+from models import FilmWork, Genre
+from snapshot import COPY_HEADER, CopyRowEncoder, export_snapshot, read_manifest, verify_snapshot
+
+
+def _create_source(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    loader = SQLiteLoader(conn)
+    for table_name, object_class in loader.table_class_map.items():
+        columns = [loader.transform_col_name.get(f.name, f.name) for f in fields(object_class)]
+        conn.execute(f"CREATE TABLE {table_name} ({', '.join(columns)})")
+    conn.executemany('INSERT INTO genre VALUES (?, ?, NULL, ?, ?)',
+                     [(str(uuid.uuid4()), f'genre {i}', '2021-06-16 20:14:09.221838+00',
+                       '2021-06-16 20:14:09.221838+00') for i in range(5)])
+    conn.commit()
+    return conn
+
+
+def test_encoder_binary_values():
+    film_id = uuid.uuid4()
+    row = (film_id, 'Фильм', None, datetime.date(2000, 1, 2), 8.5, 'movie',
+           datetime.datetime(2000, 1, 1, 0, 0, 1, tzinfo=timezone.utc), None)
+    data = CopyRowEncoder(FilmWork).encode(row)
+    assert data.startswith(struct.pack('!hi', 8, 16) + film_id.bytes)
+    assert struct.pack('!i', len('Фильм'.encode())) + 'Фильм'.encode() + struct.pack('!i', -1) in data
+    assert struct.pack('!ii', 4, 1) in data
+    assert struct.pack('!id', 8, 8.5) in data
+    assert data.endswith(struct.pack('!iq', 8, 1_000_000) + struct.pack('!i', -1))
+
+
+def test_encoder_accepts_text_uuid():
+    genre_id = uuid.uuid4()
+    encoder = CopyRowEncoder(Genre)
+    assert encoder.encode((str(genre_id), 'drama', None, None, None)) == \
+        encoder.encode((genre_id, 'drama', None, None, None))
+
+
+def test_export_snapshot_chunks_and_checksums(tmp_path):
+    conn = _create_source(str(tmp_path / 'movies.sqlite'))
+    directory = str(tmp_path / 'snapshot')
+    export_snapshot(conn, directory, chunk_rows=2)
+
+    manifest = read_manifest(directory)
+    files = manifest['tables']['genre']['files']
+    assert [f['rows'] for f in files] == [2, 2, 1]
+    assert manifest['tables']['person']['files'] == []
+    with open(os.path.join(directory, files[0]['name']), 'rb') as f:
+        assert f.read(len(COPY_HEADER)) == COPY_HEADER
+    assert verify_snapshot(directory) == []
+
+    with open(os.path.join(directory, files[1]['name']), 'r+b') as f:
+        f.seek(len(COPY_HEADER) + 10)
+        byte = f.read(1)[0]
+        f.seek(-1, os.SEEK_CUR)
+        f.write(bytes([byte ^ 0xff]))
+    assert verify_snapshot(directory) == [files[1]['name']]
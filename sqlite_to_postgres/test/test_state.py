@@ -0,0 +1,14 @@
+from state import JsonFileStorage, State
+
+
+def test_states_on_one_file_keep_each_others_keys(tmp_path):
+    path = str(tmp_path / 'state.json')
+    watermarks = State(JsonFileStorage(path))
+    deferred = State(JsonFileStorage(path))
+
+    deferred.set_state('deferred_ddl', {'indexes': [], 'foreign_keys': []})
+    watermarks.set_state('watermarks', {'genre': '2021-06-16 20:14:09.221838+00'})
+    deferred.set_state('deferred_ddl', None)
+
+    assert State(JsonFileStorage(path)).state == {'deferred_ddl': None,
+                                                  'watermarks': {'genre': '2021-06-16 20:14:09.221838+00'}}
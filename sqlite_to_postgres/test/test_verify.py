@@ -0,0 +1,38 @@
+import datetime
+from datetime import timezone
+
+from uuid import UUID
+
+import pytest
+
+from verify import PYTHON_NORMALIZERS, TableDiff, _float_text, prefix_bounds, row_hash
+
+
+@pytest.mark.parametrize('value, expected', [(8.5, '8.5'), (10.0, '10'), (0.1, '0.1'), (1e-05, '1e-05')])
+def test_float_text_matches_postgres(value, expected):
+    assert _float_text(value) == expected
+
+
+def test_datetime_text_is_utc():
+    value = datetime.datetime(2021, 6, 16, 23, 14, 9, 221838, tzinfo=timezone(datetime.timedelta(hours=3)))
+    assert PYTHON_NORMALIZERS[datetime.datetime](value) == '2021-06-16 20:14:09.221838'
+
+
+def test_prefix_bounds_cover_prefix():
+    low, high = prefix_bounds('3d')
+    assert low == '3d000000-0000-0000-0000-000000000000'
+    assert high == '3dffffff-ffff-ffff-ffff-ffffffffffff'
+    assert low <= '3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff' <= high
+
+
+def test_row_hash_fits_bigint_sum():
+    assert 0 <= row_hash('any row') < 2 ** 60
+
+
+def test_uuid_text_is_lowercase():
+    assert PYTHON_NORMALIZERS[UUID]('3D8D9BF5-0D90-4353-88BA-4CCC5D2C07FF') == '3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff'
+
+
+def test_table_diff_consistent():
+    assert TableDiff('genre').consistent
+    assert not TableDiff('genre', changed=['3d8d9bf5-0d90-4353-88ba-4ccc5d2c07ff']).consistent
@@ -0,0 +1,197 @@
+import datetime
+import hashlib
+import logging
+import sqlite3
+from dataclasses import dataclass, field, fields
+from datetime import timezone
+from typing import Callable, Dict, Iterable, List, Tuple
+from uuid import UUID
+
+from psycopg import connection as _connection
+from psycopg.rows import tuple_row
+
+from load_from_sqlite import SQLiteLoader
+from migration import TABLES
+from row_codecs import _field_type
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Нормализованная строка: значения колонок в текстовом виде через SEPARATOR, NULL как NULL_TEXT
+SEPARATOR = '\x1f'
+NULL_TEXT = '\\N'
+# Хэш строки - первые 15 шестнадцатеричных цифр md5 (60 бит), чтобы сумма по диапазону не переполняла bigint
+HASH_DIGITS = 15
+# Длина префикса id до первого дефиса - глубже диапазоны не делятся
+MAX_PREFIX = 8
+HEX_DIGITS = '0123456789abcdef'
+
+
+def _float_text(value) -> str:
+    # float8::text в Postgres - кратчайшее точное представление, как repr, но без '.0' у целых
+    text = repr(float(value))
+    return text[:-2] if text.endswith('.0') else text
+
+
+def _datetime_text(value: datetime.datetime) -> str:
+    return value.astimezone(timezone.utc).strftime('%Y-%m-%d %H:%M:%S.%f')
+
+
+# Нормализация значений на стороне SQLite (после RowCodec) и то же самое выражением на стороне Postgres
+PYTHON_NORMALIZERS: Dict[type, Callable] = {
+    datetime.datetime: _datetime_text,
+    datetime.date: datetime.date.isoformat,
+    float: _float_text,
+    UUID: lambda value: str(value).lower(),
+}
+SQL_NORMALIZERS: Dict[type, str] = {
+    datetime.datetime: "to_char({col} AT TIME ZONE 'UTC', 'YYYY-MM-DD HH24:MI:SS.US')",
+    datetime.date: "to_char({col}, 'YYYY-MM-DD')",
+}
+
+
+def prefix_bounds(prefix: str) -> Tuple[str, str]:
+    """Наименьший и наибольший UUID (строками) с заданным шестнадцатеричным префиксом"""
+    pad = MAX_PREFIX - len(prefix)
+    return (f"{prefix}{'0' * pad}-0000-0000-0000-000000000000",
+            f"{prefix}{'f' * pad}-ffff-ffff-ffff-ffffffffffff")
+
+
+def row_hash(text: str) -> int:
+    return int(hashlib.md5(text.encode()).hexdigest()[:HASH_DIGITS], 16)
+
+
+@dataclass
+class TableDiff:
+    """Результат сверки одной таблицы"""
+    table_name: str
+    # Есть в SQLite, но нет в Postgres
+    missing: List[str] = field(default_factory=list)
+    # Есть в Postgres, но нет в SQLite
+    extra: List[str] = field(default_factory=list)
+    # Есть в обеих базах, но значения отличаются
+    changed: List[str] = field(default_factory=list)
+    # Запросов к Postgres и строк, сверенных поштучно
+    queries: int = 0
+    rows_compared: int = 0
+
+    @property
+    def consistent(self) -> bool:
+        return not (self.missing or self.extra or self.changed)
+
+
+class ConsistencyChecker:
+    """Сверка таблиц SQLite и Postgres по контрольным суммам диапазонов id
+
+    Каждая строка приводится к одному текстовому виду на обеих сторонах
+    (в Postgres - выражением в SQL, в SQLite - после RowCodec в Python),
+    от него берётся md5. Для диапазона id считаются количество строк и
+    сумма хэшей: в Postgres одним агрегирующим запросом, в SQLite потоком.
+    Сначала таблица делится на 16 диапазонов по первой цифре id, затем
+    каждый несовпавший диапазон - ещё на 16 по следующей цифре, пока в нём
+    не останется не больше leaf_size строк. Только такие диапазоны
+    сверяются построчно по (id, хэш).
+
+    id в SQLite должны храниться в нижнем регистре, как их пишет uuid.
+    """
+
+    def __init__(self, sqlite_conn: sqlite3.Connection, pg_conn: _connection, leaf_size: int = 1000,
+                 schema: str = 'content'):
+        self.loader = SQLiteLoader(sqlite_conn, uuid_as_text=True, log_batches=False)
+        self.loader.set_batch_size(10_000)
+        self.cursor = pg_conn.cursor(row_factory=tuple_row)
+        self.leaf_size = leaf_size
+        self.schema = schema
+
+    def check_all(self, tables: Iterable[str] = TABLES) -> List[TableDiff]:
+        diffs = [self.check_table(table_name) for table_name in tables]
+        for diff in diffs:
+            if diff.consistent:
+                logger.info(f"Таблица {diff.table_name} совпадает ({diff.queries} запросов к Postgres)")
+            else:
+                logger.error(f"Таблица {diff.table_name} отличается: нет в Postgres - {len(diff.missing)}, "
+                             f"лишних - {len(diff.extra)}, изменённых - {len(diff.changed)}")
+        return diffs
+
+    def check_table(self, table_name: str) -> TableDiff:
+        """Сверка таблицы с точностью до id отличающихся строк"""
+        diff = TableDiff(table_name)
+        prefixes = ['']
+        while prefixes:
+            depth = len(prefixes[0]) + 1
+            sqlite_sums = self._sqlite_checksums(table_name, prefixes, depth)
+            pg_sums = self._pg_checksums(table_name, prefixes, depth, diff)
+            narrow, leaves = [], []
+            for bucket in sorted(sqlite_sums.keys() | pg_sums.keys()):
+                sqlite_sum, pg_sum = sqlite_sums.get(bucket, (0, 0)), pg_sums.get(bucket, (0, 0))
+                if sqlite_sum == pg_sum:
+                    continue
+                if max(sqlite_sum[0], pg_sum[0]) <= self.leaf_size or depth == MAX_PREFIX:
+                    leaves.append(bucket)
+                else:
+                    narrow.append(bucket)
+            if leaves:
+                self._compare_rows(table_name, leaves, diff)
+            prefixes = narrow
+        return diff
+
+    def _sqlite_rows(self, table_name: str, prefixes: List[str]) -> Iterable[Tuple[str, int]]:
+        """(id, хэш) строк SQLite с id в диапазонах prefixes"""
+        normalizers = [PYTHON_NORMALIZERS.get(_field_type(f.type), str)
+                       for f in fields(self.loader.table_class_map[table_name])]
+        id_index = self.loader.get_columns(table_name).index('id')
+        for prefix in prefixes:
+            id_range = prefix_bounds(prefix) if prefix else None
+            for batch in self.loader.load_rows(table_name, id_range=id_range):
+                for row in batch:
+                    values = [NULL_TEXT if value is None else normalize(value)
+                              for normalize, value in zip(normalizers, row)]
+                    yield values[id_index], row_hash(SEPARATOR.join(values))
+
+    def _sqlite_checksums(self, table_name: str, prefixes: List[str], depth: int) -> Dict[str, Tuple[int, int]]:
+        sums = {}
+        for row_id, hash_value in self._sqlite_rows(table_name, prefixes):
+            bucket = row_id[:depth]
+            count, total = sums.get(bucket, (0, 0))
+            sums[bucket] = (count + 1, total + hash_value)
+        return sums
+
+    def _pg_checksums(self, table_name: str, prefixes: List[str], depth: int,
+                      diff: TableDiff) -> Dict[str, Tuple[int, int]]:
+        where, params = self._pg_ranges(prefixes)
+        self.cursor.execute(f"""SELECT left(id::text, %s), count(*), sum({self._pg_row_hash(table_name)})
+                FROM {self.schema}.{table_name} {where}
+                GROUP BY 1""", (depth, *params))
+        diff.queries += 1
+        return {bucket: (count, int(total)) for bucket, count, total in self.cursor.fetchall()}
+
+    def _compare_rows(self, table_name: str, prefixes: List[str], diff: TableDiff):
+        """Построчная сверка небольших диапазонов"""
+        sqlite_rows = dict(self._sqlite_rows(table_name, prefixes))
+        where, params = self._pg_ranges(prefixes)
+        self.cursor.execute(f"""SELECT id::text, {self._pg_row_hash(table_name)}
+                FROM {self.schema}.{table_name} {where}""", params)
+        diff.queries += 1
+        pg_rows = dict(self.cursor.fetchall())
+        diff.rows_compared += len(sqlite_rows) + len(pg_rows)
+        diff.missing.extend(sorted(sqlite_rows.keys() - pg_rows.keys()))
+        diff.extra.extend(sorted(pg_rows.keys() - sqlite_rows.keys()))
+        diff.changed.extend(sorted(row_id for row_id in sqlite_rows.keys() & pg_rows.keys()
+                                   if sqlite_rows[row_id] != pg_rows[row_id]))
+
+    @staticmethod
+    def _pg_ranges(prefixes: List[str]) -> Tuple[str, list]:
+        """Условие WHERE на диапазоны id по индексу первичного ключа"""
+        if prefixes == ['']:
+            return '', []
+        params = [bound for prefix in prefixes for bound in prefix_bounds(prefix)]
+        return 'WHERE ' + ' OR '.join(['id BETWEEN %s::uuid AND %s::uuid'] * len(prefixes)), params
+
+    def _pg_row_hash(self, table_name: str) -> str:
+        """SQL-выражение, дающее тот же хэш строки, что row_hash на стороне SQLite"""
+        items = []
+        for f in fields(self.loader.table_class_map[table_name]):
+            expression = SQL_NORMALIZERS.get(_field_type(f.type), '{col}::text').format(col=f.name)
+            items.append(f"coalesce({expression}, '{NULL_TEXT}')")
+        row_text = f"concat_ws(chr({ord(SEPARATOR)}), {', '.join(items)})"
+        return f"('x' || left(md5({row_text}), {HASH_DIGITS}))::bit({HASH_DIGITS * 4})::bigint"